@@ -1,3 +1,4 @@
+from sqlalchemy import inspect, text
 from sqlmodel import SQLModel, create_engine, Session
 import os
 
@@ -7,8 +8,29 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 # engine = create_engine(DATABASE_URL, echo=False)
 engine = create_engine(DATABASE_URL, echo=False, connect_args={})
 
+# Columns added to tables that already exist in deployed databases. create_all only creates
+# missing tables, so each of these is added at startup when absent: (table, column, SQL type)
+ADDED_COLUMNS = [
+    ("listing", "ebay_category_id", "VARCHAR"),
+    ("publishjob", "offer_id", "VARCHAR"),
+]
+
+def migrate_added_columns():
+    """Add any ADDED_COLUMNS missing from existing tables; safe to run on every startup."""
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    with engine.begin() as connection:
+        for table, column, sql_type in ADDED_COLUMNS:
+            if table not in existing_tables:
+                continue
+            if column in {c["name"] for c in inspector.get_columns(table)}:
+                continue
+            print(f"[DEBUG] Adding column {table}.{column}")
+            connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {sql_type}"))
+
 def create_db_and_tables():
     SQLModel.metadata.create_all(engine)
+    migrate_added_columns()
 
 def get_session():
     return Session(engine)
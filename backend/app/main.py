@@ -1,7 +1,17 @@
+import asyncio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.routers import listing, ebay_oauth, image_upload, listing_ai, pricing, auth_router, admin
 from app.db import create_db_and_tables
+from app.utils.ebay_client import ebay_client
+from app.services.publish_queue import publish_queue
+from app.services.ebay_token_refresher import token_refresher
+from app.utils.category_classifier import category_classifier
+from app.services.ai import ai_client
+from app.utils.ai_cache import ai_result_cache
+from app.utils.listing_index import listing_index
+from app.utils.ebay_taxonomy import taxonomy
+from app.utils.s3 import shutdown_s3_pool
 
 app = FastAPI()
 
@@ -27,6 +37,25 @@ app.include_router(admin.router)
 @app.on_event("startup")
 async def on_startup():
     create_db_and_tables()
+    category_classifier.load()
+    # Loaded off the event loop; category lookups fall back to rules until it's ready
+    taxonomy_load = asyncio.create_task(taxonomy.preload())
+    taxonomy_load.add_done_callback(lambda t: t.cancelled() or t.exception())
+    ai_result_cache.purge_expired()
+    if not listing_index.load():
+        # Similar-listing search and duplicate checks come back once the rebuild finishes
+        task = asyncio.create_task(asyncio.to_thread(listing_index.rebuild))
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    publish_queue.start(listing.process_publish_job, listing.mark_publish_job_failed)
+    token_refresher.start()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await publish_queue.stop()
+    await token_refresher.stop()
+    await ebay_client.close()
+    await ai_client.close()
+    shutdown_s3_pool()
 
 @app.get("/")
 def root():
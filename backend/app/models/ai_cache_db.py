@@ -0,0 +1,16 @@
+from sqlmodel import SQLModel, Field
+from typing import Optional
+from datetime import datetime
+
+class ImageDigest(SQLModel, table=True):
+    filename: str = Field(primary_key=True)  # S3 key of the uploaded image
+    sha256: str = Field(index=True)
+    phash: Optional[str] = Field(default=None, index=True)  # 64-bit difference hash, hex
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class AIResultCacheEntry(SQLModel, table=True):
+    content_hash: str = Field(primary_key=True)  # SHA-256 of the inputs sent to the model
+    prompt_version: str = Field(primary_key=True)
+    phash: Optional[str] = Field(default=None, index=True)
+    result: str  # JSON-encoded model output
+    created_at: datetime = Field(default_factory=datetime.utcnow)
@@ -0,0 +1,16 @@
+from sqlmodel import SQLModel, Field
+from datetime import datetime
+
+class CategoryCacheEntry(SQLModel, table=True):
+    normalized_title: str = Field(primary_key=True)
+    category_id: str
+    source: str  # How the category was resolved, e.g. "classifier", "taxonomy", "browse" or "keyword"
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+class CategoryValidity(SQLModel, table=True):
+    category_id: str = Field(primary_key=True)
+    taxonomy_version: str = Field(primary_key=True)  # Category tree version the check was made against
+    valid: bool  # True when the category is a leaf that offers can be listed in
+    source: str  # How validity was established, e.g. "probe" or "offer"
+    checked_at: datetime = Field(default_factory=datetime.utcnow)
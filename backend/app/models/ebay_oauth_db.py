@@ -12,4 +12,14 @@ class EbayOAuth(SQLModel, table=True):
     updated_at: datetime = Field(default_factory=datetime.utcnow)
     fulfillment_policy_id: Optional[str] = None
     payment_policy_id: Optional[str] = None
-    return_policy_id: Optional[str] = None 
\ No newline at end of file
+    return_policy_id: Optional[str] = None
+
+
+class EbayMerchantLocation(SQLModel, table=True):
+    id: str = Field(default=None, primary_key=True)
+    user_id: str = Field(index=True)
+    city: str = Field(default="")  # Empty city/postal/state means the user's default location
+    postal_code: str = Field(default="")
+    state: str = Field(default="")
+    merchant_location_key: str
+    created_at: datetime = Field(default_factory=datetime.utcnow)
@@ -16,3 +16,4 @@ class Listing(SQLModel, table=True):
     price: float
     created_at: datetime = Field(default_factory=datetime.utcnow)
     ebay_item_id: Optional[str] = Field(default=None, index=True)
+    ebay_category_id: Optional[str] = None  # Category the listing was published under on eBay
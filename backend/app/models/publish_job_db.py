@@ -0,0 +1,18 @@
+from sqlmodel import SQLModel, Field
+from typing import Optional
+from datetime import datetime
+
+class PublishJob(SQLModel, table=True):
+    id: str = Field(default=None, primary_key=True)
+    listing_id: str = Field(index=True)
+    owner: str = Field(index=True)
+    marketplace: str = Field(default="eBay")
+    payload: str  # JSON-encoded Listing request
+    status: str = Field(default="queued", index=True)  # queued, running, done, failed
+    attempts: int = Field(default=0)
+    last_error: Optional[str] = None
+    # eBay offer created by an earlier attempt; retries publish it instead of creating another
+    offer_id: Optional[str] = None
+    available_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
@@ -1,9 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
 from app.auth.auth_handler import decode_token
 from fastapi.security import OAuth2PasswordBearer
 from app.db import get_session
 from app.models.user_db import User as DBUser
 from app.models.listing_db import Listing as DBListing
+from app.services.publish_queue import publish_queue
+from app.services.ebay_token_refresher import token_refresher
+from app.services.ai import ai_client
+from app.services.model_router import model_router
+from app.utils.ai_cache import ai_result_cache
+from app.utils.image_preprocess import image_preprocessor
+from app.utils.pricing import price_engine
+from app.routers.pricing import price_cache
+from app.utils.ebay_client import ebay_client
+from app.utils.ebay_rate_limiter import rate_limiter
+from app.utils.category_cache import category_cache
+from app.utils.ebay_taxonomy import taxonomy
+from app.utils.category_validity import category_validity
+from app.utils.category_classifier import category_classifier
+from app.utils.listing_index import listing_index
 from sqlmodel import select
 from collections import Counter
 
@@ -43,3 +58,89 @@ def get_stats(admin=Depends(get_admin_user)):
             "listing_count": len(total_listings),
             "top_categories": category_count.most_common(5)
         }
+
+@router.get("/publish-queue")
+def get_publish_queue_metrics(admin=Depends(get_admin_user)):
+    return publish_queue.metrics()
+
+@router.get("/ai")
+def get_ai_client_metrics(admin=Depends(get_admin_user)):
+    return ai_client.metrics()
+
+@router.get("/ai/queue")
+def get_ai_queue_metrics(admin=Depends(get_admin_user)):
+    return ai_client.scheduler.metrics()
+
+@router.get("/ai/models")
+def get_model_router_metrics(admin=Depends(get_admin_user)):
+    return model_router.metrics()
+
+@router.get("/ai/cache")
+def get_ai_cache_stats(admin=Depends(get_admin_user)):
+    return ai_result_cache.stats()
+
+@router.get("/pricing")
+def get_pricing_stats(admin=Depends(get_admin_user)):
+    return {**price_engine.stats(), "cache": price_cache.stats()}
+
+@router.get("/ai/images")
+def get_image_preprocessing_metrics(admin=Depends(get_admin_user)):
+    return image_preprocessor.metrics()
+
+@router.get("/ebay/token-refresher")
+def get_token_refresher_metrics(admin=Depends(get_admin_user)):
+    return token_refresher.metrics()
+
+@router.get("/ebay/circuits")
+def get_ebay_circuit_states(admin=Depends(get_admin_user)):
+    return ebay_client.circuit_states()
+
+@router.get("/ebay/rate-limits")
+def get_ebay_rate_limits(admin=Depends(get_admin_user)):
+    return rate_limiter.snapshot()
+
+@router.get("/ebay/category-cache")
+def get_category_cache_stats(admin=Depends(get_admin_user)):
+    return category_cache.stats()
+
+@router.get("/ebay/taxonomy")
+def get_ebay_taxonomy_stats(admin=Depends(get_admin_user)):
+    return taxonomy.stats()
+
+@router.get("/ebay/category-classifier")
+def get_category_classifier_stats(admin=Depends(get_admin_user)):
+    return category_classifier.stats()
+
+@router.get("/ebay/category-validity")
+def get_category_validity_stats(admin=Depends(get_admin_user)):
+    return category_validity.stats()
+
+@router.get("/listing-index")
+def get_listing_index_stats(admin=Depends(get_admin_user)):
+    return listing_index.stats()
+
+def _rebuild_listing_index():
+    try:
+        listing_index.rebuild()
+    except Exception:
+        pass  # Recorded in listing_index.stats()["last_error"]
+
+@router.post("/listing-index/rebuild", status_code=202)
+def rebuild_listing_index(background_tasks: BackgroundTasks, admin=Depends(get_admin_user)):
+    if listing_index.rebuilding:
+        return {"status": "already_running"}
+    background_tasks.add_task(_rebuild_listing_index)
+    return {"status": "started"}
+
+async def _ingest_ebay_taxonomy():
+    try:
+        await taxonomy.ingest_from_ebay()
+    except Exception:
+        pass  # Recorded in taxonomy.stats()["last_error"]
+
+@router.post("/ebay/taxonomy/refresh", status_code=202)
+def refresh_ebay_taxonomy(background_tasks: BackgroundTasks, admin=Depends(get_admin_user)):
+    if taxonomy.ingesting():
+        return {"status": "already_running"}
+    background_tasks.add_task(_ingest_ebay_taxonomy)
+    return {"status": "started"}
@@ -3,11 +3,17 @@ from fastapi.responses import RedirectResponse
 from app.auth.auth_handler import decode_token
 from fastapi.security import OAuth2PasswordBearer
 from app.db import get_session
-from app.models.ebay_oauth_db import EbayOAuth
+from app.models.ebay_oauth_db import EbayOAuth, EbayMerchantLocation
 from sqlmodel import Session, select
 import os
 from dotenv import load_dotenv
-import requests
+from app.utils.ebay_client import ebay_client, EBAY_API_BASE_URL
+from app.utils.ebay_retry import NO_RETRY
+from app.utils.merchant_locations import merchant_location_cache
+from app.utils.ebay_seller_context import EbaySellerContext, seller_context_cache
+from app.utils.single_flight import SingleFlight
+from typing import Any, Dict, Optional
+import asyncio
 from datetime import datetime, timedelta
 import uuid
 import base64
@@ -22,11 +28,18 @@ EBAY_CLIENT_ID = os.getenv("EBAY_CLIENT_ID")
 EBAY_CLIENT_SECRET = os.getenv("EBAY_CLIENT_SECRET")
 EBAY_REDIRECT_URI = os.getenv("EBAY_REDIRECT_URI")
 EBAY_AUTH_URL = "https://auth.ebay.com/oauth2/authorize"
-EBAY_TOKEN_URL = "https://api.ebay.com/identity/v1/oauth2/token"
+EBAY_TOKEN_URL = f"{EBAY_API_BASE_URL}/identity/v1/oauth2/token"
 EBAY_SCOPE = "https://api.ebay.com/oauth/api_scope/sell.inventory https://api.ebay.com/oauth/api_scope/sell.account"
+EBAY_APPLICATION_SCOPE = "https://api.ebay.com/oauth/api_scope"
+EBAY_POLICY_FETCH_TIMEOUT = float(os.getenv("EBAY_POLICY_FETCH_TIMEOUT", "10"))
+EBAY_POLICY_MAX_PAGES = int(os.getenv("EBAY_POLICY_MAX_PAGES", "5"))
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
+_token_refresh_flight = SingleFlight()
+# Client-credentials token shared by calls that don't act for a seller (e.g. Taxonomy API)
+_application_token: Dict[str, Any] = {}
+
 def get_current_user(token: str = Depends(oauth2_scheme)):
     try:
         payload = decode_token(token)
@@ -72,92 +85,65 @@ async def start_oauth(token: str = Query(None)):
     print(f"[DEBUG] Redirecting to eBay OAuth URL: {auth_url}")
     return RedirectResponse(url=auth_url)
 
-async def fetch_and_store_ebay_policy_ids(user: str, token: str):
+async def fetch_ebay_policy_id(user: str, token: str, policy_type: str) -> Optional[str]:
     """
-    Fetch the user's first fulfillment, payment, and return policy IDs from eBay and store them in the EbayOAuth record.
-    If no policies exist, store None values.
+    Walk every page of the user's `policy_type` (fulfillment, payment or return) policies
+    and return the ID of the default policy, or of the first policy if none is marked default.
     """
     headers = {
         "Authorization": f"Bearer {token}",
         "Content-Type": "application/json"
     }
-    # Fulfillment (shipping) policy
-    fulfillment_url = "https://api.ebay.com/sell/account/v1/fulfillment_policy?marketplace_id=EBAY_US"
-    payment_url = "https://api.ebay.com/sell/account/v1/payment_policy?marketplace_id=EBAY_US"
-    return_url = "https://api.ebay.com/sell/account/v1/return_policy?marketplace_id=EBAY_US"
-    fulfillment_policy_id = payment_policy_id = return_policy_id = None
-    
-    try:
-        # Fetch fulfillment policy
-        print("[DEBUG] Fetching fulfillment policies...")
-        r = requests.get(fulfillment_url, headers=headers)
-        print(f"[DEBUG] Fulfillment policy response status: {r.status_code}")
-        print(f"[DEBUG] Fulfillment policy response: {r.text}")
-        if r.status_code == 200:
-            policies = r.json().get("fulfillmentPolicies", [])
-            print(f"[DEBUG] Found {len(policies)} fulfillment policies")
-            if policies:
-                fulfillment_policy_id = policies[0]["fulfillmentPolicyId"]
-                print(f"[DEBUG] Using fulfillment policy ID: {fulfillment_policy_id}")
-            else:
-                print("[DEBUG] No fulfillment policies found for user")
-        
-        # Fetch payment policy
-        print("[DEBUG] Fetching payment policies...")
-        r = requests.get(payment_url, headers=headers)
-        print(f"[DEBUG] Payment policy response status: {r.status_code}")
-        print(f"[DEBUG] Payment policy response: {r.text}")
-        if r.status_code == 200:
-            policies = r.json().get("paymentPolicies", [])
-            print(f"[DEBUG] Found {len(policies)} payment policies")
-            if policies:
-                payment_policy_id = policies[0]["paymentPolicyId"]
-                print(f"[DEBUG] Using payment policy ID: {payment_policy_id}")
-            else:
-                print("[DEBUG] No payment policies found for user")
-        
-        # Fetch return policy
-        print("[DEBUG] Fetching return policies...")
-        r = requests.get(return_url, headers=headers)
-        print(f"[DEBUG] Return policy response status: {r.status_code}")
-        print(f"[DEBUG] Return policy response: {r.text}")
-        if r.status_code == 200:
-            policies = r.json().get("returnPolicies", [])
-            print(f"[DEBUG] Found {len(policies)} return policies")
-            if policies:
-                return_policy_id = policies[0]["returnPolicyId"]
-                print(f"[DEBUG] Using return policy ID: {return_policy_id}")
-            else:
-                print("[DEBUG] No return policies found for user")
-                
-    except Exception as e:
-        print(f"[DEBUG] Exception fetching eBay policies: {e}")
-    
-    # Store the results (even if None)
-    with get_session() as session:
-        token_record = session.query(EbayOAuth).filter(EbayOAuth.user_id == user).first()
-        if token_record:
-            token_record.fulfillment_policy_id = fulfillment_policy_id
-            token_record.payment_policy_id = payment_policy_id
-            token_record.return_policy_id = return_policy_id
-            session.add(token_record)
-            session.commit()
-    
-    print(f"[DEBUG] Stored eBay policy IDs: {fulfillment_policy_id}, {payment_policy_id}, {return_policy_id}")
-    
-    # If any policy is missing, raise an exception
-    if not all([fulfillment_policy_id, payment_policy_id, return_policy_id]):
-        missing_policies = []
-        if not fulfillment_policy_id:
-            missing_policies.append("fulfillment")
-        if not payment_policy_id:
-            missing_policies.append("payment")
-        if not return_policy_id:
-            missing_policies.append("return")
-        raise HTTPException(
-            status_code=400,
-            detail=f"Missing required eBay business policies: {', '.join(missing_policies)}. Please create these policies in your eBay Seller Hub first. Make sure they are active and set for the US marketplace."
-        )
+    list_key = f"{policy_type}Policies"
+    id_key = f"{policy_type}PolicyId"
+    url = f"{EBAY_API_BASE_URL}/sell/account/v1/{policy_type}_policy"
+    params = {"marketplace_id": "EBAY_US"}
+    first_policy_id = None
+
+    for page in range(EBAY_POLICY_MAX_PAGES):
+        r = await ebay_client.get(url, headers=headers, params=params, timeout=EBAY_POLICY_FETCH_TIMEOUT, user=user)
+        print(f"[DEBUG] {policy_type.capitalize()} policy page {page + 1} response status: {r.status_code}")
+        if r.status_code != 200:
+            print(f"[DEBUG] {policy_type.capitalize()} policy response: {r.text}")
+            break
+        data = r.json()
+        policies = data.get(list_key, [])
+        print(f"[DEBUG] Found {len(policies)} {policy_type} policies on page {page + 1}")
+        for policy in policies:
+            if first_policy_id is None:
+                first_policy_id = policy[id_key]
+            if any(category_type.get("default") for category_type in policy.get("categoryTypes", [])):
+                print(f"[DEBUG] Using default {policy_type} policy ID: {policy[id_key]}")
+                return policy[id_key]
+        # `next` is an absolute URL that already carries the query string
+        url, params = data.get("next"), None
+        if not url:
+            break
+
+    if first_policy_id:
+        print(f"[DEBUG] Using {policy_type} policy ID: {first_policy_id}")
+    else:
+        print(f"[DEBUG] No {policy_type} policies found for user")
+    return first_policy_id
+
+async def fetch_ebay_policy_ids(user: str, token: str) -> Dict[str, Optional[str]]:
+    """
+    Fetch the user's fulfillment, payment, and return policy IDs from eBay concurrently.
+    Policies that cannot be fetched in time come back as None.
+    """
+    policy_types = ["fulfillment", "payment", "return"]
+    results = await asyncio.gather(
+        *[asyncio.wait_for(fetch_ebay_policy_id(user, token, policy_type), EBAY_POLICY_FETCH_TIMEOUT * EBAY_POLICY_MAX_PAGES)
+          for policy_type in policy_types],
+        return_exceptions=True
+    )
+    policy_ids = {}
+    for policy_type, result in zip(policy_types, results):
+        if isinstance(result, BaseException):
+            print(f"[DEBUG] Exception fetching eBay {policy_type} policies: {result!r}")
+            result = None
+        policy_ids[policy_type] = result
+    return policy_ids
 
 @router.get("/callback")
 async def oauth_callback(
@@ -190,11 +176,14 @@ async def oauth_callback(
         "redirect_uri": EBAY_REDIRECT_URI
     }
 
-    response = requests.post(
+    response = await ebay_client.post(
         EBAY_TOKEN_URL,
         data=token_data,
         auth=(EBAY_CLIENT_ID, EBAY_CLIENT_SECRET),
-        headers={"Content-Type": "application/x-www-form-urlencoded"}
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+        # Authorization codes are single use; a replay would only fail with invalid_grant
+        retry_policy=NO_RETRY,
+        user=user
     )
 
     print(f"[DEBUG] Token exchange response status: {response.status_code}")
@@ -211,6 +200,10 @@ async def oauth_callback(
     print(f"[DEBUG] token_response: {token_response}")
     expires_at = datetime.utcnow() + timedelta(seconds=token_response["expires_in"])
 
+    # Fetch business policy IDs with the new token before touching the database,
+    # so tokens and policies are written together
+    policy_ids = await fetch_ebay_policy_ids(user, token_response["access_token"])
+
     with get_session() as session:
         existing_token = session.query(EbayOAuth).filter(EbayOAuth.user_id == user).first()
         if existing_token:
@@ -219,64 +212,100 @@ async def oauth_callback(
             existing_token.refresh_token = token_response["refresh_token"]
             existing_token.expires_at = expires_at
             existing_token.updated_at = datetime.utcnow()
-            session.add(existing_token)
+            token_record = existing_token
         else:
             print("[DEBUG] Creating new eBay token record")
-            new_token = EbayOAuth(
+            token_record = EbayOAuth(
                 id=str(uuid.uuid4()),
                 user_id=user,
                 access_token=token_response["access_token"],
                 refresh_token=token_response["refresh_token"],
                 expires_at=expires_at
             )
-            session.add(new_token)
+        # Store the policy results (even if None)
+        token_record.fulfillment_policy_id = policy_ids["fulfillment"]
+        token_record.payment_policy_id = policy_ids["payment"]
+        token_record.return_policy_id = policy_ids["return"]
+        session.add(token_record)
         session.commit()
         print("[DEBUG] eBay token record saved to database")
 
-    # Fetch and store business policy IDs for this user
-    await fetch_and_store_ebay_policy_ids(user, token_response["access_token"])
+    print(f"[DEBUG] Stored eBay policy IDs: {policy_ids}")
+
+    # The connected eBay account may have changed; drop cached state for the old one
+    merchant_location_cache.invalidate_user(user)
+    seller_context_cache.invalidate(user)
+
+    # If any policy is missing, raise an exception
+    missing_policies = [policy_type for policy_type, policy_id in policy_ids.items() if not policy_id]
+    if missing_policies:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Missing required eBay business policies: {', '.join(missing_policies)}. Please create these policies in your eBay Seller Hub first. Make sure they are active and set for the US marketplace."
+        )
 
     return {"message": "Successfully connected to eBay"}
 
-@router.post("/refresh")
-async def refresh_token(user: str = Depends(get_current_user)):
+async def _refresh_ebay_token(user: str):
     """
-    Refresh the eBay access token using the refresh token.
+    Exchange the user's refresh token for a new access token and store it.
+    Raises HTTPException if there is no token record or eBay rejects the refresh.
     """
     with get_session() as session:
         token_record = session.query(EbayOAuth).filter(EbayOAuth.user_id == user).first()
-        
         if not token_record:
             raise HTTPException(status_code=404, detail="No eBay tokens found for user")
+        refresh_token = token_record.refresh_token
 
-        token_data = {
-            "grant_type": "refresh_token",
-            "refresh_token": token_record.refresh_token
-        }
+    token_data = {
+        "grant_type": "refresh_token",
+        "refresh_token": refresh_token
+    }
+
+    response = await ebay_client.post(
+        EBAY_TOKEN_URL,
+        data=token_data,
+        auth=(EBAY_CLIENT_ID, EBAY_CLIENT_SECRET),
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+        user=user
+    )
+    print(f"[DEBUG] Refresh response status for user {user}: {response.status_code}")
 
-        response = requests.post(
-            EBAY_TOKEN_URL,
-            data=token_data,
-            auth=(EBAY_CLIENT_ID, EBAY_CLIENT_SECRET),
-            headers={"Content-Type": "application/x-www-form-urlencoded"}
+    if response.status_code != 200:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Failed to refresh token: {response.text}"
         )
 
-        if response.status_code != 200:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Failed to refresh token: {response.text}"
-            )
+    token_response = response.json()
 
-        token_response = response.json()
-        
+    with get_session() as session:
+        token_record = session.query(EbayOAuth).filter(EbayOAuth.user_id == user).first()
+        if not token_record:
+            raise HTTPException(status_code=404, detail="No eBay tokens found for user")
         token_record.access_token = token_response["access_token"]
         token_record.expires_at = datetime.utcnow() + timedelta(seconds=token_response["expires_in"])
         token_record.updated_at = datetime.utcnow()
-        
         session.add(token_record)
         session.commit()
 
-        return {"message": "Token refreshed successfully"}
+    seller_context_cache.invalidate(user)
+    print(f"[DEBUG] eBay token refreshed successfully for user {user}")
+
+async def refresh_ebay_token(user: str):
+    """
+    Refresh the user's eBay access token. Concurrent refreshes for the same user
+    (request path, background refresher, /refresh) share a single call to eBay.
+    """
+    await _token_refresh_flight.do(user, lambda: _refresh_ebay_token(user))
+
+@router.post("/refresh")
+async def refresh_token(user: str = Depends(get_current_user)):
+    """
+    Refresh the eBay access token using the refresh token.
+    """
+    await refresh_ebay_token(user)
+    return {"message": "Token refreshed successfully"}
 
 @router.get("/status")
 async def check_ebay_auth(user: str = Depends(get_current_user)):
@@ -285,45 +314,73 @@ async def check_ebay_auth(user: str = Depends(get_current_user)):
     """
     print("[DEBUG] /ebay/oauth/status called")
     print(f"[DEBUG] Authenticated user: {user}")
-    with get_session() as session:
-        token_record = session.query(EbayOAuth).filter(EbayOAuth.user_id == user).first()
-        print(f"[DEBUG] eBay token record for user {user}: {token_record}")
+    context = await get_ebay_seller_context(user)
+    if not context:
+        with get_session() as session:
+            token_record = session.query(EbayOAuth).filter(EbayOAuth.user_id == user).first()
         if not token_record:
             print("[DEBUG] No eBay tokens found for user")
             raise HTTPException(status_code=404, detail="No eBay tokens found for user")
-        print(f"[DEBUG] Token expires at: {token_record.expires_at}, now: {datetime.utcnow()}")
-        # Check if token is expired
-        if token_record.expires_at < datetime.utcnow():
-            print("[DEBUG] eBay token expired, attempting refresh...")
-            # Try to refresh the token
-            try:
-                token_data = {
-                    "grant_type": "refresh_token",
-                    "refresh_token": token_record.refresh_token
-                }
-                response = requests.post(
-                    EBAY_TOKEN_URL,
-                    data=token_data,
-                    auth=(EBAY_CLIENT_ID, EBAY_CLIENT_SECRET),
-                    headers={"Content-Type": "application/x-www-form-urlencoded"}
-                )
-                print(f"[DEBUG] Refresh response status: {response.status_code}, body: {response.text}")
-                if response.status_code != 200:
-                    print("[DEBUG] eBay token expired and refresh failed")
-                    raise HTTPException(status_code=401, detail="eBay token expired and refresh failed")
-                token_response = response.json()
-                # Update tokens in database
-                token_record.access_token = token_response["access_token"]
-                token_record.expires_at = datetime.utcnow() + timedelta(seconds=token_response["expires_in"])
-                token_record.updated_at = datetime.utcnow()
-                session.add(token_record)
-                session.commit()
-                print("[DEBUG] eBay token refreshed successfully")
-            except Exception as e:
-                print(f"[DEBUG] Exception during token refresh: {e}")
-                raise HTTPException(status_code=401, detail="eBay token expired and refresh failed")
-        print("[DEBUG] eBay authentication status: authenticated")
-        return {"status": "authenticated"}
+        print("[DEBUG] eBay token expired and refresh failed")
+        raise HTTPException(status_code=401, detail="eBay token expired and refresh failed")
+    print("[DEBUG] eBay authentication status: authenticated")
+    return {"status": "authenticated"}
+
+def _load_seller_context(user: str) -> Optional[EbaySellerContext]:
+    with get_session() as session:
+        token_record = session.query(EbayOAuth).filter(EbayOAuth.user_id == user).first()
+        if not token_record:
+            return None
+
+        default_location = session.exec(
+            select(EbayMerchantLocation).where(
+                EbayMerchantLocation.user_id == user,
+                EbayMerchantLocation.city == "",
+                EbayMerchantLocation.postal_code == "",
+                EbayMerchantLocation.state == ""
+            )
+        ).first()
+
+        return EbaySellerContext(
+            user_id=user,
+            access_token=token_record.access_token,
+            expires_at=token_record.expires_at,
+            fulfillment_policy_id=token_record.fulfillment_policy_id,
+            payment_policy_id=token_record.payment_policy_id,
+            return_policy_id=token_record.return_policy_id,
+            default_merchant_location=default_location.merchant_location_key if default_location else None
+        )
+
+async def get_ebay_seller_context(user: str) -> Optional[EbaySellerContext]:
+    """
+    Get the user's eBay seller context: a valid access token, business policy IDs
+    and default merchant location. Served from memory when cached; otherwise loaded
+    from the database in a single session. Tokens are normally renewed ahead of
+    expiry by the background refresher; an expired token is refreshed here only as
+    a fallback. Returns None if no valid token exists.
+    """
+    context = seller_context_cache.get(user)
+    if context:
+        return context
+
+    context = _load_seller_context(user)
+    if not context:
+        print(f"[DEBUG] No eBay token found for user {user}")
+        return None
+
+    if not context.token_valid():
+        print("[DEBUG] eBay token expired, attempting refresh...")
+        try:
+            await refresh_ebay_token(user)
+        except Exception as e:
+            print(f"[DEBUG] Exception during token refresh: {e}")
+            return None
+        context = _load_seller_context(user)
+        if not context:
+            return None
+
+    seller_context_cache.put(context)
+    return context
 
 async def get_ebay_token(user: str) -> str:
     """
@@ -331,44 +388,35 @@ async def get_ebay_token(user: str) -> str:
     If the token is expired, it will be refreshed.
     Returns the access token or None if no valid token exists.
     """
-    with get_session() as session:
-        token_record = session.query(EbayOAuth).filter(EbayOAuth.user_id == user).first()
-        
-        if not token_record:
-            print(f"[DEBUG] No eBay token found for user {user}")
-            return None
+    context = await get_ebay_seller_context(user)
+    return context.access_token if context else None
 
-        # Check if token is expired
-        if token_record.expires_at < datetime.utcnow():
-            print("[DEBUG] eBay token expired, attempting refresh...")
-            try:
-                token_data = {
-                    "grant_type": "refresh_token",
-                    "refresh_token": token_record.refresh_token
-                }
-                response = requests.post(
-                    EBAY_TOKEN_URL,
-                    data=token_data,
-                    auth=(EBAY_CLIENT_ID, EBAY_CLIENT_SECRET),
-                    headers={"Content-Type": "application/x-www-form-urlencoded"}
-                )
-                
-                if response.status_code != 200:
-                    print(f"[DEBUG] Token refresh failed: {response.text}")
-                    return None
-                    
-                token_response = response.json()
-                token_record.access_token = token_response["access_token"]
-                token_record.expires_at = datetime.utcnow() + timedelta(seconds=token_response["expires_in"])
-                token_record.updated_at = datetime.utcnow()
-                session.add(token_record)
-                session.commit()
-                print("[DEBUG] eBay token refreshed successfully")
-            except Exception as e:
-                print(f"[DEBUG] Exception during token refresh: {e}")
-                return None
-
-        return token_record.access_token 
+async def _fetch_ebay_application_token() -> str:
+    response = await ebay_client.post(
+        EBAY_TOKEN_URL,
+        data={"grant_type": "client_credentials", "scope": EBAY_APPLICATION_SCOPE},
+        auth=(EBAY_CLIENT_ID, EBAY_CLIENT_SECRET),
+        headers={"Content-Type": "application/x-www-form-urlencoded"}
+    )
+    if response.status_code != 200:
+        raise HTTPException(
+            status_code=502,
+            detail=f"Failed to get eBay application token: {response.text}"
+        )
+    token_response = response.json()
+    _application_token["access_token"] = token_response["access_token"]
+    _application_token["expires_at"] = datetime.utcnow() + timedelta(seconds=token_response["expires_in"])
+    return token_response["access_token"]
+
+async def get_ebay_application_token() -> str:
+    """
+    Get an eBay application (client credentials) access token, for public APIs
+    such as Taxonomy that are not called on behalf of a seller.
+    """
+    expires_at = _application_token.get("expires_at")
+    if expires_at and (expires_at - datetime.utcnow()).total_seconds() > 300:
+        return _application_token["access_token"]
+    return await _token_refresh_flight.do("__application__", _fetch_ebay_application_token)
 
 @router.post("/disconnect")
 async def disconnect_ebay(user: str = Depends(get_current_user)):
@@ -380,6 +428,8 @@ async def disconnect_ebay(user: str = Depends(get_current_user)):
         if token_record:
             session.delete(token_record)
             session.commit()
+            merchant_location_cache.invalidate_user(user)
+            seller_context_cache.invalidate(user)
             print(f"[DEBUG] Disconnected eBay for user {user}")
             return {"message": "Disconnected from eBay"}
         else:
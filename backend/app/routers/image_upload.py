@@ -1,12 +1,19 @@
-from fastapi import APIRouter, UploadFile, File
+from fastapi import APIRouter, HTTPException, UploadFile, File
+import asyncio
 import shutil
 import os
 from uuid import uuid4
 from typing import List
-from app.utils.s3 import upload_file_to_s3, delete_file_from_s3
+from app.utils.s3 import upload_file_to_s3, delete_file_from_s3, run_in_s3_pool
+from app.utils.ai_cache import image_digests, perceptual_hash, sha256_hex
 
 router = APIRouter(prefix="/upload", tags=["Image Upload"])
 
+async def record_image_digest(file_name: str, file_content: bytes):
+    """Remember the upload's content hashes so AI results can be reused for identical images."""
+    phash = await asyncio.to_thread(perceptual_hash, file_content)
+    image_digests.record(file_name, sha256_hex(file_content), phash)
+
 @router.post("/")
 async def upload_image(file: UploadFile = File(...)):
     file_ext = file.filename.split(".")[-1]
@@ -16,7 +23,8 @@ async def upload_image(file: UploadFile = File(...)):
     file_content = await file.read()
 
     # Upload to S3
-    url = upload_file_to_s3(file_content, file_name)
+    url = await run_in_s3_pool(upload_file_to_s3, file_content, file_name)
+    await record_image_digest(file_name, file_content)
 
     return {
         "filename": file_name,
@@ -26,8 +34,7 @@ async def upload_image(file: UploadFile = File(...)):
 
 @router.post("/multiple")
 async def upload_multiple_images(files: List[UploadFile] = File(...)):
-    results = []
-    for file in files:
+    async def upload_one(file: UploadFile):
         ext = file.filename.split(".")[-1]
         file_name = f"{uuid4()}.{ext}"
         
@@ -35,19 +42,23 @@ async def upload_multiple_images(files: List[UploadFile] = File(...)):
         file_content = await file.read()
         
         # Upload to S3
-        url = upload_file_to_s3(file_content, file_name)
+        url = await run_in_s3_pool(upload_file_to_s3, file_content, file_name)
+        await record_image_digest(file_name, file_content)
         
-        results.append({
+        return {
             "filename": file_name,
             "url": url
-        })
+        }
 
+    # Uploads run concurrently on the S3 thread pool, which bounds how many go at once
+    results = await asyncio.gather(*[upload_one(file) for file in files])
     return {"files": results}
 
 @router.delete("/{filename}")
 async def delete_image(filename: str):
     try:
-        delete_file_from_s3(filename)
+        await run_in_s3_pool(delete_file_from_s3, filename)
+        image_digests.forget(filename)
         return {"message": "Image deleted successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
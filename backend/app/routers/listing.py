@@ -8,22 +8,36 @@ from app.models.listing import Listing
 from app.db import get_session
 from app.models.listing_db import Listing as DBListing
 from sqlmodel import Session, select
+from sqlalchemy import insert, update
 import uuid
 import json
 from fastapi.responses import HTMLResponse, JSONResponse
 from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from typing import Optional, Callable, Dict, Any, List, Tuple
+from datetime import datetime
 from app.utils.s3 import BUCKET_NAME, REGION
 import os
 from dotenv import load_dotenv
 import hashlib
-import requests
-from app.routers.ebay_oauth import get_ebay_token
-from app.models.ebay_oauth_db import EbayOAuth
+import httpx
+from app.routers.ebay_oauth import get_ebay_seller_context
+from app.utils.ebay_seller_context import EbaySellerContext, seller_context_cache
 from app.utils.ebay_categories import category_manager
+from app.utils.category_cache import category_cache
+from app.utils.category_validity import category_validity
+from app.utils.ebay_client import ebay_client, EBAY_API_BASE_URL
+from app.utils.ebay_retry import NO_RETRY, RetryPolicy
+from app.utils.merchant_locations import merchant_location_cache
+from app.utils.listing_index import listing_index, listing_embedding, LISTING_DUPLICATE_THRESHOLD
+from app.models.publish_job_db import PublishJob
+from app.services.publish_queue import publish_queue
 
 load_dotenv()
 
+# eBay bulk Inventory API calls accept at most 25 requests each
+EBAY_BULK_CHUNK_SIZE = 25
+BULK_CREATE_MAX_ITEMS = int(os.getenv("BULK_CREATE_MAX_ITEMS", "200"))
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
 def get_current_user(token: str = Depends(oauth2_scheme)):
@@ -61,39 +75,23 @@ async def get_ebay_category_id(category: str, title: str = "", description: str
     """
     return await category_manager.get_best_category_for_item(title, description, user)
 
-async def create_ebay_listing(listing: Listing, user: str):
+def get_ebay_listing_policies(context: EbaySellerContext) -> Dict[str, str]:
     """
-    Create a new listing in both our database and eBay.
+    Return the seller's eBay business policy IDs in the shape expected by offer `listingPolicies`.
     """
-    # Set retry configuration
-    max_retries = 3
-    
-    # Get eBay token
-    token = await get_ebay_token(user)
-    if not token:
-        raise HTTPException(status_code=401, detail="eBay authentication required")
-
-    # Get policy IDs from database
-    with get_session() as session:
-        token_record = session.query(EbayOAuth).filter(EbayOAuth.user_id == user).first()
-        if not token_record:
-            raise HTTPException(status_code=401, detail="eBay authentication required")
-        
-        # Check if we have all required policies
-        if not all([token_record.fulfillment_policy_id, token_record.payment_policy_id, token_record.return_policy_id]):
-            missing_policies = []
-            if not token_record.fulfillment_policy_id:
-                missing_policies.append("fulfillment")
-            if not token_record.payment_policy_id:
-                missing_policies.append("payment")
-            if not token_record.return_policy_id:
-                missing_policies.append("return")
-            raise HTTPException(
-                status_code=400,
-                detail=f"Missing required eBay business policies: {', '.join(missing_policies)}. Please create these policies in your eBay Seller Hub first."
-            )
+    # Check if we have all required policies
+    missing_policies = context.missing_policies()
+    if missing_policies:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Missing required eBay business policies: {', '.join(missing_policies)}. Please create these policies in your eBay Seller Hub first."
+        )
+    return context.listing_policies()
 
-    # Validate required fields
+def validate_ebay_listing(listing: Listing):
+    """
+    Reject listings that are missing fields eBay requires.
+    """
     if not listing.title or len(listing.title.strip()) == 0:
         raise HTTPException(status_code=400, detail="Title is required")
     if not listing.description or len(listing.description.strip()) == 0:
@@ -103,20 +101,25 @@ async def create_ebay_listing(listing: Listing, user: str):
     if not listing.price or listing.price <= 0:
         raise HTTPException(status_code=400, detail="Valid price is required")
 
-    # Convert image filenames to S3 URLs
-    image_urls = [f"https://{BUCKET_NAME}.s3.{REGION}.amazonaws.com/{filename}" for filename in listing.image_filenames]
-
-    # Generate a unique SKU
-    sku = str(uuid.uuid4())
+def ebay_error_status(response: httpx.Response) -> int:
+    """
+    Status to report for a failed eBay call: 502 when eBay itself is failing (so the
+    publish queue retries later), 400 when eBay rejected the request.
+    """
+    return 502 if response.status_code >= 500 or response.status_code == 429 else 400
 
-    headers = {
+def get_ebay_headers(token: str) -> Dict[str, str]:
+    return {
         "Authorization": f"Bearer {token}",
         "Content-Type": "application/json",
         "X-EBAY-C-MARKETPLACE-ID": "EBAY_US",
         "Content-Language": "en-US"
     }
 
-    # First, create the inventory item
+def build_inventory_item(listing: Listing, sku: str) -> Dict[str, Any]:
+    """
+    Build the eBay inventory item payload for a listing.
+    """
     inventory_item = {
         "sku": sku,
         "product": {
@@ -162,37 +165,22 @@ async def create_ebay_listing(listing: Listing, user: str):
         inventory_item["product"]["imageUrls"] = image_urls
         print(f"[DEBUG] Added {len(image_urls)} images to inventory item: {image_urls}")
 
-    # --- Location override logic ---
-    # If the listing provides a location, use it for merchant location creation
-    # Otherwise, fallback to default logic
-    merchant_location = None
-    if listing.location_city and listing.location_postal_code:
-        # Try to find or create a merchant location with these details
-        merchant_location = await get_or_create_merchant_location_with_details(token, listing.location_city, listing.location_postal_code, listing.location_state)
-    else:
-        merchant_location = await get_or_create_merchant_location(token)
-
-    if not merchant_location:
-        raise HTTPException(
-            status_code=400,
-            detail="eBay merchant location required. Please visit your eBay Seller Hub to create a location first, then try again. See /listing/ebay/setup-instructions for detailed steps."
-        )
+    return inventory_item
 
-    # Create offer
-    offer = {
+def build_offer(listing: Listing, sku: str, category_id: str, merchant_location: str, listing_policies: Dict[str, str]) -> Dict[str, Any]:
+    """
+    Build the eBay offer payload for a listing's inventory item.
+    """
+    return {
         "sku": sku,
         "marketplaceId": "EBAY_US",
         "format": "FIXED_PRICE",
         "availableQuantity": 1,
-        "categoryId": await get_ebay_category_id(listing.category, listing.title, listing.description, user),
+        "categoryId": category_id,
         "itemTitle": listing.title,
         "listingDescription": listing.description,
         "listingDuration": "DAYS_7",
-        "listingPolicies": {
-            "fulfillmentPolicyId": token_record.fulfillment_policy_id,
-            "paymentPolicyId": token_record.payment_policy_id,
-            "returnPolicyId": token_record.return_policy_id
-        },
+        "listingPolicies": listing_policies,
         "pricingSummary": {
             "price": {
                 "currency": "USD",
@@ -204,74 +192,198 @@ async def create_ebay_listing(listing: Listing, user: str):
         "merchantLocationKey": merchant_location,
         "condition": listing.condition if listing.condition else "NEW"
     }
+
+async def resolve_merchant_location(context: EbaySellerContext, listing: Listing) -> str:
+    """
+    Find or create the merchant location to ship the listing from.
+    Resolved keys are cached per user and location, so only the first publish talks to eBay.
+    """
+    user, token = context.user_id, context.access_token
+    # --- Location override logic ---
+    # If the listing provides a location, use it for merchant location creation
+    # Otherwise, fallback to default logic
+    merchant_location = None
+    if listing.location_city and listing.location_postal_code:
+        # Try to find or create a merchant location with these details
+        merchant_location = await merchant_location_cache.resolve(
+            user, listing.location_city, listing.location_postal_code, listing.location_state,
+            lambda: get_or_create_merchant_location_with_details(token, listing.location_city, listing.location_postal_code, listing.location_state, user)
+        )
+    elif context.default_merchant_location:
+        merchant_location = context.default_merchant_location
+    else:
+        merchant_location = await merchant_location_cache.resolve(
+            user, None, None, None,
+            lambda: get_or_create_merchant_location(token, user)
+        )
+        context.default_merchant_location = merchant_location
+
+    if not merchant_location:
+        raise HTTPException(
+            status_code=400,
+            detail="eBay merchant location required. Please visit your eBay Seller Hub to create a location first, then try again. See /listing/ebay/setup-instructions for detailed steps."
+        )
+    return merchant_location
+
+def ebay_sku(listing_id: str) -> str:
+    """Inventory SKU for a listing. Stable, so a retried publish updates the same item."""
+    return listing_id
+
+async def find_ebay_offer(sku: str, headers: Dict[str, str], user: str, offer_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    The existing eBay offer for `sku` (by id when known), or None when eBay has none.
+    Lets a retried publish pick up where an earlier attempt stopped.
+    """
+    if offer_id:
+        response = await ebay_client.get(f"{EBAY_API_BASE_URL}/sell/inventory/v1/offer/{offer_id}", headers=headers, user=user)
+        if response.status_code == 200:
+            return response.json()
+        if response.status_code != 404:
+            raise HTTPException(status_code=ebay_error_status(response), detail=f"Failed to look up eBay offer: {response.text}")
+        # The saved offer is gone; look for any other offer under the SKU
+
+    response = await ebay_client.get(
+        f"{EBAY_API_BASE_URL}/sell/inventory/v1/offer",
+        headers=headers,
+        params={"sku": sku, "marketplace_id": "EBAY_US"},
+        user=user
+    )
+    if response.status_code == 200:
+        offers = response.json().get("offers") or []
+        return offers[0] if offers else None
+    # eBay answers 404 when the SKU has no offers (or no inventory item yet)
+    if response.status_code == 404:
+        return None
+    raise HTTPException(status_code=ebay_error_status(response), detail=f"Failed to look up eBay offer: {response.text}")
+
+async def create_ebay_listing(listing: Listing, user: str, sku: str, offer_id: Optional[str] = None,
+                              on_offer_created: Optional[Callable[[str], None]] = None) -> Tuple[str, str]:
+    """
+    Create and publish the eBay inventory item and offer for a listing under `sku`.
+    Safe to call again after a failure: an existing offer (`offer_id`, or found by SKU)
+    is reused, and one that is already published is not published again.
+    """
+    # Get the cached eBay token, policy IDs and default location
+    context = await get_ebay_seller_context(user)
+    if not context:
+        raise HTTPException(status_code=401, detail="eBay authentication required")
+    token = context.access_token
+
+    listing_policies = get_ebay_listing_policies(context)
+
+    # Validate required fields
+    validate_ebay_listing(listing)
+
+    headers = get_ebay_headers(token)
+
+    existing_offer = await find_ebay_offer(sku, headers, user, offer_id)
+    if existing_offer:
+        offer_id = existing_offer["offerId"]
+        category_id = existing_offer.get("categoryId")
+        if existing_offer.get("status") == "PUBLISHED":
+            print(f"[DEBUG] Offer {offer_id} for SKU {sku} is already published")
+            return offer_id, category_id
+        print(f"[DEBUG] Resuming publish of existing offer {offer_id} for SKU {sku}")
+        return await publish_ebay_offer(offer_id, headers, user), category_id
+
+    # First, create the inventory item
+    inventory_item = build_inventory_item(listing, sku)
+
+    merchant_location = await resolve_merchant_location(context, listing)
+
+    # Create offer
+    category_id = await get_ebay_category_id(listing.category, listing.title, listing.description, user)
+    offer = build_offer(listing, sku, category_id, merchant_location, listing_policies)
     
     print(f"[DEBUG] Using merchant location: {merchant_location}")
 
-    inventory_url = f"https://api.ebay.com/sell/inventory/v1/inventory_item/{sku}"
+    inventory_url = f"{EBAY_API_BASE_URL}/sell/inventory/v1/inventory_item/{sku}"
     print(f"[DEBUG] Creating inventory item with data: {json.dumps(inventory_item, indent=2)}")
     
-    inventory_response = requests.put(inventory_url, json=inventory_item, headers=headers, timeout=30)
+    inventory_response = await ebay_client.put(inventory_url, json=inventory_item, headers=headers, user=user)
     print(f"[DEBUG] Inventory item creation response status: {inventory_response.status_code}")
     print(f"[DEBUG] Inventory item creation response: {inventory_response.text}")
     
     if inventory_response.status_code not in (200, 201, 204):
         print(f"[DEBUG] Failed to create inventory item: {inventory_response.text}")
-        raise HTTPException(status_code=400, detail=f"Failed to create eBay inventory item: {inventory_response.text}")
+        raise HTTPException(status_code=ebay_error_status(inventory_response), detail=f"Failed to create eBay inventory item: {inventory_response.text}")
     
     print(f"[DEBUG] Successfully created inventory item with SKU: {sku}")
 
     # Create offer
-    offer_url = "https://api.ebay.com/sell/inventory/v1/offer"
+    offer_url = f"{EBAY_API_BASE_URL}/sell/inventory/v1/offer"
     print(f"[DEBUG] Creating offer with data: {json.dumps(offer, indent=2)}")
     
-    # Add retry logic for offer creation
-    for attempt in range(max_retries):
-        try:
-            response = requests.post(offer_url, json=offer, headers=headers, timeout=30)
-            if response.status_code == 201:
-                break
-            elif response.status_code == 500 and attempt < max_retries - 1:
-                print(f"[DEBUG] eBay offer API returned 500, retrying... (attempt {attempt + 1}/{max_retries})")
-                import time
-                time.sleep(2 ** attempt)
-                continue
-            else:
-                break
-        except requests.exceptions.RequestException as e:
-            if attempt < max_retries - 1:
-                print(f"[DEBUG] Offer request failed, retrying... (attempt {attempt + 1}/{max_retries}): {e}")
-                import time
-                time.sleep(2 ** attempt)
-                continue
-            else:
-                raise HTTPException(status_code=500, detail=f"Failed to connect to eBay API: {str(e)}")
+    # Retries with backoff (and the circuit breaker) are handled by ebay_client
+    try:
+        # Not retried: a repeated POST could create a second offer
+        response = await ebay_client.post(offer_url, json=offer, headers=headers, retry_policy=NO_RETRY, user=user)
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=503, detail=f"Failed to connect to eBay API: {str(e)}")
     
     if response.status_code != 201:
         print(f"[DEBUG] Failed to create offer: {response.text}")
         print(f"[DEBUG] Response status: {response.status_code}")
-        raise HTTPException(status_code=400, detail=f"Failed to create eBay offer: {response.text}")
+        if "merchantlocationkey" in response.text.lower():
+            # The cached location no longer exists on eBay; resolve it again next time
+            if listing.location_city and listing.location_postal_code:
+                merchant_location_cache.invalidate(user, listing.location_city, listing.location_postal_code, listing.location_state)
+            else:
+                merchant_location_cache.invalidate(user)
+                seller_context_cache.invalidate(user)
+        if "not a leaf category" in response.text.lower():
+            # Remember the rejection so the category isn't chosen again for this taxonomy version
+            category_validity.record(category_id, False, "offer")
+            category_cache.invalidate(listing.title)
+        raise HTTPException(status_code=ebay_error_status(response), detail=f"Failed to create eBay offer: {response.text}")
 
     offer_id = response.json()["offerId"]
+    if on_offer_created:
+        on_offer_created(offer_id)
+
+    return await publish_ebay_offer(offer_id, headers, user), category_id
 
-    # Publish offer
-    publish_url = f"https://api.ebay.com/sell/inventory/v1/offer/{offer_id}/publish"
+async def publish_ebay_offer(offer_id: str, headers: Dict[str, str], user: str) -> str:
+    """
+    Publish an eBay offer and return its id.
+    """
+    publish_url = f"{EBAY_API_BASE_URL}/sell/inventory/v1/offer/{offer_id}/publish"
     print(f"[DEBUG] Publishing offer {offer_id} to eBay...")
     print(f"[DEBUG] Publish URL: {publish_url}")
-    response = requests.post(publish_url, headers=headers)
+    response = await ebay_client.post(publish_url, headers=headers, endpoint="POST /sell/inventory/v1/offer/publish", retry_policy=NO_RETRY, user=user)
     print(f"[DEBUG] Publish response status: {response.status_code}")
     print(f"[DEBUG] Publish response: {response.text}")
     if response.status_code != 200:
         print(f"[DEBUG] Failed to publish offer: {response.text}")
-        raise HTTPException(status_code=400, detail=f"Failed to publish eBay offer: {response.text}")
+        raise HTTPException(status_code=ebay_error_status(response), detail=f"Failed to publish eBay offer: {response.text}")
 
     print(f"[DEBUG] Successfully published offer {offer_id} to eBay")
     return offer_id
 
+def find_duplicate_listings(embedding, user: str) -> List[Dict[str, Any]]:
+    """The user's existing listings that look like the same item as `embedding`."""
+    with get_session() as session:
+        titles = dict(session.exec(select(DBListing.id, DBListing.title).where(DBListing.owner == user)).all())
+    if not titles:
+        return []
+    # Only the user's own listings are scored, so other users' similar items can't crowd them out
+    return [
+        {"id": listing_id, "title": titles[listing_id], "similarity": score}
+        for listing_id, score in listing_index.search(embedding, k=5, only=list(titles))
+        if score >= LISTING_DUPLICATE_THRESHOLD
+    ]
+
 @router.post("/create")
 async def create_listing(data: Listing, user=Depends(get_current_user)):
     if not data.marketplaces or len(data.marketplaces) == 0:
         raise HTTPException(status_code=400, detail="At least one marketplace must be selected")
-    
+
+    # Flag (but still create) listings that look like one the user already has
+    embedding = listing_embedding(data.title, data.description, data.tags, data.image_filenames)
+    duplicates = find_duplicate_listings(embedding, user)
+    if duplicates:
+        print(f"[DEBUG] Listing '{data.title}' looks like existing listing(s) {[d['id'] for d in duplicates]}")
+
     # Initialize marketplace statuses
     marketplace_status = {marketplace: "pending" for marketplace in data.marketplaces}
     
@@ -289,25 +401,289 @@ async def create_listing(data: Listing, user=Depends(get_current_user)):
             marketplace_status=json.dumps(marketplace_status)
         )
         session.add(listing)
-        session.commit()
 
-        # If eBay is selected, create the listing on eBay
+        # If eBay is selected, queue the eBay publish in the same transaction;
+        # a publish worker updates marketplace_status once eBay responds
         if "eBay" in data.marketplaces:
+            publish_queue.enqueue(session, listing.id, user, data.model_dump())
+
+        session.commit()
+        listing_id = listing.id
+
+    listing_index.add(listing_id, embedding)
+    publish_queue.notify()
+    return {"id": listing_id, "message": "Listing created", "possible_duplicates": duplicates}
+
+def _ebay_bulk_error(entry: Dict[str, Any]) -> str:
+    errors = entry.get("errors") or []
+    messages = [e.get("longMessage") or e.get("message") for e in errors]
+    return "; ".join(m for m in messages if m) or f"eBay returned status {entry.get('statusCode')}"
+
+async def post_ebay_bulk(operation: str, requests_payload: List[Dict[str, Any]], headers: Dict[str, str], user: str,
+                         retry_policy: Optional[RetryPolicy] = None) -> List[Dict[str, Any]]:
+    """
+    Call one of the eBay bulk Inventory API operations and return its per-item responses.
+    Pass NO_RETRY for operations that aren't safe to repeat (creating or publishing offers).
+    Raises 502/503 when eBay is failing or unreachable and 400 when it rejected the request.
+    """
+    url = f"{EBAY_API_BASE_URL}/sell/inventory/v1/{operation}"
+    print(f"[DEBUG] Calling eBay {operation} with {len(requests_payload)} requests")
+    try:
+        response = await ebay_client.post(url, json={"requests": requests_payload}, headers=headers, retry_policy=retry_policy, user=user)
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=503, detail=f"Failed to connect to eBay API: {str(e)}")
+    print(f"[DEBUG] {operation} response status: {response.status_code}")
+    # 207 Multi-Status means some items failed; the per-item responses say which
+    if response.status_code not in (200, 207):
+        print(f"[DEBUG] {operation} failed: {response.text}")
+        raise HTTPException(status_code=ebay_error_status(response), detail=f"eBay {operation} failed: {response.text}")
+    return response.json().get("responses", [])
+
+async def create_ebay_listings_bulk(items: List[Tuple[str, Listing]], user: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Publish many listings to eBay with the bulk inventory item, offer and publish calls,
+    chunked by EBAY_BULK_CHUNK_SIZE. Returns a result per listing id; `retryable` marks
+    failures caused by eBay being unavailable rather than by the listing itself.
+    """
+    results: Dict[str, Dict[str, Any]] = {}
+
+    def fail(listing_id: str, error: str, retryable: bool = False):
+        results[listing_id] = {"status": "failed", "ebay_item_id": None, "ebay_category_id": None, "error": error, "retryable": retryable}
+
+    def entry_retryable(entry: Dict[str, Any]) -> bool:
+        status = entry.get("statusCode") or 0
+        return status >= 500 or status == 429
+
+    context = await get_ebay_seller_context(user)
+    if not context:
+        for listing_id, _ in items:
+            fail(listing_id, "eBay authentication required")
+        return results
+    token = context.access_token
+
+    try:
+        listing_policies = get_ebay_listing_policies(context)
+    except HTTPException as e:
+        for listing_id, _ in items:
+            fail(listing_id, e.detail)
+        return results
+
+    headers = get_ebay_headers(token)
+
+    pending: List[Tuple[str, Listing]] = []
+    for listing_id, listing in items:
+        try:
+            validate_ebay_listing(listing)
+            pending.append((listing_id, listing))
+        except HTTPException as e:
+            fail(listing_id, e.detail)
+
+    # Resolve each distinct merchant location once rather than once per item
+    locations: Dict[Tuple, Any] = {}
+    ready: List[Tuple[str, Listing, str]] = []
+    for listing_id, listing in pending:
+        key = (listing.location_city, listing.location_postal_code, listing.location_state)
+        if key not in locations:
             try:
-                ebay_item_id = await create_ebay_listing(data, user)
-                listing.ebay_item_id = ebay_item_id
-                marketplace_status["eBay"] = "posted"
-                listing.marketplace_status = json.dumps(marketplace_status)
-                session.add(listing)
-                session.commit()
-            except Exception as e:
-                marketplace_status["eBay"] = "failed"
-                listing.marketplace_status = json.dumps(marketplace_status)
-                session.add(listing)
-                session.commit()
-                print(f"[DEBUG] Failed to create eBay listing: {str(e)}")
-
-        return {"id": listing.id, "message": "Listing created"}
+                locations[key] = await resolve_merchant_location(context, listing)
+            except HTTPException as e:
+                locations[key] = e
+        if isinstance(locations[key], HTTPException):
+            fail(listing_id, locations[key].detail)
+        else:
+            ready.append((listing_id, listing, locations[key]))
+
+    category_ids = await category_manager.get_best_categories_for_items(
+        [(listing.title, listing.description) for _, listing, _ in ready], user
+    )
+
+    by_sku: Dict[str, Tuple[str, Listing, str, str]] = {}
+    for (listing_id, listing, merchant_location), category_id in zip(ready, category_ids):
+        by_sku[str(uuid.uuid4())] = (listing_id, listing, merchant_location, category_id)
+
+    def collect(skus: List[str], responses: List[Dict[str, Any]], ok_statuses: Tuple[int, ...], key: str = "sku") -> List[Dict[str, Any]]:
+        """Fail items whose bulk response is missing or unsuccessful; return the successful entries."""
+        succeeded = []
+        answered = set()
+        for entry in responses:
+            answered.add(entry.get(key))
+            if entry.get("statusCode") in ok_statuses:
+                succeeded.append(entry)
+            elif entry.get(key) in skus:
+                fail(by_sku[entry[key]][0], _ebay_bulk_error(entry), entry_retryable(entry))
+        for sku in skus:
+            if sku not in answered and by_sku[sku][0] not in results:
+                fail(by_sku[sku][0], "No response from eBay for this item", True)
+        return succeeded
+
+    # 1. Inventory items
+    skus = list(by_sku)
+    created_skus: List[str] = []
+    for start in range(0, len(skus), EBAY_BULK_CHUNK_SIZE):
+        chunk = skus[start:start + EBAY_BULK_CHUNK_SIZE]
+        payload = [dict(build_inventory_item(by_sku[sku][1], sku), locale="en_US") for sku in chunk]
+        try:
+            responses = await post_ebay_bulk("bulk_create_or_replace_inventory_item", payload, headers, user)
+        except HTTPException as e:
+            for sku in chunk:
+                fail(by_sku[sku][0], e.detail, e.status_code >= 500)
+            continue
+        created_skus.extend(entry["sku"] for entry in collect(chunk, responses, (200, 201, 204)))
+
+    # 2. Offers
+    offer_skus: Dict[str, str] = {}
+    for start in range(0, len(created_skus), EBAY_BULK_CHUNK_SIZE):
+        chunk = created_skus[start:start + EBAY_BULK_CHUNK_SIZE]
+        payload = [
+            build_offer(by_sku[sku][1], sku, by_sku[sku][3], by_sku[sku][2], listing_policies)
+            for sku in chunk
+        ]
+        try:
+            responses = await post_ebay_bulk("bulk_create_offer", payload, headers, user, NO_RETRY)
+        except HTTPException as e:
+            for sku in chunk:
+                fail(by_sku[sku][0], e.detail, e.status_code >= 500)
+            continue
+        for entry in collect(chunk, responses, (200, 201)):
+            offer_skus[entry["offerId"]] = entry["sku"]
+
+    # 3. Publish
+    offer_ids = list(offer_skus)
+    for start in range(0, len(offer_ids), EBAY_BULK_CHUNK_SIZE):
+        chunk = offer_ids[start:start + EBAY_BULK_CHUNK_SIZE]
+        try:
+            responses = await post_ebay_bulk("bulk_publish_offer", [{"offerId": offer_id} for offer_id in chunk], headers, user, NO_RETRY)
+        except HTTPException as e:
+            for offer_id in chunk:
+                fail(by_sku[offer_skus[offer_id]][0], e.detail, e.status_code >= 500)
+            continue
+        answered = set()
+        for entry in responses:
+            offer_id = entry.get("offerId")
+            if offer_id not in offer_skus:
+                continue
+            answered.add(offer_id)
+            listing_id = by_sku[offer_skus[offer_id]][0]
+            if entry.get("statusCode") == 200:
+                results[listing_id] = {"status": "posted", "ebay_item_id": offer_id, "ebay_category_id": by_sku[offer_skus[offer_id]][3], "error": None, "retryable": False}
+            else:
+                fail(listing_id, _ebay_bulk_error(entry), entry_retryable(entry))
+        for offer_id in chunk:
+            if offer_id not in answered:
+                fail(by_sku[offer_skus[offer_id]][0], "No response from eBay for this item", True)
+
+    print(f"[DEBUG] Bulk eBay publish finished: {sum(1 for r in results.values() if r['status'] == 'posted')}/{len(items)} posted")
+    return results
+
+@router.post("/bulk-create")
+async def bulk_create_listings(data: List[Listing], user=Depends(get_current_user)):
+    if not data:
+        raise HTTPException(status_code=400, detail="At least one listing is required")
+    if len(data) > BULK_CREATE_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {BULK_CREATE_MAX_ITEMS} listings can be created at once")
+    for index, item in enumerate(data):
+        if not item.marketplaces or len(item.marketplaces) == 0:
+            raise HTTPException(status_code=400, detail=f"Listing {index}: at least one marketplace must be selected")
+
+    now = datetime.utcnow()
+    rows = [
+        {
+            "id": str(uuid.uuid4()),
+            "owner": user,
+            "title": item.title,
+            "description": item.description,
+            "category": item.category,
+            "tags": ",".join(item.tags),
+            "image_filenames": ",".join(item.image_filenames),
+            "price": item.price,
+            "marketplaces": ",".join(item.marketplaces),
+            "brand": item.brand,
+            "marketplace_status": json.dumps({marketplace: "pending" for marketplace in item.marketplaces}),
+            "created_at": now,
+            "ebay_item_id": None,
+            "ebay_category_id": None
+        }
+        for item in data
+    ]
+
+    # One batched INSERT for every row
+    with get_session() as session:
+        session.execute(insert(DBListing), rows)
+        session.commit()
+    for row, item in zip(rows, data):
+        listing_index.add(row["id"], listing_embedding(item.title, item.description, item.tags, item.image_filenames))
+
+    ebay_items = [(row["id"], item) for row, item in zip(rows, data) if "eBay" in item.marketplaces]
+    ebay_results = await create_ebay_listings_bulk(ebay_items, user) if ebay_items else {}
+
+    response = []
+    updates = []
+    for row in rows:
+        marketplace_status = json.loads(row["marketplace_status"])
+        result = ebay_results.get(row["id"])
+        if result:
+            marketplace_status["eBay"] = result["status"]
+            updates.append({
+                "id": row["id"],
+                "marketplace_status": json.dumps(marketplace_status),
+                "ebay_item_id": result["ebay_item_id"],
+                "ebay_category_id": result["ebay_category_id"]
+            })
+        response.append({
+            "id": row["id"],
+            "title": row["title"],
+            "marketplace_status": marketplace_status,
+            "ebay_item_id": result["ebay_item_id"] if result else None,
+            "error": result["error"] if result else None,
+            "retryable": result["retryable"] if result else False
+        })
+
+    if updates:
+        with get_session() as session:
+            session.execute(update(DBListing), updates)
+            session.commit()
+
+    return {"listings": response, "message": f"{len(rows)} listings created"}
+
+def set_ebay_publish_status(listing_id: str, status: str, ebay_item_id: Optional[str] = None, ebay_category_id: Optional[str] = None):
+    """
+    Record the outcome of an eBay publish on the listing row.
+    """
+    with get_session() as session:
+        listing = session.get(DBListing, listing_id)
+        if not listing:
+            print(f"[DEBUG] Listing {listing_id} was deleted before eBay publish finished")
+            return
+        marketplace_status = json.loads(listing.marketplace_status)
+        marketplace_status["eBay"] = status
+        listing.marketplace_status = json.dumps(marketplace_status)
+        if ebay_item_id:
+            listing.ebay_item_id = ebay_item_id
+        if ebay_category_id:
+            listing.ebay_category_id = ebay_category_id
+        session.add(listing)
+        session.commit()
+
+async def process_publish_job(job: PublishJob):
+    """
+    Publish queue handler: create the queued listing on eBay.
+    """
+    listing_data = Listing(**json.loads(job.payload))
+    ebay_item_id, ebay_category_id = await create_ebay_listing(
+        listing_data,
+        job.owner,
+        ebay_sku(job.listing_id),
+        job.offer_id,
+        lambda offer_id: publish_queue.record_offer(job, offer_id)
+    )
+    set_ebay_publish_status(job.listing_id, "posted", ebay_item_id, ebay_category_id)
+
+def mark_publish_job_failed(job: PublishJob, error: Exception):
+    """
+    Publish queue failure handler, called once a job has exhausted its retries.
+    """
+    print(f"[DEBUG] Failed to create eBay listing: {str(error)}")
+    set_ebay_publish_status(job.listing_id, "failed")
 
 
 @router.get("/my")
@@ -353,6 +729,33 @@ def get_listing(listing_id: str):
         }
 
 
+@router.get("/{listing_id}/similar")
+def get_similar_listings(listing_id: str, k: int = Query(10, ge=1, le=50)):
+    """Listings most similar to this one by title, description, tags and first image."""
+    with get_session() as session:
+        listing = session.get(DBListing, listing_id)
+        if not listing:
+            raise HTTPException(status_code=404, detail="Listing not found")
+        embedding = listing_index.vector(listing_id)
+        if embedding is None:
+            embedding = listing_embedding(listing.title, listing.description, listing.tags.split(","), listing.image_filenames.split(","))
+
+        matches = listing_index.search(embedding, k=k, exclude=[listing_id])
+        scores = dict(matches)
+        similar = session.exec(select(DBListing).where(DBListing.id.in_(list(scores)))).all() if matches else []
+        return [
+            {
+                "id": l.id,
+                "title": l.title,
+                "category": l.category,
+                "price": l.price,
+                "image_filenames": l.image_filenames.split(","),
+                "similarity": scores[l.id]
+            }
+            for l in sorted(similar, key=lambda l: scores[l.id], reverse=True)
+        ]
+
+
 @router.put("/{listing_id}")
 def update_listing(listing_id: str, data: Listing, user=Depends(get_current_user)):
     with get_session() as session:
@@ -373,6 +776,7 @@ def update_listing(listing_id: str, data: Listing, user=Depends(get_current_user
 
         session.add(listing)
         session.commit()
+        listing_index.add(listing_id, listing_embedding(data.title, data.description, data.tags, data.image_filenames))
         return {"message": "Listing updated"}
 
 
@@ -387,6 +791,7 @@ def delete_listing(listing_id: str, user=Depends(get_current_user)):
 
         session.delete(listing)
         session.commit()
+        listing_index.remove(listing_id)
         return {"message": "Listing deleted"}
 
 
@@ -512,7 +917,7 @@ async def handle_ebay_challenge(request: Request, challenge_code: str = Query(..
         headers={"Content-Type": "application/json"}
     )
 
-async def get_or_create_merchant_location_with_details(token: str, city: str, postal_code: str, state: str = None) -> str:
+async def get_or_create_merchant_location_with_details(token: str, city: str, postal_code: str, state: str = None, user: str = None) -> str:
     """
     Get or create a merchant location with specific details.
     Returns the location key or None if creation fails.
@@ -524,10 +929,10 @@ async def get_or_create_merchant_location_with_details(token: str, city: str, po
     
     # First, try to get existing locations
     try:
-        response = requests.get(
-            "https://api.ebay.com/sell/inventory/v1/location",
+        response = await ebay_client.get(
+            f"{EBAY_API_BASE_URL}/sell/inventory/v1/location",
             headers=headers,
-            timeout=30
+            user=user
         )
         
         print(f"[DEBUG] Location fetch response status: {response.status_code}")
@@ -572,12 +977,13 @@ async def get_or_create_merchant_location_with_details(token: str, city: str, po
         location_data["location"]["address"]["stateOrProvince"] = state
     
     try:
-        location_url = f"https://api.ebay.com/sell/inventory/v1/location/{location_data['merchantLocationKey']}"
-        response = requests.post(
+        location_url = f"{EBAY_API_BASE_URL}/sell/inventory/v1/location/{location_data['merchantLocationKey']}"
+        response = await ebay_client.post(
             location_url,
             json=location_data,
             headers=headers,
-            timeout=30
+            retry_policy=NO_RETRY,
+            user=user
         )
         
         print(f"[DEBUG] Location creation response status: {response.status_code}")
@@ -592,7 +998,7 @@ async def get_or_create_merchant_location_with_details(token: str, city: str, po
     print("[DEBUG] Location creation failed")
     return None
 
-async def get_or_create_merchant_location(token: str) -> str:
+async def get_or_create_merchant_location(token: str, user: str = None) -> str:
     """
     Get the first available merchant location from eBay, or create a basic one if none exists.
     Returns the location key or None if creation fails.
@@ -604,10 +1010,10 @@ async def get_or_create_merchant_location(token: str) -> str:
     
     # First, try to get existing locations
     try:
-        response = requests.get(
-            "https://api.ebay.com/sell/inventory/v1/location",
+        response = await ebay_client.get(
+            f"{EBAY_API_BASE_URL}/sell/inventory/v1/location",
             headers=headers,
-            timeout=30
+            user=user
         )
         
         print(f"[DEBUG] Location fetch response status: {response.status_code}")
@@ -658,12 +1064,13 @@ async def get_or_create_merchant_location(token: str) -> str:
         
         try:
             # Use the merchantLocationKey in the URL path
-            location_url = f"https://api.ebay.com/sell/inventory/v1/location/{location_data['merchantLocationKey']}"
-            response = requests.post(
+            location_url = f"{EBAY_API_BASE_URL}/sell/inventory/v1/location/{location_data['merchantLocationKey']}"
+            response = await ebay_client.post(
                 location_url,
                 json=location_data,
                 headers=headers,
-                timeout=30
+                retry_policy=NO_RETRY,
+                user=user
             )
             
             print(f"[DEBUG] Location creation attempt {i+1} response status: {response.status_code}")
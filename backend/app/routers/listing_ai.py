@@ -1,20 +1,111 @@
-import os
-import base64
+import asyncio
+import hashlib
 import json
+import os
 import re
+import time
 from dotenv import load_dotenv
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from openai import OpenAI
-from app.utils.s3 import BUCKET_NAME, get_s3_client
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from app.services.ai_scheduler import BATCH, INTERACTIVE, ai_caller, get_ai_user
+from app.services.model_router import ModelChoice, estimate_image_tokens, estimate_text_tokens, model_router
+from app.utils.ai_cache import ai_result_cache, image_digests, sha256_hex
+from app.utils.image_preprocess import image_preprocessor, PreparedImage, VISION_IMAGE_DETAIL, VISION_IMAGE_MAX_EDGE
+from app.utils.json_stream import JsonFieldStreamParser
+from app.utils.pricing import price_engine
+from app.utils.s3 import BUCKET_NAME, get_s3_client, run_in_s3_pool
 
 load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 router = APIRouter(prefix="/generate", tags=["AI Listing Generator"])
 
+LISTING_PROMPT = (
+    "You're an AI assistant helping someone sell their item online. "
+    "Look at the image and generate the following as a valid JSON object:\n\n"
+    "{\n"
+    "  \"title\": string,\n"
+    "  \"description\": string,\n"
+    "  \"category\": string,\n"
+    "  \"tags\": [string, string, string, string, string]\n"
+    "}\n\n"
+    "Only return the JSON. Do not add any extra commentary or formatting."
+)
+LISTING_WITH_PRICE_PROMPT = (
+    "You're an AI assistant helping someone sell their item online. "
+    "Look at the image and generate the following as a valid JSON object:\n\n"
+    "{\n"
+    "  \"title\": string,\n"
+    "  \"description\": string,\n"
+    "  \"category\": string,\n"
+    "  \"tags\": [string, string, string, string, string],\n"
+    "  \"price\": number\n"
+    "}\n\n"
+    "\"price\" is a fair resale price in USD for secondhand marketplaces like eBay and Craigslist. "
+    "Only return the JSON. Do not add any extra commentary or formatting."
+)
+MULTI_VIEW_PROMPT = (
+    "You're an AI assistant helping someone sell their item online. "
+    "These images all show the same single item from different angles. "
+    "Use every image and generate the following as a valid JSON object:\n\n"
+    "{\n"
+    "  \"title\": string,\n"
+    "  \"description\": string,\n"
+    "  \"category\": string,\n"
+    "  \"tags\": [string, string, string, string, string]\n"
+    "}\n\n"
+    "Only return the JSON. Do not add any extra commentary or formatting."
+)
+
+def prompt_version(prompt: str, request_type: str, model: str) -> str:
+    """
+    Cached results are keyed by this and the model that answered, so editing the prompt,
+    model route or image settings invalidates them.
+    """
+    route = model_router.route(request_type)
+    tiers = json.dumps(route.get("tiers", []), sort_keys=True)
+    return hashlib.sha256(
+        f"{model}|{route['primary']}|{tiers}|{route['max_output_tokens']}|{VISION_IMAGE_MAX_EDGE}|{VISION_IMAGE_DETAIL}|{prompt}".encode("utf-8")
+    ).hexdigest()[:16]
+
+def prompt_versions(prompt: str, request_type: str) -> List[str]:
+    """
+    Versions a cached result for `prompt` may be stored under: one per model the route picks
+    when not degraded. Which one answers is fixed by the input's size, so at most one matches.
+    """
+    return [prompt_version(prompt, request_type, model) for model in model_router.normal_models(request_type)]
+
+def get_cached_listing(content_hash: str, prompt: str, request_type: str = "listing_vision", owner: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    for version in prompt_versions(prompt, request_type):
+        cached = ai_result_cache.get(content_hash, version, owner)
+        if cached is not None:
+            return cached
+    return None
+
+def cache_listing(content_hash: str, prompt: str, choice: ModelChoice, listing: Dict[str, Any],
+                  phash: Optional[str] = None, owner: Optional[str] = None):
+    # Answers from the SLO fallback model aren't kept; the next request gets the normal model's
+    if choice.degraded:
+        return
+    ai_result_cache.set(content_hash, prompt_version(prompt, choice.request_type, choice.model), listing, phash, owner)
+
+GENERATE_BATCH_MAX_IMAGES = int(os.getenv("GENERATE_BATCH_MAX_IMAGES", "20"))
+# Images per multi-view request; each one adds vision tokens to the same call
+GENERATE_MULTI_VIEW_MAX_IMAGES = int(os.getenv("GENERATE_MULTI_VIEW_MAX_IMAGES", "6"))
+# Single-image generations one batch may run at once (ai_client still bounds the worker overall)
+GENERATE_BATCH_CONCURRENCY = int(os.getenv("GENERATE_BATCH_CONCURRENCY", "4"))
+
 class ListingRequest(BaseModel):
     filename: str
+    # Also estimate the price from the same vision request, instead of a separate /price call
+    include_price: bool = False
+
+class BatchListingRequest(BaseModel):
+    filenames: List[str]
+    # "per_item": one listing per image; "multi_view": one listing from all images of a single item
+    mode: str = Field(default="per_item", pattern="^(per_item|multi_view)$")
 
 def extract_json_from_response(text: str):
     match = re.search(r"\{.*\}", text, re.DOTALL)
@@ -26,53 +117,268 @@ def extract_json_from_response(text: str):
         return None
     
 
-@router.post("/")
-async def generate_listing(data: ListingRequest):
+@dataclass
+class ListingImage:
+    """An uploaded image made ready for the listing prompt, or a cached result for it."""
+    image_hash: str
+    prepared: Optional[PreparedImage]
+    phash: Optional[str]
+    cached: Optional[Dict[str, Any]]
+    generated: bool = False  # True once the model was called for this image
+    timings: Dict[str, float] = field(default_factory=dict)
+
+def fetch_image_bytes(filename: str) -> bytes:
     s3_client = get_s3_client()
     try:
-        s3_response = s3_client.get_object(Bucket=BUCKET_NAME, Key=data.filename)
-        image_bytes = s3_response['Body'].read()
+        s3_response = s3_client.get_object(Bucket=BUCKET_NAME, Key=filename)
+        return s3_response['Body'].read()
     except Exception as e:
+        print(f"[DEBUG] Failed to fetch image {filename} from S3: {e}")
         raise HTTPException(status_code=404, detail="Image not found")
 
-    encoded_image = base64.b64encode(image_bytes).decode("utf-8")
+async def fetch_and_prepare_image(filename: str):
+    """Download an image (on the S3 pool) and prepare it for the model, both off the event loop. Returns (sha256, PreparedImage)."""
+    image_bytes = await run_in_s3_pool(fetch_image_bytes, filename)
+    # Decode, orient, downscale and re-encode once
+    prepared = await asyncio.to_thread(image_preprocessor.prepare, image_bytes)
+    return sha256_hex(image_bytes), prepared
 
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": (
-                            "You're an AI assistant helping someone sell their item online. "
-                            "Look at the image and generate the following as a valid JSON object:\n\n"
-                            "{\n"
-                            "  \"title\": string,\n"
-                            "  \"description\": string,\n"
-                            "  \"category\": string,\n"
-                            "  \"tags\": [string, string, string, string, string]\n"
-                            "}\n\n"
-                            "Only return the JSON. Do not add any extra commentary or formatting."
-                        )
-                    },
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/jpeg;base64,{encoded_image}"
-                        }
-                    }
-                ]
-            }
-        ],
-        max_tokens=600
+async def load_listing_image(filename: str, prompt: str = LISTING_PROMPT) -> ListingImage:
+    owner = ai_caller.get()[0]
+    # Images we've hashed before can be answered from the cache without touching S3
+    digest = image_digests.get(filename)
+    if digest:
+        cached = get_cached_listing(digest[0], prompt, owner=owner)
+        if cached is not None:
+            return ListingImage(digest[0], None, digest[1], cached)
+
+    started = time.perf_counter()
+    image_hash, prepared = await fetch_and_prepare_image(filename)
+    timings = {
+        "fetch_and_prepare_ms": round((time.perf_counter() - started) * 1000, 1),
+        "preprocess_ms": round(prepared.preprocess_ms, 1)
+    }
+    phash = prepared.phash or (digest[1] if digest else None)
+    if not digest or digest[0] != image_hash:
+        image_digests.record(filename, image_hash, phash)
+        cached = get_cached_listing(image_hash, prompt, owner=owner)
+        if cached is not None:
+            return ListingImage(image_hash, prepared, phash, cached, timings=timings)
+
+    # A re-shot of an item this caller has just had analyzed
+    for version in prompt_versions(prompt, "listing_vision"):
+        cached = ai_result_cache.find_similar(phash, version, owner)
+        if cached is not None:
+            ai_result_cache.set(image_hash, version, cached, phash, owner)
+            break
+    return ListingImage(image_hash, prepared, phash, cached, timings=timings)
+
+def listing_messages(prepared: PreparedImage, prompt: str = LISTING_PROMPT):
+    return [
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "text",
+                    "text": prompt
+                },
+                prepared.content_part()
+            ]
+        }
+    ]
+
+def listing_input_tokens(prompt: str, images: List[PreparedImage]) -> int:
+    return estimate_text_tokens(prompt) + sum(
+        estimate_image_tokens(prepared.width, prepared.height, VISION_IMAGE_DETAIL) for prepared in images
     )
 
+async def complete_listing_json(messages, choice: ModelChoice) -> Dict[str, Any]:
+    response = await model_router.chat(choice.request_type, messages, choice=choice)
+
     raw = response.choices[0].message.content
     parsed_json = extract_json_from_response(raw)
 
     if not parsed_json:
         raise HTTPException(status_code=500, detail="AI response was not valid JSON")
+    return parsed_json
+
+async def generate_listing_for_image(filename: str, prompt: str = LISTING_PROMPT) -> ListingImage:
+    """Generate (or fetch from cache) the listing for one image; the result is in `.cached`."""
+    image = await load_listing_image(filename, prompt)
+    if image.cached is None:
+        choice = model_router.choose("listing_vision", listing_input_tokens(prompt, [image.prepared]))
+        started = time.perf_counter()
+        image.cached = await complete_listing_json(listing_messages(image.prepared, prompt), choice)
+        image.timings["model_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        image.generated = True
+        cache_listing(image.image_hash, prompt, choice, image.cached, image.phash, ai_caller.get()[0])
+    return image
+
+async def price_generated_listing(listing: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Replace the model's `price` with price_estimate fields: from comparable listings when
+    there are enough, otherwise the price the vision request already returned.
+    """
+    listing = dict(listing)
+    model_price = listing.pop("price", None)
+    estimate = await price_engine.estimate(listing.get("title", ""), listing.get("category"))
+    if estimate:
+        listing.update({
+            "price_estimate": f"{estimate.price:.2f}",
+            "price_source": "comparables",
+            "price_confidence": estimate.confidence
+        })
+    else:
+        try:
+            price = f"{float(model_price):.2f}"
+        except (TypeError, ValueError):
+            price = None
+        listing.update({"price_estimate": price, "price_source": "llm", "price_confidence": None})
+    return listing
+
+@router.post("/")
+async def generate_listing(data: ListingRequest, ai_user: str = Depends(get_ai_user)):
+    ai_caller.set((ai_user, INTERACTIVE))
+    if not data.include_price:
+        image = await generate_listing_for_image(data.filename)
+        return image.cached
+
+    # One vision request for the listing fields and the price, sharing the image fetch
+    started = time.perf_counter()
+    image = await generate_listing_for_image(data.filename, LISTING_WITH_PRICE_PROMPT)
+    pricing_started = time.perf_counter()
+    listing = await price_generated_listing(image.cached)
+    timings = dict(image.timings)
+    timings["pricing_ms"] = round((time.perf_counter() - pricing_started) * 1000, 1)
+    timings["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    listing["timings"] = timings
+    listing["cached"] = not image.generated
+    return listing
+
+async def generate_per_item(filenames: List[str]) -> List[Dict[str, Any]]:
+    semaphore = asyncio.Semaphore(GENERATE_BATCH_CONCURRENCY)
+
+    async def generate_one(filename: str) -> Dict[str, Any]:
+        started = time.perf_counter()
+        async with semaphore:
+            try:
+                image = await generate_listing_for_image(filename)
+                result = {"filename": filename, "status": "ok", "listing": image.cached, "cached": not image.generated}
+            except HTTPException as e:
+                result = {"filename": filename, "status": "failed", "error": e.detail, "status_code": e.status_code}
+        result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return result
+
+    return await asyncio.gather(*[generate_one(filename) for filename in filenames])
+
+async def generate_multi_view(filenames: List[str]) -> Dict[str, Any]:
+    timings: Dict[str, Any] = {}
+
+    # All digests known: the combined result may be cached without downloading anything
+    digests = [image_digests.get(filename) for filename in filenames]
+    if all(digests):
+        content_hash = sha256_hex("|".join(digest[0] for digest in digests).encode("utf-8"))
+        cached = get_cached_listing(content_hash, MULTI_VIEW_PROMPT, "listing_multi_view")
+        if cached is not None:
+            return {"listing": cached, "cached": True, "timings": timings}
+
+    started = time.perf_counter()
+    # Fetch and preprocess every image in parallel
+    images = await asyncio.gather(*[fetch_and_prepare_image(filename) for filename in filenames])
+    timings["fetch_and_prepare_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    timings["images"] = [
+        {"filename": filename, "bytes_sent": len(prepared.data), "preprocess_ms": round(prepared.preprocess_ms, 1)}
+        for filename, (_, prepared) in zip(filenames, images)
+    ]
+    for filename, (image_hash, prepared), digest in zip(filenames, images, digests):
+        if not digest or digest[0] != image_hash:
+            image_digests.record(filename, image_hash, prepared.phash)
+
+    content_hash = sha256_hex("|".join(image_hash for image_hash, _ in images).encode("utf-8"))
+    cached = get_cached_listing(content_hash, MULTI_VIEW_PROMPT, "listing_multi_view")
+    if cached is not None:
+        return {"listing": cached, "cached": True, "timings": timings}
+
+    choice = model_router.choose("listing_multi_view", listing_input_tokens(MULTI_VIEW_PROMPT, [prepared for _, prepared in images]))
+    started = time.perf_counter()
+    listing = await complete_listing_json(
+        [
+            {
+                "role": "user",
+                "content": [{"type": "text", "text": MULTI_VIEW_PROMPT}] + [prepared.content_part() for _, prepared in images]
+            }
+        ],
+        choice
+    )
+    timings["model_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    cache_listing(content_hash, MULTI_VIEW_PROMPT, choice, listing)
+    return {"listing": listing, "cached": False, "timings": timings}
+
+@router.post("/batch")
+async def generate_listing_batch(data: BatchListingRequest, ai_user: str = Depends(get_ai_user)):
+    """
+    Generate listings for several uploaded images. `per_item` runs one generation per image
+    concurrently; `multi_view` sends all images of one item in a single vision request.
+    Batch calls queue behind the caller's interactive requests and other users' turns.
+    """
+    ai_caller.set((ai_user, BATCH))
+    if not data.filenames:
+        raise HTTPException(status_code=400, detail="At least one filename is required")
+    max_images = GENERATE_MULTI_VIEW_MAX_IMAGES if data.mode == "multi_view" else GENERATE_BATCH_MAX_IMAGES
+    if len(data.filenames) > max_images:
+        raise HTTPException(status_code=400, detail=f"At most {max_images} images can be sent in {data.mode} mode")
+
+    started = time.perf_counter()
+    if data.mode == "multi_view":
+        result = await generate_multi_view(data.filenames)
+        result["mode"] = data.mode
+    else:
+        result = {"mode": data.mode, "results": await generate_per_item(data.filenames)}
+    result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return result
+
+def sse_event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@router.post("/stream")
+async def generate_listing_stream(data: ListingRequest, ai_user: str = Depends(get_ai_user)):
+    """
+    Server-Sent Events version of /generate/. Emits `title`, `description`, `category`
+    and `tags` events as soon as each field is complete, then `done` with the full
+    listing (or `error`).
+    """
+    ai_caller.set((ai_user, INTERACTIVE))
+    # Image problems are reported as regular HTTP errors, before the stream starts
+    image = await load_listing_image(data.filename)
+
+    async def events():
+        if image.cached is not None:
+            for name, value in image.cached.items():
+                yield sse_event(name, value)
+            yield sse_event("done", image.cached)
+            return
+
+        parser = JsonFieldStreamParser()
+        chunks = []
+        try:
+            choice = model_router.choose("listing_vision", listing_input_tokens(LISTING_PROMPT, [image.prepared]))
+            async for delta in model_router.chat_stream("listing_vision", listing_messages(image.prepared), choice=choice):
+                chunks.append(delta)
+                for name, value in parser.feed(delta):
+                    yield sse_event(name, value)
+        except HTTPException as e:
+            yield sse_event("error", {"status": e.status_code, "detail": e.detail})
+            return
+
+        parsed_json = extract_json_from_response("".join(chunks))
+        if not parsed_json:
+            yield sse_event("error", {"status": 500, "detail": "AI response was not valid JSON"})
+            return
+        cache_listing(image.image_hash, LISTING_PROMPT, choice, parsed_json, image.phash, ai_user)
+        yield sse_event("done", parsed_json)
 
-    return parsed_json
\ No newline at end of file
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
\ No newline at end of file
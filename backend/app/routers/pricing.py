@@ -1,34 +1,75 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
 from pydantic import BaseModel
-from openai import OpenAI
-import os
+from typing import Optional
+from app.services.ai_scheduler import INTERACTIVE, ai_caller, get_ai_user
+from app.services.model_router import estimate_text_tokens, model_router, truncate_to_tokens
+from app.utils.pricing import price_engine
+from app.utils.text import normalize_title
+from app.utils.ttl_cache import TTLCache
 from dotenv import load_dotenv
+import os
 
 load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 router = APIRouter(prefix="/price", tags=["Pricing"])
 
+PRICE_CACHE_TTL = float(os.getenv("PRICE_CACHE_TTL", "3600"))
+# Estimates per normalized title (and category), from comparables or the LLM
+price_cache = TTLCache(maxsize=10000, ttl=PRICE_CACHE_TTL)
+
 class PriceRequest(BaseModel):
     title: str
     description: str
+    category: Optional[str] = None
 
-@router.post("/")
-async def suggest_price(data: PriceRequest):
+# Room left in the price_text input budget for the instructions and title
+PRICE_PROMPT_RESERVED_TOKENS = 150
+
+async def estimate_price_with_llm(title: str, description: str) -> str:
+    # Long descriptions add latency and cost without improving a one-number answer
+    budget = model_router.route("price_text")["max_input_tokens"] - PRICE_PROMPT_RESERVED_TOKENS - estimate_text_tokens(title)
+    description = truncate_to_tokens(description, max(0, budget))
     prompt = (
         f"You're a pricing assistant for secondhand marketplaces like eBay and Craigslist. "
         f"Estimate a fair resale price for this item based on the title and description below. "
         f"Respond with just a number in USD — no currency symbol, no explanation.\n\n"
-        f"Title: {data.title}\n"
-        f"Description: {data.description}"
+        f"Title: {title}\n"
+        f"Description: {description}"
     )
 
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[{"role": "user", "content": prompt}],
-        max_tokens=10
+    response = await model_router.chat(
+        "price_text",
+        [{"role": "user", "content": prompt}],
+        input_tokens=estimate_text_tokens(prompt)
     )
+    return response.choices[0].message.content.strip()
+
+@router.post("/")
+async def suggest_price(data: PriceRequest, ai_user: str = Depends(get_ai_user)):
+    ai_caller.set((ai_user, INTERACTIVE))
+    key = (normalize_title(data.title), (data.category or "").strip().lower())
+    cached = price_cache.get(key) if key[0] else None
+    if cached:
+        return cached
+
+    # Comparable listings first; the LLM only when there isn't enough local evidence
+    estimate = await price_engine.estimate(data.title, data.category)
+    if estimate:
+        result = {
+            "price_estimate": f"{estimate.price:.2f}",
+            "source": "comparables",
+            "confidence": estimate.confidence,
+            "low": estimate.low,
+            "high": estimate.high,
+            "comparables": estimate.comparables
+        }
+    else:
+        result = {
+            "price_estimate": await estimate_price_with_llm(data.title, data.description),
+            "source": "llm",
+            "confidence": None
+        }
 
-    return {
-        "price_estimate": response.choices[0].message.content.strip()
-    }
+    if key[0]:
+        price_cache.set(key, result)
+    return result
@@ -0,0 +1,141 @@
+import os
+import time
+from typing import AsyncIterator, Callable, Optional
+import httpx
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from openai import APIError, APITimeoutError, AsyncOpenAI, DefaultAsyncHttpxClient
+from app.services.ai_scheduler import FairScheduler, ai_caller
+
+load_dotenv()
+
+# Maximum OpenAI calls in flight per worker; further calls queue per user for a slot
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "8"))
+# Per-call timeout in seconds (vision calls routinely take several seconds)
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "20"))
+
+
+class AIClient:
+    """
+    Process-wide async OpenAI client. All calls share one connection pool and take a slot
+    from a per-user fair scheduler, so one user's burst of vision requests cannot monopolise
+    the worker; time spent waiting for a slot is tracked separately from the OpenAI latency.
+    """
+
+    def __init__(self):
+        self._client: Optional[AsyncOpenAI] = None
+        self.scheduler = FairScheduler(OPENAI_MAX_CONCURRENCY)
+        self.waiting = 0
+        self.in_flight = 0
+        self.calls = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_latency = 0.0
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        if self._client is None:
+            self._client = AsyncOpenAI(
+                api_key=os.getenv("OPENAI_API_KEY"),
+                timeout=OPENAI_TIMEOUT,
+                max_retries=OPENAI_MAX_RETRIES,
+                http_client=DefaultAsyncHttpxClient(
+                    limits=httpx.Limits(
+                        max_connections=OPENAI_MAX_CONNECTIONS,
+                        max_keepalive_connections=OPENAI_MAX_CONNECTIONS
+                    )
+                )
+            )
+        return self._client
+
+    async def _acquire(self) -> str:
+        """Take a slot for the current caller (see `ai_caller`); returns the kind to release it with."""
+        user, kind = ai_caller.get()
+        self.waiting += 1
+        try:
+            wait = await self.scheduler.acquire(user, kind)
+        finally:
+            self.waiting -= 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        return kind
+
+    async def chat(self, timeout: Optional[float] = None, **kwargs):
+        """
+        Create a chat completion once a concurrency slot is free. Raises HTTPException 429
+        when the caller's queue is full; OpenAI failures are 504 on timeout, 502 otherwise.
+        """
+        kind = await self._acquire()
+        self.in_flight += 1
+        self.calls += 1
+        started = time.monotonic()
+        try:
+            return await self.client.chat.completions.create(timeout=timeout or OPENAI_TIMEOUT, **kwargs)
+        except APITimeoutError:
+            self.timeouts += 1
+            raise HTTPException(status_code=504, detail="AI request timed out")
+        except APIError as e:
+            self.failures += 1
+            raise HTTPException(status_code=502, detail=f"AI request failed: {e}")
+        finally:
+            self.total_latency += time.monotonic() - started
+            self.in_flight -= 1
+            self.scheduler.release(kind)
+
+    async def chat_stream(self, timeout: Optional[float] = None, on_usage: Optional[Callable] = None,
+                          **kwargs) -> AsyncIterator[str]:
+        """
+        Stream a chat completion, yielding content deltas. The concurrency slot is held until
+        the stream finishes or the consumer stops iterating. Errors are raised as in `chat`.
+        With `stream_options={"include_usage": True}`, the final chunk's token usage is
+        passed to `on_usage`.
+        """
+        kind = await self._acquire()
+        self.in_flight += 1
+        self.calls += 1
+        started = time.monotonic()
+        stream = None
+        try:
+            stream = await self.client.chat.completions.create(stream=True, timeout=timeout or OPENAI_TIMEOUT, **kwargs)
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+                if on_usage is not None and getattr(chunk, "usage", None) is not None:
+                    on_usage(chunk.usage)
+        except APITimeoutError:
+            self.timeouts += 1
+            raise HTTPException(status_code=504, detail="AI request timed out")
+        except APIError as e:
+            self.failures += 1
+            raise HTTPException(status_code=502, detail=f"AI request failed: {e}")
+        finally:
+            if stream is not None:
+                await stream.close()
+            self.total_latency += time.monotonic() - started
+            self.in_flight -= 1
+            self.scheduler.release(kind)
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+    def metrics(self) -> dict:
+        return {
+            "max_concurrency": OPENAI_MAX_CONCURRENCY,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "calls": self.calls,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "avg_queue_wait_seconds": round(self.total_wait / self.calls, 4) if self.calls else 0.0,
+            "max_queue_wait_seconds": round(self.max_wait, 4),
+            "avg_latency_seconds": round(self.total_latency / self.calls, 4) if self.calls else 0.0
+        }
+
+# Global instance
+ai_client = AIClient()
@@ -0,0 +1,151 @@
+import asyncio
+import os
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Deque, Dict, Optional, Tuple
+from fastapi import Depends, HTTPException, Request
+from fastapi.security import OAuth2PasswordBearer
+from app.auth.auth_handler import decode_token
+
+# Interactive requests (one listing, one price) are dispatched ahead of batch work by weight,
+# and batch work may never hold the last AI_INTERACTIVE_RESERVED_SLOTS slots
+AI_QUEUE_INTERACTIVE_WEIGHT = int(os.getenv("AI_QUEUE_INTERACTIVE_WEIGHT", "4"))
+AI_QUEUE_BATCH_WEIGHT = int(os.getenv("AI_QUEUE_BATCH_WEIGHT", "1"))
+AI_INTERACTIVE_RESERVED_SLOTS = int(os.getenv("AI_INTERACTIVE_RESERVED_SLOTS", "2"))
+# Waiting requests beyond these depths are rejected with 429
+AI_QUEUE_MAX_PER_USER = int(os.getenv("AI_QUEUE_MAX_PER_USER", "25"))
+AI_QUEUE_MAX_DEPTH = int(os.getenv("AI_QUEUE_MAX_DEPTH", "200"))
+# Queue waits kept for the p95 in metrics
+AI_QUEUE_WAIT_SAMPLES = 1000
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+KIND_WEIGHTS = {INTERACTIVE: AI_QUEUE_INTERACTIVE_WEIGHT, BATCH: AI_QUEUE_BATCH_WEIGHT}
+
+# (user, kind) of the request currently being handled; set by the AI endpoints
+ai_caller: ContextVar[Tuple[str, str]] = ContextVar("ai_caller", default=("anonymous", INTERACTIVE))
+
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login", auto_error=False)
+
+def get_ai_user(request: Request, token: Optional[str] = Depends(optional_oauth2_scheme)) -> str:
+    """Who an AI request is queued for: the token's user when signed in, otherwise the client IP."""
+    if token:
+        try:
+            return f"user:{decode_token(token)['sub']}"
+        except Exception:
+            pass
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+
+class FairScheduler:
+    """
+    Hands out AI concurrency slots across per-user queues. Each (user, kind) flow has a FIFO
+    queue and a weight; free slots go to flows by smooth weighted round-robin, so a user with
+    a long batch only gets their share and a single interactive request goes out almost
+    immediately.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.flows: Dict[Tuple[str, str], Deque[asyncio.Future]] = {}
+        # Smooth weighted round-robin credit per flow
+        self.credit: Dict[Tuple[str, str], int] = {}
+        self.in_flight = {INTERACTIVE: 0, BATCH: 0}
+        self.queued = 0
+        self.dispatched = {INTERACTIVE: 0, BATCH: 0}
+        self.rejected = {INTERACTIVE: 0, BATCH: 0}
+        self.total_wait = {INTERACTIVE: 0.0, BATCH: 0.0}
+        self.waits = {INTERACTIVE: deque(maxlen=AI_QUEUE_WAIT_SAMPLES), BATCH: deque(maxlen=AI_QUEUE_WAIT_SAMPLES)}
+
+    def _can_run(self, kind: str) -> bool:
+        running = self.in_flight[INTERACTIVE] + self.in_flight[BATCH]
+        if kind == BATCH:
+            return running < self.capacity and self.in_flight[BATCH] < max(1, self.capacity - AI_INTERACTIVE_RESERVED_SLOTS)
+        return running < self.capacity
+
+    def _dispatch(self):
+        while True:
+            eligible = [flow for flow, queue in self.flows.items() if queue and self._can_run(flow[1])]
+            if not eligible:
+                return
+            total = 0
+            for flow in eligible:
+                weight = KIND_WEIGHTS[flow[1]]
+                self.credit[flow] = self.credit.get(flow, 0) + weight
+                total += weight
+            flow = max(eligible, key=lambda f: self.credit[f])
+            self.credit[flow] -= total
+
+            future = self.flows[flow].popleft()
+            self.queued -= 1
+            if not self.flows[flow]:
+                del self.flows[flow]
+                self.credit.pop(flow, None)
+            self.in_flight[flow[1]] += 1
+            future.set_result(None)
+
+    async def acquire(self, user: str, kind: str = INTERACTIVE) -> float:
+        """Wait for a slot on behalf of `user`; returns seconds waited. Raises 429 when the queue is full."""
+        flow = (user, kind)
+        queue = self.flows.get(flow)
+        user_queued = sum(len(q) for (u, _), q in self.flows.items() if u == user)
+        if self.queued >= AI_QUEUE_MAX_DEPTH or user_queued >= AI_QUEUE_MAX_PER_USER:
+            self.rejected[kind] += 1
+            raise HTTPException(
+                status_code=429,
+                detail="Too many AI requests queued, try again shortly",
+                headers={"Retry-After": "5"}
+            )
+
+        future = asyncio.get_running_loop().create_future()
+        if queue is None:
+            queue = self.flows[flow] = deque()
+        queue.append(future)
+        self.queued += 1
+        queued_at = time.monotonic()
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Got the slot just as the caller went away
+                self.release(kind)
+            elif future in self.flows.get(flow, ()):
+                self.flows[flow].remove(future)
+                self.queued -= 1
+                if not self.flows[flow]:
+                    del self.flows[flow]
+                    self.credit.pop(flow, None)
+            raise
+
+        wait = time.monotonic() - queued_at
+        self.dispatched[kind] += 1
+        self.total_wait[kind] += wait
+        self.waits[kind].append(wait)
+        return wait
+
+    def release(self, kind: str = INTERACTIVE):
+        self.in_flight[kind] -= 1
+        self._dispatch()
+
+    def metrics(self) -> dict:
+        def wait_stats(kind: str) -> dict:
+            waits = sorted(self.waits[kind])
+            return {
+                "dispatched": self.dispatched[kind],
+                "rejected": self.rejected[kind],
+                "in_flight": self.in_flight[kind],
+                "avg_wait_seconds": round(self.total_wait[kind] / self.dispatched[kind], 4) if self.dispatched[kind] else 0.0,
+                "p95_wait_seconds": round(waits[min(len(waits) - 1, int(0.95 * len(waits)))], 4) if waits else 0.0
+            }
+
+        return {
+            "capacity": self.capacity,
+            "queued": self.queued,
+            "max_depth": AI_QUEUE_MAX_DEPTH,
+            "max_per_user": AI_QUEUE_MAX_PER_USER,
+            "queued_by_user": {f"{user} ({kind})": len(queue) for (user, kind), queue in self.flows.items()},
+            INTERACTIVE: wait_stats(INTERACTIVE),
+            BATCH: wait_stats(BATCH)
+        }
@@ -0,0 +1,96 @@
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from sqlmodel import select
+from app.db import get_session
+from app.models.ebay_oauth_db import EbayOAuth
+from app.routers.ebay_oauth import refresh_ebay_token
+
+# Refresh tokens this many seconds before they expire (eBay user tokens live ~2 hours)
+EBAY_TOKEN_REFRESH_MARGIN = int(os.getenv("EBAY_TOKEN_REFRESH_MARGIN", "900"))
+EBAY_TOKEN_REFRESH_INTERVAL = float(os.getenv("EBAY_TOKEN_REFRESH_INTERVAL", "60"))
+EBAY_TOKEN_REFRESH_BATCH_SIZE = int(os.getenv("EBAY_TOKEN_REFRESH_BATCH_SIZE", "20"))
+# Wait this long before retrying a user whose refresh failed (e.g. revoked consent)
+EBAY_TOKEN_REFRESH_FAILURE_BACKOFF = float(os.getenv("EBAY_TOKEN_REFRESH_FAILURE_BACKOFF", "900"))
+
+
+class EbayTokenRefresher:
+    """
+    Background scheduler that renews eBay access tokens before they expire, in
+    concurrent batches across users, so request handlers only read valid cached tokens.
+    """
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self._retry_after: Dict[str, float] = {}
+        self.refreshed = 0
+        self.failed = 0
+        self.last_run_at: Optional[datetime] = None
+        self.last_due = 0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            print("[DEBUG] Started eBay token refresher")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def _due_users(self) -> List[str]:
+        refresh_before = datetime.utcnow() + timedelta(seconds=EBAY_TOKEN_REFRESH_MARGIN)
+        with get_session() as session:
+            users = session.exec(
+                select(EbayOAuth.user_id)
+                .where(EbayOAuth.expires_at < refresh_before)
+                .order_by(EbayOAuth.expires_at)
+            ).all()
+        now = time.monotonic()
+        return [user for user in users if self._retry_after.get(user, 0) <= now]
+
+    async def _refresh_one(self, user: str):
+        try:
+            await refresh_ebay_token(user)
+            self._retry_after.pop(user, None)
+            self.refreshed += 1
+        except Exception as e:
+            print(f"[DEBUG] Background eBay token refresh failed for user {user}: {e}")
+            self._retry_after[user] = time.monotonic() + EBAY_TOKEN_REFRESH_FAILURE_BACKOFF
+            self.failed += 1
+
+    async def run_once(self):
+        """Refresh every token that expires within the margin, one batch at a time."""
+        users = self._due_users()
+        self.last_due = len(users)
+        self.last_run_at = datetime.utcnow()
+        for start in range(0, len(users), EBAY_TOKEN_REFRESH_BATCH_SIZE):
+            batch = users[start:start + EBAY_TOKEN_REFRESH_BATCH_SIZE]
+            await asyncio.gather(*[self._refresh_one(user) for user in batch])
+        if users:
+            print(f"[DEBUG] Background refresh handled {len(users)} eBay tokens")
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"[DEBUG] eBay token refresher run failed: {e}")
+            await asyncio.sleep(EBAY_TOKEN_REFRESH_INTERVAL)
+
+    def metrics(self) -> dict:
+        return {
+            "refresh_margin_seconds": EBAY_TOKEN_REFRESH_MARGIN,
+            "interval_seconds": EBAY_TOKEN_REFRESH_INTERVAL,
+            "last_run_at": self.last_run_at.isoformat() if self.last_run_at else None,
+            "last_due": self.last_due,
+            "refreshed_total": self.refreshed,
+            "failed_total": self.failed,
+            "backing_off": len(self._retry_after)
+        }
+
+# Global instance
+token_refresher = EbayTokenRefresher()
@@ -0,0 +1,218 @@
+import json
+import math
+import os
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, List, Optional
+from fastapi import HTTPException
+from app.services.ai import ai_client
+
+# Per request type: the preferred model, the cheaper/faster model used when the preferred
+# one breaches its p95 latency SLO, token budgets and the SLO itself. `tiers` send inputs
+# up to a size to a cheaper model (first match wins); larger inputs go to the primary.
+# Override with MODEL_ROUTES, e.g. '{"price_text": {"primary": "gpt-4o-mini", "tiers": []}}'.
+DEFAULT_MODEL_ROUTES = {
+    "listing_vision": {
+        "primary": "gpt-4o", "fallback": "gpt-4o-mini", "max_input_tokens": 4000, "max_output_tokens": 600, "slo_p95_seconds": 15,
+        # A prompt plus one low-detail or <=512px image: little for the larger model to add
+        "tiers": [{"max_input_tokens": 400, "model": "gpt-4o-mini"}]
+    },
+    "listing_multi_view": {
+        "primary": "gpt-4o", "fallback": "gpt-4o-mini", "max_input_tokens": 12000, "max_output_tokens": 700, "slo_p95_seconds": 25,
+        "tiers": []
+    },
+    "price_text": {
+        "primary": "gpt-4o", "fallback": "gpt-4o-mini", "max_input_tokens": 1000, "max_output_tokens": 10, "slo_p95_seconds": 4,
+        # Title and a short description; only long, detailed descriptions go to the primary
+        "tiers": [{"max_input_tokens": 300, "model": "gpt-4o-mini"}]
+    },
+}
+# Latency samples older than this don't count towards p95
+MODEL_LATENCY_WINDOW = float(os.getenv("MODEL_LATENCY_WINDOW", "300"))
+# p95 needs at least this many samples before it can trigger a downgrade
+MODEL_LATENCY_MIN_SAMPLES = int(os.getenv("MODEL_LATENCY_MIN_SAMPLES", "20"))
+# How long to stay on the fallback model before trying the primary again
+MODEL_DEGRADE_SECONDS = float(os.getenv("MODEL_DEGRADE_SECONDS", "120"))
+
+
+def _load_routes() -> Dict[str, Dict]:
+    routes = {name: dict(config) for name, config in DEFAULT_MODEL_ROUTES.items()}
+    overrides = os.getenv("MODEL_ROUTES")
+    if overrides:
+        try:
+            for name, config in json.loads(overrides).items():
+                routes.setdefault(name, dict(DEFAULT_MODEL_ROUTES["listing_vision"])).update(config)
+        except (ValueError, AttributeError) as e:
+            print(f"[DEBUG] Ignoring invalid MODEL_ROUTES: {e}")
+    return routes
+
+
+def estimate_text_tokens(text: str) -> int:
+    """Rough token count for English text (about four characters per token)."""
+    return math.ceil(len(text or "") / 4)
+
+
+def estimate_image_tokens(width: Optional[int], height: Optional[int], detail: str) -> int:
+    """OpenAI's vision token cost: 85 base plus 170 per 512px tile after scaling to fit 2048 and 768 short side."""
+    if detail == "low" or not width or not height:
+        return 85
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut `text` to roughly `max_tokens` tokens."""
+    max_chars = max_tokens * 4
+    return text if len(text) <= max_chars else text[:max_chars]
+
+
+class ModelStats:
+    def __init__(self):
+        self.samples: deque = deque()
+        self.calls = 0
+        self.failures = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def record(self, latency: float, usage=None):
+        now = time.monotonic()
+        self.samples.append((now, latency))
+        self.calls += 1
+        if usage is not None:
+            self.prompt_tokens += usage.prompt_tokens or 0
+            self.completion_tokens += usage.completion_tokens or 0
+        self._prune(now)
+
+    def _prune(self, now: float):
+        while self.samples and self.samples[0][0] < now - MODEL_LATENCY_WINDOW:
+            self.samples.popleft()
+
+    def percentile(self, q: float) -> Optional[float]:
+        self._prune(time.monotonic())
+        if not self.samples:
+            return None
+        latencies = sorted(latency for _, latency in self.samples)
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+
+@dataclass
+class ModelChoice:
+    request_type: str
+    model: str
+    max_tokens: int
+    degraded: bool
+    tier: str  # "small" when a size tier picked the model, otherwise "primary"
+
+
+class ModelRouter:
+    """
+    Picks the model and token budget for each AI request type and input size, records
+    latency and token usage per model, and routes to the fallback model while the primary
+    breaches its p95 SLO.
+    """
+
+    def __init__(self):
+        self.routes = _load_routes()
+        self.stats: Dict[str, ModelStats] = {}
+        # request type -> monotonic time until which the fallback model is used
+        self.degraded_until: Dict[str, float] = {}
+
+    def _stats(self, model: str) -> ModelStats:
+        return self.stats.setdefault(model, ModelStats())
+
+    def route(self, request_type: str) -> Dict:
+        return self.routes[request_type]
+
+    def normal_models(self, request_type: str) -> List[str]:
+        """Models `request_type` is answered by when not degraded: the size tiers' models, then the primary."""
+        route = self.routes[request_type]
+        models = [tier["model"] for tier in route.get("tiers", [])] + [route["primary"]]
+        return list(dict.fromkeys(models))
+
+    def choose(self, request_type: str, input_tokens: int = 0) -> ModelChoice:
+        """Model for the next `request_type` call; raises 413 when the input is over the route's budget."""
+        route = self.routes[request_type]
+        if input_tokens > route["max_input_tokens"]:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Input of ~{input_tokens} tokens exceeds the {route['max_input_tokens']} token budget for {request_type}"
+            )
+        # Without a size estimate, use the primary rather than guess small
+        if input_tokens:
+            for tier in route.get("tiers", []):
+                if input_tokens <= tier["max_input_tokens"]:
+                    return ModelChoice(request_type, tier["model"], route["max_output_tokens"], False, "small")
+
+        degraded = time.monotonic() < self.degraded_until.get(request_type, 0)
+        if not degraded and route["fallback"] != route["primary"]:
+            stats = self._stats(route["primary"])
+            p95 = stats.percentile(0.95)
+            if p95 is not None and len(stats.samples) >= MODEL_LATENCY_MIN_SAMPLES and p95 > route["slo_p95_seconds"]:
+                print(f"[DEBUG] {route['primary']} p95 {p95:.1f}s breaches {request_type} SLO, using {route['fallback']}")
+                self.degraded_until[request_type] = time.monotonic() + MODEL_DEGRADE_SECONDS
+                # Start the primary's next trial with a clean window
+                stats.samples.clear()
+                degraded = True
+        model = route["fallback"] if degraded else route["primary"]
+        return ModelChoice(request_type, model, route["max_output_tokens"], degraded, "primary")
+
+    async def chat(self, request_type: str, messages, input_tokens: int = 0, choice: Optional[ModelChoice] = None, **kwargs):
+        """Run a chat completion on the model chosen for `request_type` (or on `choice`, from choose())."""
+        choice = choice or self.choose(request_type, input_tokens)
+        stats = self._stats(choice.model)
+        started = time.monotonic()
+        try:
+            response = await ai_client.chat(model=choice.model, messages=messages, max_tokens=choice.max_tokens, **kwargs)
+        except Exception:
+            stats.failures += 1
+            raise
+        stats.record(time.monotonic() - started, getattr(response, "usage", None))
+        return response
+
+    async def chat_stream(self, request_type: str, messages, input_tokens: int = 0, choice: Optional[ModelChoice] = None,
+                          **kwargs) -> AsyncIterator[str]:
+        choice = choice or self.choose(request_type, input_tokens)
+        stats = self._stats(choice.model)
+        started = time.monotonic()
+        usage = []
+        try:
+            async for delta in ai_client.chat_stream(
+                model=choice.model,
+                messages=messages,
+                max_tokens=choice.max_tokens,
+                stream_options={"include_usage": True},
+                on_usage=usage.append,
+                **kwargs
+            ):
+                yield delta
+        except Exception:
+            stats.failures += 1
+            raise
+        stats.record(time.monotonic() - started, usage[-1] if usage else None)
+
+    def metrics(self) -> dict:
+        now = time.monotonic()
+        return {
+            "routes": {
+                name: {**route, "degraded": now < self.degraded_until.get(name, 0)}
+                for name, route in self.routes.items()
+            },
+            "models": {
+                model: {
+                    "calls": stats.calls,
+                    "failures": stats.failures,
+                    "p50_seconds": stats.percentile(0.5),
+                    "p95_seconds": stats.percentile(0.95),
+                    "prompt_tokens": stats.prompt_tokens,
+                    "completion_tokens": stats.completion_tokens
+                }
+                for model, stats in self.stats.items()
+            }
+        }
+
+# Global instance
+model_router = ModelRouter()
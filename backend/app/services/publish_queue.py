@@ -0,0 +1,199 @@
+import asyncio
+import json
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, List, Optional
+from fastapi import HTTPException
+from sqlalchemy import and_, func, or_
+from sqlmodel import Session, select
+from app.db import get_session
+from app.models.publish_job_db import PublishJob
+
+# Publish queue configuration
+PUBLISH_WORKER_CONCURRENCY = int(os.getenv("PUBLISH_WORKER_CONCURRENCY", "4"))
+PUBLISH_POLL_INTERVAL = float(os.getenv("PUBLISH_POLL_INTERVAL", "2"))
+PUBLISH_MAX_ATTEMPTS = int(os.getenv("PUBLISH_MAX_ATTEMPTS", "3"))
+PUBLISH_JOB_LEASE_SECONDS = int(os.getenv("PUBLISH_JOB_LEASE_SECONDS", "600"))
+
+JobHandler = Callable[[PublishJob], Awaitable[None]]
+FailureHandler = Callable[[PublishJob, Exception], None]
+
+
+class PublishQueue:
+    """
+    Durable marketplace publish queue backed by the `publishjob` table.
+    Endpoints enqueue jobs in the same transaction as the listing row; a pool of
+    asyncio workers claims queued jobs and drives the marketplace publish steps.
+    """
+
+    def __init__(self, concurrency: int = PUBLISH_WORKER_CONCURRENCY):
+        self.concurrency = concurrency
+        self._workers: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._handler: Optional[JobHandler] = None
+        self._on_failure: Optional[FailureHandler] = None
+        self._running = False
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.retried = 0
+
+    def enqueue(self, session: Session, listing_id: str, owner: str, payload: dict, marketplace: str = "eBay") -> PublishJob:
+        """
+        Add a publish job to the caller's session. The job is only visible to workers
+        once the caller commits, so the listing row and its job land atomically.
+        """
+        job = PublishJob(
+            id=str(uuid.uuid4()),
+            listing_id=listing_id,
+            owner=owner,
+            marketplace=marketplace,
+            payload=json.dumps(payload)
+        )
+        session.add(job)
+        return job
+
+    def notify(self):
+        """Wake idle workers after a commit instead of waiting for the next poll."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def start(self, handler: JobHandler, on_failure: Optional[FailureHandler] = None):
+        if self._running:
+            return
+        self._handler = handler
+        self._on_failure = on_failure
+        self._wakeup = asyncio.Event()
+        self._running = True
+        self._workers = [asyncio.create_task(self._worker(i)) for i in range(self.concurrency)]
+        print(f"[DEBUG] Started {self.concurrency} publish queue workers")
+
+    async def stop(self):
+        self._running = False
+        self.notify()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def _claim_next_job(self) -> Optional[PublishJob]:
+        """
+        Atomically move the oldest runnable job to `running`. Jobs left `running` past
+        their lease (e.g. the worker process died) are picked up again.
+        """
+        now = datetime.utcnow()
+        lease_expired = now - timedelta(seconds=PUBLISH_JOB_LEASE_SECONDS)
+        with get_session() as session:
+            job = session.exec(
+                select(PublishJob)
+                .where(or_(
+                    and_(PublishJob.status == "queued", PublishJob.available_at <= now),
+                    and_(PublishJob.status == "running", PublishJob.updated_at < lease_expired)
+                ))
+                .order_by(PublishJob.available_at)
+                .limit(1)
+                .with_for_update(skip_locked=True)
+            ).first()
+            if not job:
+                return None
+            job.status = "running"
+            job.attempts += 1
+            job.updated_at = now
+            session.add(job)
+            session.commit()
+            session.refresh(job)
+            return job
+
+    def _finish_job(self, job_id: str, status: str, error: Optional[str] = None, retry_in: Optional[float] = None):
+        with get_session() as session:
+            job = session.get(PublishJob, job_id)
+            if not job:
+                return
+            job.status = status
+            job.last_error = error
+            job.updated_at = datetime.utcnow()
+            if retry_in is not None:
+                job.available_at = job.updated_at + timedelta(seconds=retry_in)
+            session.add(job)
+            session.commit()
+
+    def record_offer(self, job: PublishJob, offer_id: str):
+        """Save the eBay offer created for `job`, so a retried attempt resumes from it."""
+        job.offer_id = offer_id
+        with get_session() as session:
+            row = session.get(PublishJob, job.id)
+            if not row:
+                return
+            row.offer_id = offer_id
+            row.updated_at = datetime.utcnow()
+            session.add(row)
+            session.commit()
+
+    async def _run_job(self, job: PublishJob):
+        self.in_flight += 1
+        try:
+            await self._handler(job)
+            self._finish_job(job.id, "done")
+            self.completed += 1
+        except Exception as e:
+            # Client errors (bad payload, missing policies, no eBay auth) will not succeed on retry
+            permanent = isinstance(e, HTTPException) and e.status_code < 500
+            error = e.detail if isinstance(e, HTTPException) else str(e)
+            if not permanent and job.attempts < PUBLISH_MAX_ATTEMPTS:
+                retry_in = 2 ** job.attempts
+                print(f"[DEBUG] Publish job {job.id} failed (attempt {job.attempts}), retrying in {retry_in}s: {error}")
+                self._finish_job(job.id, "queued", str(error), retry_in=retry_in)
+                self.retried += 1
+            else:
+                print(f"[DEBUG] Publish job {job.id} failed permanently: {error}")
+                self._finish_job(job.id, "failed", str(error))
+                self.failed += 1
+                if self._on_failure:
+                    try:
+                        self._on_failure(job, e)
+                    except Exception as failure_error:
+                        print(f"[DEBUG] Publish job {job.id} failure handler raised: {failure_error}")
+        finally:
+            self.in_flight -= 1
+
+    async def _worker(self, worker_id: int):
+        while self._running:
+            try:
+                job = self._claim_next_job()
+            except Exception as e:
+                print(f"[DEBUG] Publish worker {worker_id} failed to claim job: {e}")
+                job = None
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=PUBLISH_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run_job(job)
+
+    def metrics(self) -> dict:
+        """Queue depth by status plus worker counters."""
+        with get_session() as session:
+            counts = dict(session.exec(
+                select(PublishJob.status, func.count()).group_by(PublishJob.status)
+            ).all())
+            oldest_queued = session.exec(
+                select(func.min(PublishJob.created_at)).where(PublishJob.status == "queued")
+            ).first()
+        return {
+            "queue_depth": counts.get("queued", 0),
+            "running": counts.get("running", 0),
+            "done": counts.get("done", 0),
+            "failed": counts.get("failed", 0),
+            "oldest_queued_age_seconds": (datetime.utcnow() - oldest_queued).total_seconds() if oldest_queued else 0,
+            "workers": self.concurrency,
+            "in_flight": self.in_flight,
+            "completed_total": self.completed,
+            "failed_total": self.failed,
+            "retried_total": self.retried
+        }
+
+# Global instance
+publish_queue = PublishQueue()
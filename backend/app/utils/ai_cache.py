@@ -0,0 +1,182 @@
+import hashlib
+import io
+import json
+import os
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Optional, Tuple
+from sqlalchemy import delete
+from app.db import get_session
+from app.models.ai_cache_db import AIResultCacheEntry, ImageDigest
+from app.utils.ttl_cache import TTLCache
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Perceptual hashing is optional; exact SHA-256 matching still works
+    Image = None
+
+AI_CACHE_SIZE = int(os.getenv("AI_CACHE_SIZE", "5000"))
+AI_CACHE_DB_TTL_DAYS = int(os.getenv("AI_CACHE_DB_TTL_DAYS", "30"))
+# Maximum differing bits between two perceptual hashes to treat images as the same item
+AI_CACHE_PHASH_DISTANCE = int(os.getenv("AI_CACHE_PHASH_DISTANCE", "4"))
+
+
+def sha256_hex(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def perceptual_hash(image_bytes: bytes) -> Optional[str]:
+    """64-bit difference hash of an image, or None if Pillow is missing or the image can't be read."""
+    if Image is None:
+        return None
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            # Hash the upright image, as the vision preprocessor does, so rotated photos still match
+            return perceptual_hash_image(ImageOps.exif_transpose(image))
+    except Exception as e:
+        print(f"[DEBUG] Could not compute perceptual hash: {e}")
+        return None
+
+
+def perceptual_hash_image(image: "Image.Image") -> str:
+    """Difference hash of an already decoded image; callers apply EXIF orientation first."""
+    pixels = list(image.convert("L").resize((9, 8)).getdata())
+    bits = 0
+    for row in range(8):
+        for column in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + column] > pixels[row * 9 + column + 1])
+    return f"{bits:016x}"
+
+
+class ImageDigestStore:
+    """Uploaded filename -> (sha256, phash), so cached results can be found without downloading the image."""
+
+    def __init__(self):
+        self._memory = TTLCache(maxsize=AI_CACHE_SIZE)
+
+    def get(self, filename: str) -> Optional[Tuple[str, Optional[str]]]:
+        digest = self._memory.get(filename)
+        if digest:
+            return digest
+        with get_session() as session:
+            entry = session.get(ImageDigest, filename)
+            digest = (entry.sha256, entry.phash) if entry else None
+        if digest:
+            self._memory.set(filename, digest)
+        return digest
+
+    def record(self, filename: str, sha256: str, phash: Optional[str]):
+        self._memory.set(filename, (sha256, phash))
+        try:
+            with get_session() as session:
+                session.merge(ImageDigest(filename=filename, sha256=sha256, phash=phash))
+                session.commit()
+        except Exception as e:
+            print(f"[DEBUG] Failed to persist image digest for {filename}: {e}")
+
+    def forget(self, filename: str):
+        self._memory.invalidate(filename)
+        with get_session() as session:
+            entry = session.get(ImageDigest, filename)
+            if entry:
+                session.delete(entry)
+                session.commit()
+
+
+class AIResultCache:
+    """
+    Model outputs keyed by the SHA-256 of their inputs and the prompt version, in a bounded
+    LRU in front of the `airesultcacheentry` table. Entries written under another prompt
+    version are never returned. Recent perceptual hashes are kept in memory, per owner, so
+    a re-shot of the same item can reuse the same owner's earlier result.
+    """
+
+    def __init__(self):
+        self._memory = TTLCache(maxsize=AI_CACHE_SIZE)
+        # (owner, prompt version, phash) -> content hash
+        self._phashes: "OrderedDict[Tuple[str, str, int], str]" = OrderedDict()
+        self.db_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+
+    def get(self, content_hash: str, prompt_version: str, owner: Optional[str] = None) -> Optional[Any]:
+        key = (content_hash, prompt_version)
+        result = self._memory.get(key)
+        if result is not None:
+            return result
+
+        cutoff = datetime.utcnow() - timedelta(days=AI_CACHE_DB_TTL_DAYS)
+        with get_session() as session:
+            entry = session.get(AIResultCacheEntry, key)
+            result = json.loads(entry.result) if entry and entry.created_at > cutoff else None
+            phash = entry.phash if entry else None
+
+        if result is None:
+            self.misses += 1
+            return None
+        self.db_hits += 1
+        self._remember(content_hash, prompt_version, result, phash, owner)
+        return result
+
+    def find_similar(self, phash: Optional[str], prompt_version: str, owner: str) -> Optional[Any]:
+        """
+        Result for an image `owner` recently had analyzed whose perceptual hash is within
+        AI_CACHE_PHASH_DISTANCE bits. Other owners' images are never matched.
+        """
+        if not phash:
+            return None
+        target = int(phash, 16)
+        for (image_owner, version, candidate), content_hash in reversed(self._phashes.items()):
+            if image_owner == owner and version == prompt_version and bin(candidate ^ target).count("1") <= AI_CACHE_PHASH_DISTANCE:
+                result = self.get(content_hash, prompt_version)
+                if result is not None:
+                    self.similar_hits += 1
+                    return result
+        return None
+
+    def _remember(self, content_hash: str, prompt_version: str, result: Any, phash: Optional[str], owner: Optional[str]):
+        self._memory.set((content_hash, prompt_version), result)
+        if phash and owner:
+            key = (owner, prompt_version, int(phash, 16))
+            self._phashes[key] = content_hash
+            self._phashes.move_to_end(key)
+            while len(self._phashes) > AI_CACHE_SIZE:
+                self._phashes.popitem(last=False)
+
+    def set(self, content_hash: str, prompt_version: str, result: Any, phash: Optional[str] = None, owner: Optional[str] = None):
+        self._remember(content_hash, prompt_version, result, phash, owner)
+        try:
+            with get_session() as session:
+                session.merge(AIResultCacheEntry(
+                    content_hash=content_hash,
+                    prompt_version=prompt_version,
+                    phash=phash,
+                    result=json.dumps(result)
+                ))
+                session.commit()
+        except Exception as e:
+            print(f"[DEBUG] Failed to persist AI result for {content_hash[:12]}: {e}")
+
+    def purge_expired(self):
+        """Delete rows past AI_CACHE_DB_TTL_DAYS, including those left behind by old prompt versions."""
+        cutoff = datetime.utcnow() - timedelta(days=AI_CACHE_DB_TTL_DAYS)
+        with get_session() as session:
+            session.execute(delete(AIResultCacheEntry).where(AIResultCacheEntry.created_at < cutoff))
+            session.commit()
+
+    def stats(self) -> dict:
+        memory = self._memory.stats()
+        lookups = memory["hits"] + self.db_hits + self.misses
+        return {
+            "memory_size": memory["size"],
+            "memory_hits": memory["hits"],
+            "db_hits": self.db_hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "hit_rate": round((memory["hits"] + self.db_hits) / lookups, 4) if lookups else 0.0,
+            "perceptual_hashing": Image is not None
+        }
+
+# Global instances
+image_digests = ImageDigestStore()
+ai_result_cache = AIResultCache()
@@ -0,0 +1,87 @@
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+from app.db import get_session
+from app.models.category_cache_db import CategoryCacheEntry
+from app.utils.text import normalize_title
+from app.utils.ttl_cache import TTLCache
+
+CATEGORY_CACHE_SIZE = int(os.getenv("CATEGORY_CACHE_SIZE", "50000"))
+CATEGORY_CACHE_TTL = float(os.getenv("CATEGORY_CACHE_TTL", "86400"))
+CATEGORY_CACHE_DB_TTL_DAYS = int(os.getenv("CATEGORY_CACHE_DB_TTL_DAYS", "30"))
+
+
+class CategoryResolutionCache:
+    """
+    Two-tier normalized-title -> eBay category ID cache: an in-process LRU with TTL
+    in front of the `categorycacheentry` table, so near-identical titles resolve
+    without calling eBay.
+    """
+
+    def __init__(self):
+        self._memory = TTLCache(maxsize=CATEGORY_CACHE_SIZE, ttl=CATEGORY_CACHE_TTL)
+        self.db_hits = 0
+        self.misses = 0
+
+    def get(self, title: str) -> Optional[str]:
+        key = normalize_title(title)
+        if not key:
+            return None
+        category_id = self._memory.get(key)
+        if category_id:
+            return category_id
+
+        with get_session() as session:
+            entry = session.get(CategoryCacheEntry, key)
+            fresh = entry and entry.updated_at > datetime.utcnow() - timedelta(days=CATEGORY_CACHE_DB_TTL_DAYS)
+            category_id = entry.category_id if fresh else None
+
+        if category_id:
+            self.db_hits += 1
+            self._memory.set(key, category_id)
+        else:
+            self.misses += 1
+        return category_id
+
+    def set(self, title: str, category_id: str, source: str):
+        key = normalize_title(title)
+        if not key or not category_id:
+            return
+        self._memory.set(key, category_id)
+        try:
+            with get_session() as session:
+                entry = session.get(CategoryCacheEntry, key)
+                if entry:
+                    entry.category_id = category_id
+                    entry.source = source
+                    entry.updated_at = datetime.utcnow()
+                else:
+                    entry = CategoryCacheEntry(normalized_title=key, category_id=category_id, source=source)
+                session.add(entry)
+                session.commit()
+        except Exception as e:
+            # A concurrent insert of the same title is harmless; the memory tier is already set
+            print(f"[DEBUG] Failed to persist category cache entry for '{key}': {e}")
+
+    def invalidate(self, title: str):
+        key = normalize_title(title)
+        self._memory.invalidate(key)
+        with get_session() as session:
+            entry = session.get(CategoryCacheEntry, key)
+            if entry:
+                session.delete(entry)
+                session.commit()
+
+    def stats(self) -> dict:
+        memory = self._memory.stats()
+        lookups = memory["hits"] + self.db_hits + self.misses
+        return {
+            "memory_size": memory["size"],
+            "memory_hits": memory["hits"],
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_rate": round((memory["hits"] + self.db_hits) / lookups, 4) if lookups else 0.0
+        }
+
+# Global instance
+category_cache = CategoryResolutionCache()
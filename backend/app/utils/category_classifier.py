@@ -0,0 +1,251 @@
+import os
+import zlib
+from typing import List, Optional, Sequence, Tuple
+import numpy as np
+from app.utils.text import stemmed_tokens
+
+CATEGORY_CLASSIFIER_PATH = os.getenv("CATEGORY_CLASSIFIER_PATH", "category_classifier.npz")
+# Hashed feature space; weights take n_features x n_classes float16 values on disk
+CATEGORY_CLASSIFIER_FEATURES = int(os.getenv("CATEGORY_CLASSIFIER_FEATURES", str(2 ** 16)))
+# Categories need at least this many published listings to become a class
+CATEGORY_CLASSIFIER_MIN_EXAMPLES = int(os.getenv("CATEGORY_CLASSIFIER_MIN_EXAMPLES", "3"))
+
+# Title words say more about the category than description words
+TITLE_WEIGHT = 2.0
+
+
+def _features(title: str, description: str = "") -> List[Tuple[str, float]]:
+    features = []
+    for text, weight in ((title, TITLE_WEIGHT), (description, 1.0)):
+        tokens = stemmed_tokens(text)
+        features.extend((token, weight) for token in tokens)
+        features.extend((f"{a} {b}", weight) for a, b in zip(tokens, tokens[1:]))
+    return features
+
+
+class CsrBatch:
+    """Minimal CSR sparse matrix: the rows of a batch of hashed term-frequency vectors."""
+
+    def __init__(self, indices: np.ndarray, data: np.ndarray, indptr: np.ndarray):
+        self.indices = indices
+        self.data = data
+        self.indptr = indptr
+
+    @property
+    def rows(self) -> int:
+        return len(self.indptr) - 1
+
+    def row_ids(self) -> np.ndarray:
+        return np.repeat(np.arange(self.rows), np.diff(self.indptr))
+
+    def dot(self, weights: np.ndarray) -> np.ndarray:
+        """(rows x n_features) @ (n_features x k) -> (rows x k)"""
+        out = np.zeros((self.rows, weights.shape[1]), dtype=np.float32)
+        np.add.at(out, self.row_ids(), weights[self.indices].astype(np.float32) * self.data[:, None])
+        return out
+
+    def t_dot(self, values: np.ndarray, n_features: int) -> np.ndarray:
+        """(n_features x rows) @ (rows x k) -> (n_features x k)"""
+        out = np.zeros((n_features, values.shape[1]), dtype=np.float32)
+        np.add.at(out, self.indices, values[self.row_ids()] * self.data[:, None])
+        return out
+
+
+def vectorize(items: Sequence[Tuple[str, str]], n_features: int) -> CsrBatch:
+    """Hash (title, description) pairs into raw term-frequency rows."""
+    indices, data, indptr = [], [], [0]
+    for title, description in items:
+        counts = {}
+        for feature, weight in _features(title, description):
+            # crc32 rather than hash(): feature indices must be stable across processes
+            index = zlib.crc32(feature.encode("utf-8")) % n_features
+            counts[index] = counts.get(index, 0.0) + weight
+        indices.extend(counts.keys())
+        data.extend(counts.values())
+        indptr.append(len(indices))
+    return CsrBatch(np.array(indices, dtype=np.int64), np.array(data, dtype=np.float32), np.array(indptr, dtype=np.int64))
+
+
+def _tfidf(batch: CsrBatch, idf: np.ndarray) -> CsrBatch:
+    """Sublinear TF times IDF, L2-normalised per row."""
+    data = (1.0 + np.log(batch.data)) * idf[batch.indices]
+    row_ids = batch.row_ids()
+    squared = np.zeros(batch.rows, dtype=np.float32)
+    np.add.at(squared, row_ids, data ** 2)
+    data = data / np.sqrt(np.maximum(squared, 1e-12))[row_ids]
+    return CsrBatch(batch.indices, data.astype(np.float32), batch.indptr)
+
+
+class CategoryClassifier:
+    """
+    Hashed TF-IDF features over title and description with a softmax linear model,
+    trained offline on our own successfully published eBay listings.
+    """
+
+    def __init__(self, classes: List[str], weights: np.ndarray, bias: np.ndarray, idf: np.ndarray):
+        self.classes = classes
+        self.weights = weights
+        self.bias = bias
+        self.idf = idf
+        self.n_features = len(idf)
+
+    def predict_proba(self, items: Sequence[Tuple[str, str]]) -> np.ndarray:
+        batch = _tfidf(vectorize(items, self.n_features), self.idf)
+        scores = batch.dot(self.weights) + self.bias
+        scores -= scores.max(axis=1, keepdims=True)
+        probabilities = np.exp(scores)
+        return probabilities / probabilities.sum(axis=1, keepdims=True)
+
+    def predict_batch(self, items: Sequence[Tuple[str, str]]) -> List[Tuple[Optional[str], float]]:
+        """Best (category_id, confidence) for each (title, description) pair."""
+        if not items:
+            return []
+        probabilities = self.predict_proba(items)
+        best = probabilities.argmax(axis=1)
+        results = []
+        for row, column in enumerate(best):
+            has_features = self._has_features(items[row])
+            results.append((self.classes[column], float(probabilities[row, column])) if has_features else (None, 0.0))
+        return results
+
+    def predict(self, title: str, description: str = "") -> Tuple[Optional[str], float]:
+        return self.predict_batch([(title, description)])[0]
+
+    @staticmethod
+    def _has_features(item: Tuple[str, str]) -> bool:
+        return bool(stemmed_tokens(item[0]) or stemmed_tokens(item[1]))
+
+    @classmethod
+    def train(cls, items: Sequence[Tuple[str, str]], labels: Sequence[str], n_features: int = CATEGORY_CLASSIFIER_FEATURES,
+              epochs: int = 30, learning_rate: float = 1.0, l2: float = 1e-4, batch_size: int = 256) -> "CategoryClassifier":
+        classes = sorted(set(labels))
+        class_index = {label: i for i, label in enumerate(classes)}
+        y = np.array([class_index[label] for label in labels], dtype=np.int64)
+
+        raw = vectorize(items, n_features)
+        document_frequency = np.bincount(raw.indices, minlength=n_features).astype(np.float32)
+        idf = (np.log((1 + raw.rows) / (1 + document_frequency)) + 1).astype(np.float32)
+
+        weights = np.zeros((n_features, len(classes)), dtype=np.float32)
+        bias = np.zeros(len(classes), dtype=np.float32)
+        rng = np.random.default_rng(0)
+        for epoch in range(epochs):
+            order = rng.permutation(raw.rows)
+            for start in range(0, raw.rows, batch_size):
+                rows = order[start:start + batch_size]
+                batch = _tfidf(_take_rows(raw, rows), idf)
+                scores = batch.dot(weights) + bias
+                scores -= scores.max(axis=1, keepdims=True)
+                probabilities = np.exp(scores)
+                probabilities /= probabilities.sum(axis=1, keepdims=True)
+                probabilities[np.arange(len(rows)), y[rows]] -= 1.0
+                gradient = probabilities / len(rows)
+                weights -= learning_rate * (batch.t_dot(gradient, n_features) + l2 * weights)
+                bias -= learning_rate * gradient.sum(axis=0)
+        return cls(classes, weights, bias, idf)
+
+    def save(self, path: str):
+        tmp_path = f"{path}.tmp.npz"
+        np.savez_compressed(
+            tmp_path,
+            classes=np.array(self.classes),
+            weights=self.weights.astype(np.float16),
+            bias=self.bias,
+            idf=self.idf.astype(np.float16)
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "CategoryClassifier":
+        with np.load(path) as data:
+            return cls(
+                [str(label) for label in data["classes"]],
+                data["weights"],
+                data["bias"].astype(np.float32),
+                data["idf"].astype(np.float32)
+            )
+
+
+def _take_rows(batch: CsrBatch, rows: np.ndarray) -> CsrBatch:
+    starts, ends = batch.indptr[rows], batch.indptr[rows + 1]
+    indptr = np.concatenate(([0], np.cumsum(ends - starts)))
+    positions = np.concatenate([np.arange(s, e) for s, e in zip(starts, ends)]) if len(rows) else np.zeros(0, dtype=np.int64)
+    return CsrBatch(batch.indices[positions], batch.data[positions], indptr)
+
+
+class CategoryClassifierHolder:
+    """Loads the trained model once (at startup) and serves predictions from it."""
+
+    def __init__(self, path: str = CATEGORY_CLASSIFIER_PATH):
+        self.path = path
+        self.model: Optional[CategoryClassifier] = None
+
+    def load(self):
+        if not os.path.exists(self.path):
+            print(f"[DEBUG] No category classifier at {self.path}, skipping")
+            return
+        try:
+            self.model = CategoryClassifier.load(self.path)
+            print(f"[DEBUG] Loaded category classifier with {len(self.model.classes)} categories")
+        except Exception as e:
+            print(f"[DEBUG] Failed to load category classifier: {e}")
+
+    def predict_batch(self, items: Sequence[Tuple[str, str]]) -> List[Tuple[Optional[str], float]]:
+        if self.model is None:
+            return [(None, 0.0) for _ in items]
+        return self.model.predict_batch(items)
+
+    def predict(self, title: str, description: str = "") -> Tuple[Optional[str], float]:
+        return self.predict_batch([(title, description)])[0]
+
+    def stats(self) -> dict:
+        return {
+            "loaded": self.model is not None,
+            "categories": len(self.model.classes) if self.model else 0,
+            "features": self.model.n_features if self.model else 0
+        }
+
+# Global instance
+category_classifier = CategoryClassifierHolder()
+
+
+def load_training_data() -> Tuple[List[Tuple[str, str]], List[str]]:
+    """(title, description) pairs and eBay category IDs of listings that published successfully."""
+    import json
+    from collections import Counter
+    from sqlmodel import select
+    from app.db import get_session
+    from app.models.listing_db import Listing as DBListing
+
+    with get_session() as session:
+        rows = session.exec(
+            select(DBListing.title, DBListing.description, DBListing.marketplace_status, DBListing.ebay_category_id)
+            .where(DBListing.ebay_category_id.is_not(None))
+        ).all()
+
+    examples = [
+        ((title, description), category_id)
+        for title, description, marketplace_status, category_id in rows
+        if json.loads(marketplace_status or "{}").get("eBay") == "posted"
+    ]
+    counts = Counter(category_id for _, category_id in examples)
+    examples = [(item, category_id) for item, category_id in examples if counts[category_id] >= CATEGORY_CLASSIFIER_MIN_EXAMPLES]
+    return [item for item, _ in examples], [category_id for _, category_id in examples]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Train the eBay category classifier from published listings")
+    parser.add_argument("--output", default=CATEGORY_CLASSIFIER_PATH)
+    parser.add_argument("--epochs", type=int, default=30)
+    args = parser.parse_args()
+
+    items, labels = load_training_data()
+    if len(set(labels)) < 2:
+        raise SystemExit(f"Need at least two categories with {CATEGORY_CLASSIFIER_MIN_EXAMPLES}+ published listings, found {len(set(labels))}")
+    model = CategoryClassifier.train(items, labels, epochs=args.epochs)
+    predictions = model.predict_batch(items)
+    accuracy = sum(predicted == label for (predicted, _), label in zip(predictions, labels)) / len(labels)
+    model.save(args.output)
+    print(f"Trained on {len(labels)} listings across {len(model.classes)} categories, training accuracy {accuracy:.3f}")
@@ -0,0 +1,162 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional
+from sqlmodel import select
+from app.db import get_session
+from app.models.category_cache_db import CategoryValidity
+from app.routers.ebay_oauth import get_ebay_application_token
+from app.utils.ebay_client import ebay_client, EBAY_API_BASE_URL
+from app.utils.ebay_taxonomy import taxonomy
+from app.utils.single_flight import SingleFlight
+from app.utils.ttl_cache import TTLCache
+
+CATEGORY_VALIDITY_TTL_DAYS = int(os.getenv("CATEGORY_VALIDITY_TTL_DAYS", "90"))
+CATEGORY_VALIDITY_PROBE_CONCURRENCY = int(os.getenv("CATEGORY_VALIDITY_PROBE_CONCURRENCY", "4"))
+# Category tree used for probes when no local taxonomy index is loaded (0 is EBAY_US)
+EBAY_DEFAULT_CATEGORY_TREE_ID = os.getenv("EBAY_DEFAULT_CATEGORY_TREE_ID", "0")
+# How long to remember that nothing is recorded for a category, before asking the table again
+CATEGORY_VALIDITY_MISS_TTL = float(os.getenv("CATEGORY_VALIDITY_MISS_TTL", "300"))
+
+# Memory cache marker for "no recorded outcome"
+_UNKNOWN = "unknown"
+
+
+class CategoryValidityCache:
+    """
+    Whether an eBay category ID is a listable leaf, per taxonomy version. A rejection
+    recorded for the current version (e.g. eBay refusing an offer) always wins; otherwise
+    answers come from the local taxonomy index when it is loaded, then from an in-process
+    cache in front of the `categoryvalidity` table. Unknown categories are probed in the
+    background with the read-only Taxonomy API, never by posting offers on the publish path.
+    """
+
+    def __init__(self):
+        self._memory = TTLCache(maxsize=10000, ttl=CATEGORY_VALIDITY_TTL_DAYS * 86400)
+        self._probe_flight = SingleFlight()
+        self._probe_semaphore: Optional[asyncio.Semaphore] = None
+        # Tree version reported by the last probe, used when no index is loaded
+        self._probed_version: Optional[str] = None
+        self.probes = 0
+        self.probe_failures = 0
+
+    def current_version(self) -> Optional[str]:
+        return taxonomy.version or self._probed_version
+
+    def _recorded(self, category_id: str, version: Optional[str]) -> Optional[bool]:
+        """Outcome recorded for `category_id` under `version` (offer error or probe), if any."""
+        cached = self._memory.get((category_id, version))
+        if cached is not None:
+            return None if cached == _UNKNOWN else cached
+
+        cutoff = datetime.utcnow() - timedelta(days=CATEGORY_VALIDITY_TTL_DAYS)
+        with get_session() as session:
+            query = select(CategoryValidity).where(
+                CategoryValidity.category_id == category_id,
+                CategoryValidity.checked_at > cutoff
+            )
+            if version:
+                query = query.where(CategoryValidity.taxonomy_version == version)
+            entry = session.exec(query.order_by(CategoryValidity.checked_at.desc())).first()
+            valid = entry.valid if entry else None
+
+        if valid is not None:
+            self._memory.set((category_id, version), valid)
+        else:
+            self._memory.set((category_id, version), _UNKNOWN, ttl=CATEGORY_VALIDITY_MISS_TTL)
+        return valid
+
+    def get(self, category_id: str) -> Optional[bool]:
+        """True/False if validity is known for the current taxonomy version, None otherwise."""
+        category_id = str(category_id)
+        recorded = self._recorded(category_id, self.current_version())
+        if recorded is False:
+            # eBay refused it under this taxonomy version, whatever the index says
+            return False
+        is_leaf = taxonomy.is_leaf(category_id)
+        return is_leaf if is_leaf is not None else recorded
+
+    def record(self, category_id: str, valid: bool, source: str, version: Optional[str] = None):
+        category_id = str(category_id)
+        version = version or self.current_version()
+        # Same key `get` looks up, so a fresh rejection replaces a cached "unknown" at once
+        self._memory.set((category_id, version), valid)
+        version = version or "unknown"
+        try:
+            with get_session() as session:
+                entry = session.get(CategoryValidity, (category_id, version))
+                if entry:
+                    entry.valid = valid
+                    entry.source = source
+                    entry.checked_at = datetime.utcnow()
+                else:
+                    entry = CategoryValidity(category_id=category_id, taxonomy_version=version, valid=valid, source=source)
+                session.add(entry)
+                session.commit()
+        except Exception as e:
+            print(f"[DEBUG] Failed to persist validity of category {category_id}: {e}")
+
+    async def _probe(self, category_id: str) -> Optional[bool]:
+        if self._probe_semaphore is None:
+            self._probe_semaphore = asyncio.Semaphore(CATEGORY_VALIDITY_PROBE_CONCURRENCY)
+        tree_id = taxonomy.index.tree_id if taxonomy.index else EBAY_DEFAULT_CATEGORY_TREE_ID
+        async with self._probe_semaphore:
+            self.probes += 1
+            try:
+                token = await get_ebay_application_token()
+                response = await ebay_client.get(
+                    f"{EBAY_API_BASE_URL}/commerce/taxonomy/v1/category_tree/{tree_id}/get_category_subtree",
+                    params={"category_id": category_id},
+                    headers={"Authorization": f"Bearer {token}"}
+                )
+            except Exception as e:
+                self.probe_failures += 1
+                print(f"[DEBUG] Error probing category {category_id}: {e}")
+                return None
+
+        if response.status_code in (400, 404):
+            # eBay rejects category IDs that don't exist in the tree
+            self.record(category_id, False, "probe")
+            return False
+        if response.status_code != 200:
+            self.probe_failures += 1
+            print(f"[DEBUG] Category probe for {category_id} failed: {response.status_code} {response.text}")
+            return None
+
+        data = response.json()
+        version = data.get("categoryTreeVersion")
+        if version and not taxonomy.version:
+            self._probed_version = str(version)
+        valid = bool(data.get("categorySubtreeNode", {}).get("leafCategoryTreeNode"))
+        self.record(category_id, valid, "probe", version=str(version) if version else None)
+        return valid
+
+    async def probe(self, category_id: str) -> Optional[bool]:
+        """Check one category against eBay, collapsing concurrent checks of the same ID."""
+        return await self._probe_flight.do(str(category_id), lambda: self._probe(str(category_id)))
+
+    async def probe_many(self, category_ids: Iterable[str]):
+        await asyncio.gather(*[self.probe(category_id) for category_id in category_ids])
+
+    async def _probe_unknown(self, category_ids: List[str]):
+        # Looking up known validity can hit the database, so it runs in a worker thread too
+        unknown = await asyncio.to_thread(lambda: [category_id for category_id in category_ids if self.get(category_id) is None])
+        if unknown:
+            await self.probe_many(unknown)
+
+    def schedule_probes(self, category_ids: Iterable[str]):
+        """Probe categories with unknown validity concurrently, off the caller's path."""
+        task = asyncio.create_task(self._probe_unknown([str(category_id) for category_id in category_ids]))
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    def stats(self) -> dict:
+        return {
+            "taxonomy_version": self.current_version(),
+            "memory_size": self._memory.stats()["size"],
+            "probes": self.probes,
+            "probe_failures": self.probe_failures,
+            "probes_in_flight": self._probe_flight.in_flight()
+        }
+
+# Global instance
+category_validity = CategoryValidityCache()
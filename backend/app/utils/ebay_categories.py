@@ -1,9 +1,27 @@
-import requests
+import asyncio
 import json
 import os
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 from app.routers.ebay_oauth import get_ebay_token
+from app.utils.ebay_client import ebay_client, EBAY_API_BASE_URL
+from app.utils.category_cache import category_cache
+from app.utils.category_classifier import category_classifier
+from app.utils.category_validity import category_validity
+from app.utils.ebay_taxonomy import taxonomy
+from app.utils.keyword_matcher import KeywordMatcher
+
+# Keyword -> category rules used when nothing better is available. Rule names match
+# fallback category names unless the rule sets its own category_id; a rule with
+# "resolver": "plant" picks a working plant category instead.
+CATEGORY_RULES_PATH = os.getenv(
+    "CATEGORY_RULES_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "category_rules.json")
+)
+
+# Minimum confidence for a local classifier or taxonomy prediction to be used without asking eBay
+CATEGORY_CLASSIFIER_MIN_CONFIDENCE = float(os.getenv("CATEGORY_CLASSIFIER_MIN_CONFIDENCE", "0.6"))
+EBAY_TAXONOMY_MIN_CONFIDENCE = float(os.getenv("EBAY_TAXONOMY_MIN_CONFIDENCE", "0.35"))
 
 class EbayCategoryManager:
     def __init__(self):
@@ -11,6 +29,15 @@ class EbayCategoryManager:
         self.categories_cache = {}
         self.last_update = None
         self.cache_duration = timedelta(days=7)  # Cache for 7 days
+        self._load_category_rules()
+        
+    def _load_category_rules(self):
+        """Compile the keyword rules in CATEGORY_RULES_PATH into a matcher."""
+        with open(CATEGORY_RULES_PATH, 'r') as f:
+            rules = json.load(f)["rules"]
+        self.rules = {rule["name"]: rule for rule in rules}
+        self.keyword_matcher = KeywordMatcher.from_rules(rules)
+        print(f"[DEBUG] Compiled {self.keyword_matcher.keyword_count} category keywords from {len(rules)} rules")
         
     async def get_leaf_categories(self, user: str) -> Dict[str, str]:
         """
@@ -34,140 +61,18 @@ class EbayCategoryManager:
         return datetime.now() - self.last_update > self.cache_duration
     
     async def _fetch_categories_from_ebay(self, user: str):
-        """Fetch categories from eBay API and cache them."""
-        print("[DEBUG] Fetching categories from eBay API...")
-        
-        # Get eBay token
-        token = await get_ebay_token(user)
-        if not token:
-            print("[DEBUG] No eBay token available, using fallback categories")
-            self._load_fallback_categories()
-            return
-        
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/xml",
-            "X-EBAY-API-SITEID": "0",  # US site
-            "X-EBAY-API-CALL-NAME": "GetCategories",
-            "X-EBAY-API-VERSION": "1415"
-        }
-        
-        try:
-            # Use eBay Trading API GetCategories with ViewAllNodes=false to get only leaf categories
-            xml_request = f"""<?xml version="1.0" encoding="utf-8"?>
-<GetCategoriesRequest xmlns="urn:ebay:apis:eBLBaseComponents">
-    <ViewAllNodes>false</ViewAllNodes>
-    <DetailLevel>ReturnAll</DetailLevel>
-    <RequesterCredentials>
-        <eBayAuthToken>{token}</eBayAuthToken>
-    </RequesterCredentials>
-</GetCategoriesRequest>"""
-            
-            # Note: This would require the Trading API endpoint, but for now let's use fallback
-            print("[DEBUG] GetCategories API call would be made here")
-            print("[DEBUG] Using fallback categories for now")
-            self._load_fallback_categories()
-                
-        except Exception as e:
-            print(f"[DEBUG] Exception fetching categories: {e}")
-            self._load_fallback_categories()
-    
-    def _parse_categories_from_browse(self, data: dict):
-        """Parse categories from Browse API response."""
-        # This is a simplified parser - in a real implementation, you'd want to
-        # recursively traverse the category tree to find leaf categories
-        categories = {}
-        
-        # For now, we'll use some known working leaf categories
-        known_leaf_categories = {
-            "Toys & Hobbies": "220",
-            "Books & Magazines": "267", 
-            "Jewelry & Watches": "281",
-            "Electronics & Accessories": "293",
-            "Health & Beauty": "180959",
-            "Sporting Goods": "888",
-            "Automotive Parts & Accessories": "6000",
-            "Art": "550",
-            "Musical Instruments & Gear": "176985",
-            "Collectibles": "1",  # Note: This might not be a leaf category
-            "Home & Garden": "11450",  # Note: This might not be a leaf category
-        }
-        
-        # Add some specific plant-related categories that should be leaf categories
-        plant_categories = {
-            "Plants & Seedlings": "220",  # Use Toys & Hobbies as it's more likely to be a leaf category
-            "Garden Plants": "220", 
-            "Indoor Plants": "220",
-            "Outdoor Plants": "220",
-            "Flowers": "220",
-            "Succulents": "220",
-            "Herbs": "220",
-        }
-        
-        categories.update(known_leaf_categories)
-        categories.update(plant_categories)
-        
-        self.categories_cache = categories
-        self.last_update = datetime.now()
-        self._save_categories_to_file()
-        
-        print(f"[DEBUG] Cached {len(categories)} categories")
-    
-    async def test_category_id(self, category_id: str, user: str) -> bool:
         """
-        Test if a category ID is valid by trying to create a test offer.
-        Returns True if the category ID works, False otherwise.
+        Refresh categories. The full tree lives in the local taxonomy index; if it has not been
+        built yet, kick off ingestion from the Taxonomy API in the background and use the
+        fallback categories meanwhile.
         """
-        token = await get_ebay_token(user)
-        if not token:
-            return False
-        
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json",
-            "X-EBAY-C-MARKETPLACE-ID": "EBAY_US"
-        }
-        
-        # Create a minimal test offer
-        test_offer = {
-            "sku": "test-sku-123",
-            "marketplaceId": "EBAY_US",
-            "format": "FIXED_PRICE",
-            "availableQuantity": 1,
-            "categoryId": category_id,
-            "itemTitle": "Test Item",
-            "listingDescription": "Test description",
-            "listingDuration": "DAYS_7",
-            "pricingSummary": {
-                "price": {
-                    "currency": "USD",
-                    "value": "1.00"
-                }
-            },
-            "quantityLimitPerBuyer": 1,
-            "includeCatalogProductDetails": True,
-            "merchantLocationKey": "LOCATION_2"
-        }
-        
-        try:
-            response = requests.post(
-                "https://api.ebay.com/sell/inventory/v1/offer",
-                json=test_offer,
-                headers=headers,
-                timeout=30
-            )
-            
-            # If we get a category error, the category ID is invalid
-            if "not a leaf category" in response.text.lower():
-                return False
-            
-            # If we get other errors (like missing policies), the category ID might be valid
-            return True
-            
-        except Exception as e:
-            print(f"[DEBUG] Error testing category {category_id}: {e}")
-            return False
-
+        if taxonomy.index is None and not taxonomy.loading and not taxonomy.ingesting():
+            print("[DEBUG] No local eBay taxonomy index, ingesting category tree in the background")
+            task = asyncio.create_task(taxonomy.ingest_from_ebay())
+            # Failures are recorded in taxonomy.stats(); keep them out of the loop's error log
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self._load_fallback_categories()
+    
     def _load_fallback_categories(self):
         """Load fallback categories when API calls fail."""
         # Use verified leaf categories - these are known to work
@@ -258,14 +163,14 @@ class EbayCategoryManager:
         
         try:
             # Search for similar items using eBay Browse API
-            search_url = "https://api.ebay.com/buy/browse/v1/item_summary/search"
+            search_url = f"{EBAY_API_BASE_URL}/buy/browse/v1/item_summary/search"
             params = {
                 "q": search_query,
                 "limit": 10,  # Get top 10 results
                 "filter": "conditions:{NEW|USED_EXCELLENT|USED_VERY_GOOD|USED_GOOD|USED_ACCEPTABLE}"  # Include various conditions
             }
             
-            response = requests.get(search_url, headers=headers, params=params, timeout=30)
+            response = await ebay_client.get(search_url, headers=headers, params=params, user=user or None)
             print(f"[DEBUG] Browse API response status: {response.status_code}")
             
             if response.status_code == 200:
@@ -303,13 +208,12 @@ class EbayCategoryManager:
         
         return None
 
-    async def find_working_plant_category(self, user: str) -> str:
+    def find_working_plant_category(self) -> str:
         """
-        Try to find a working leaf category for plants by testing common plant category IDs.
-        Returns a working category ID or falls back to a known working category.
+        Pick a working leaf category for plants from the common plant category IDs, using only
+        recorded validity. Candidates whose validity is unknown are probed in the background so
+        later listings can use them; this call never waits on eBay.
         """
-        print("[DEBUG] Attempting to find working plant category...")
-        
         # Common plant category IDs to test
         plant_category_candidates = [
             "159912",
@@ -325,31 +229,62 @@ class EbayCategoryManager:
             "159922",
         ]
         
-        token = await get_ebay_token(user)
-        if not token:
-            print("[DEBUG] No token available for category testing")
-            return "165362"  # Fallback to known working category
-        
         for category_id in plant_category_candidates:
-            print(f"[DEBUG] Testing plant category ID: {category_id}")
-            if await self.test_category_id(category_id, user):
+            if category_validity.get(category_id):
                 print(f"[DEBUG] Found working plant category: {category_id}")
                 return category_id
         
-        print("[DEBUG] No working plant category found, using fallback")
+        category_validity.schedule_probes(plant_category_candidates)
+        print("[DEBUG] No known working plant category, using fallback")
         return "165362"  # Fallback to known working category
 
-    async def get_best_category_for_item(self, item_title: str, item_description: str = "", user: str = "") -> str:
+    async def get_best_categories_for_items(self, items: List[Tuple[str, str]], user: str = "") -> List[str]:
+        """
+        Find categories for many (title, description) pairs, running the classifier over
+        all of them in one vectorized batch. Returns category IDs in input order.
+        """
+        predictions = category_classifier.predict_batch(items)
+        return await asyncio.gather(*[
+            self.get_best_category_for_item(title, description, user, prediction=prediction)
+            for (title, description), prediction in zip(items, predictions)
+        ])
+
+    async def get_best_category_for_item(self, item_title: str, item_description: str = "", user: str = "",
+                                         prediction: Optional[Tuple[Optional[str], float]] = None) -> str:
         """
-        Find the best category for an item using Browse API first, then fallback to keyword matching.
+        Find the best category for an item using the local classifier and taxonomy index,
+        then the Browse API, then fallback to keyword matching.
+        `prediction` is a classifier result already computed by a batch caller.
         Returns a category ID.
         """
         print(f"[DEBUG] Starting category search for: {item_title}")
-        
-        # First, try to get category from eBay Browse API
+
+        # Titles that normalize to one we've already resolved skip eBay entirely
+        cached_category = category_cache.get(item_title)
+        if cached_category:
+            print(f"[DEBUG] Using cached category: {cached_category} for item: {item_title}")
+            return cached_category
+        
+        # Classifier trained on our own published listings; no network call
+        predicted_category, confidence = prediction or category_classifier.predict(item_title, item_description)
+        if predicted_category and confidence >= CATEGORY_CLASSIFIER_MIN_CONFIDENCE:
+            print(f"[DEBUG] Using classifier category: {predicted_category} (confidence {confidence:.2f}) for item: {item_title}")
+            category_cache.set(item_title, predicted_category, "classifier")
+            return predicted_category
+        
+        # Rank leaf categories from the local taxonomy index; no network call
+        suggestions = taxonomy.suggest(f"{item_title} {item_description}", k=1)
+        if suggestions and suggestions[0].confidence >= EBAY_TAXONOMY_MIN_CONFIDENCE:
+            suggestion = suggestions[0]
+            print(f"[DEBUG] Using taxonomy category: {suggestion.category_id} ({suggestion.path}, confidence {suggestion.confidence}) for item: {item_title}")
+            category_cache.set(item_title, suggestion.category_id, "taxonomy")
+            return suggestion.category_id
+        
+        # Next, try to get category from eBay Browse API
         browse_category = await self.get_category_from_browse_api(item_title, item_description, user)
         if browse_category:
             print(f"[DEBUG] Using Browse API category: {browse_category} for item: {item_title}")
+            category_cache.set(item_title, browse_category, "browse")
             return browse_category
         
         print("[DEBUG] Browse API failed, falling back to keyword matching")
@@ -360,43 +295,24 @@ class EbayCategoryManager:
             if not self.categories_cache:
                 await self.get_leaf_categories(user)
         
-        # Simple keyword matching as fallback
-        text = f"{item_title} {item_description}".lower()
-        
-        # Check for plant-related keywords first
-        plant_keywords = ["plant", "seedling", "perennial", "annual", "garden", "outdoor", "landscape", 
-                         "indoor", "houseplant", "potted", "flower", "bloom", "petal", "succulent", 
-                         "cactus", "ice plant", "herb", "culinary", "medicinal"]
-        
-        for keyword in plant_keywords:
-            if keyword in text:
-                print(f"[DEBUG] Detected plant-related keyword: '{keyword}', searching for working plant category")
-                working_plant_category = await self.find_working_plant_category(user)
+        # Weighted keyword rules as fallback, matched in a single pass over whole words
+        match = self.keyword_matcher.best(f"{item_title} {item_description}")
+        if match:
+            rule_name, score = match
+            rule = self.rules[rule_name]
+            if rule.get("resolver") == "plant":
+                print(f"[DEBUG] Matched plant rules (score {score}), searching for working plant category")
+                working_plant_category = self.find_working_plant_category()
                 print(f"[DEBUG] Using working plant category: {working_plant_category} for item: {item_title}")
+                category_cache.set(item_title, working_plant_category, "keyword")
                 return working_plant_category
+            category_id = rule.get("category_id") or self.categories_cache.get(rule_name)
+            if category_id:
+                print(f"[DEBUG] Matched '{rule_name}' (ID: {category_id}, score {score}) for item: {item_title}")
+                category_cache.set(item_title, category_id, "keyword")
+                return category_id
         
-        # Other category keywords
-        category_keywords = [
-            ("Toys & Hobbies", ["toy", "game", "hobby"]),
-            ("Books & Magazines", ["book", "magazine", "reading"]),
-            ("Jewelry & Watches", ["jewelry", "watch", "necklace", "ring"]),
-            ("Electronics & Accessories", ["electronic", "device", "gadget"]),
-            ("Health & Beauty", ["health", "beauty", "cosmetic"]),
-            ("Sporting Goods", ["sport", "fitness", "exercise"]),
-            ("Automotive Parts & Accessories", ["car", "auto", "vehicle"]),
-            ("Art", ["art", "painting", "sculpture"]),
-            ("Musical Instruments & Gear", ["music", "instrument", "guitar"]),
-        ]
-        
-        for category_name, keywords in category_keywords:
-            if category_name in self.categories_cache:
-                for keyword in keywords:
-                    if keyword in text:
-                        category_id = self.categories_cache[category_name]
-                        print(f"[DEBUG] Matched '{category_name}' (ID: {category_id}) for item: {item_title}")
-                        return category_id
-        
-        # Default fallback
+        # Default fallback (not cached, so a later Browse API success can still resolve this title)
         default_category = self.categories_cache.get("Toys & Hobbies", "220")
         print(f"[DEBUG] Using default category 'Toys & Hobbies' (ID: {default_category}) for item: {item_title}")
         return default_category
@@ -0,0 +1,154 @@
+import asyncio
+import importlib.util
+import os
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+import httpx
+from dotenv import load_dotenv
+from app.utils.ebay_retry import CircuitBreaker, RetryPolicy
+from app.utils.ebay_rate_limiter import rate_limiter
+
+load_dotenv()
+
+# eBay HTTP client configuration
+EBAY_API_BASE_URL = "https://api.ebay.com"
+EBAY_HTTP_TIMEOUT = float(os.getenv("EBAY_HTTP_TIMEOUT", "30"))
+EBAY_HTTP_CONNECT_TIMEOUT = float(os.getenv("EBAY_HTTP_CONNECT_TIMEOUT", "5"))
+EBAY_HTTP_MAX_CONNECTIONS_PER_HOST = int(os.getenv("EBAY_HTTP_MAX_CONNECTIONS_PER_HOST", "50"))
+EBAY_HTTP_MAX_KEEPALIVE_PER_HOST = int(os.getenv("EBAY_HTTP_MAX_KEEPALIVE_PER_HOST", "20"))
+EBAY_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("EBAY_HTTP_KEEPALIVE_EXPIRY", "60"))
+EBAY_HTTP2 = os.getenv("EBAY_HTTP2", "true").lower() == "true"
+
+
+def _http2_supported() -> bool:
+    """HTTP/2 needs the optional `h2` package; fall back to HTTP/1.1 keep-alive without it."""
+    return importlib.util.find_spec("h2") is not None
+
+
+class EbayApiClient:
+    """
+    Process-wide async client for eBay REST calls.
+    Keeps one keep-alive connection pool per host so every call reuses warm TLS connections
+    instead of blocking the event loop on a fresh `requests` round trip.
+    """
+
+    def __init__(self):
+        self.timeout = httpx.Timeout(EBAY_HTTP_TIMEOUT, connect=EBAY_HTTP_CONNECT_TIMEOUT)
+        self.limits = httpx.Limits(
+            max_connections=EBAY_HTTP_MAX_CONNECTIONS_PER_HOST,
+            max_keepalive_connections=EBAY_HTTP_MAX_KEEPALIVE_PER_HOST,
+            keepalive_expiry=EBAY_HTTP_KEEPALIVE_EXPIRY,
+        )
+        self.http2 = EBAY_HTTP2 and _http2_supported()
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self.retry_policy = RetryPolicy()
+
+    def _client_for(self, url: str) -> httpx.AsyncClient:
+        """Return the pooled client for the URL's host, creating it on first use."""
+        parts = urlsplit(url)
+        origin = f"{parts.scheme}://{parts.netloc}"
+        client = self._clients.get(origin)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                http2=self.http2,
+                timeout=self.timeout,
+                limits=self.limits,
+            )
+            self._clients[origin] = client
+        return client
+
+    def _endpoint_name(self, method: str, url: str) -> str:
+        """Default circuit breaker key: method plus the API resource, e.g. `POST /sell/inventory/v1/offer`."""
+        path = urlsplit(url).path.strip("/").split("/")
+        return f"{method} /{'/'.join(path[:4])}"
+
+    def _breaker_for(self, endpoint: str) -> CircuitBreaker:
+        breaker = self._breakers.get(endpoint)
+        if breaker is None:
+            breaker = CircuitBreaker(endpoint)
+            self._breakers[endpoint] = breaker
+        return breaker
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        timeout: Optional[float] = None,
+        endpoint: Optional[str] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        user: Optional[str] = None,
+        **kwargs
+    ) -> httpx.Response:
+        """
+        Send a request to eBay. Accepts the same keyword arguments as `httpx.AsyncClient.request`
+        (headers, params, json, data, auth). Retryable failures (network errors, 429, 5xx) are
+        retried per `retry_policy` with non-blocking sleeps; the final response is returned
+        whatever its status. Every attempt is scheduled through the rate limiter under the
+        API family's app-wide budget and `user`'s fair share of it. Raises `httpx.HTTPError`
+        when every attempt fails at the transport level, `CircuitOpenError` while the endpoint's
+        circuit breaker is open, or `EbayRateLimitExceeded` when the call budget is exhausted.
+        """
+        if timeout is not None:
+            kwargs["timeout"] = httpx.Timeout(timeout, connect=EBAY_HTTP_CONNECT_TIMEOUT)
+        policy = retry_policy or self.retry_policy
+        breaker = self._breaker_for(endpoint or self._endpoint_name(method, url))
+        client = self._client_for(url)
+        family = rate_limiter.family_for(url)
+
+        delay = policy.base_delay
+        for attempt in range(1, policy.max_attempts + 1):
+            await rate_limiter.acquire(family, user)
+            breaker.before_call()
+            response = None
+            try:
+                response = await client.request(method, url, **kwargs)
+            except asyncio.CancelledError:
+                breaker.probe_in_flight = False
+                raise
+            except httpx.HTTPError as e:
+                breaker.record_failure()
+                if attempt == policy.max_attempts:
+                    raise
+                print(f"[DEBUG] {breaker.endpoint} request failed, retrying (attempt {attempt}/{policy.max_attempts}): {e}")
+            else:
+                rate_limiter.observe(family, response)
+                if response.status_code >= 500 or response.status_code == 429:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                if attempt == policy.max_attempts or not policy.should_retry(response):
+                    return response
+                print(f"[DEBUG] {breaker.endpoint} returned {response.status_code}, retrying (attempt {attempt}/{policy.max_attempts})")
+
+            delay = policy.next_delay(delay)
+            retry_after = policy.retry_after(response)
+            if retry_after is not None:
+                if retry_after > policy.max_retry_after:
+                    return response
+                delay = max(delay, retry_after)
+            await asyncio.sleep(delay)
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    async def put(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("PUT", url, **kwargs)
+
+    async def delete(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("DELETE", url, **kwargs)
+
+    def circuit_states(self) -> dict:
+        return {name: breaker.snapshot() for name, breaker in self._breakers.items()}
+
+    async def close(self):
+        """Close every pooled connection. Called on application shutdown."""
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
+
+# Global instance
+ebay_client = EbayApiClient()
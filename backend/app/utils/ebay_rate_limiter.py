@@ -0,0 +1,224 @@
+import asyncio
+import json
+import os
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+import httpx
+
+# Default call budgets per eBay API family. `per_second` drives the token bucket,
+# `burst` its capacity and `daily` the app-wide daily call limit.
+# Override with EBAY_RATE_LIMITS, e.g. '{"browse": {"daily": 10000}}'.
+DEFAULT_EBAY_RATE_LIMITS = {
+    "inventory": {"per_second": 20, "burst": 40, "daily": 2000000},
+    "account": {"per_second": 5, "burst": 10, "daily": 25000},
+    "browse": {"per_second": 5, "burst": 10, "daily": 5000},
+    "identity": {"per_second": 5, "burst": 10, "daily": 50000},
+    "taxonomy": {"per_second": 2, "burst": 4, "daily": 5000},
+    "other": {"per_second": 5, "burst": 10, "daily": 5000},
+}
+# Fraction of a family's per-second budget a single user may consume
+EBAY_RATE_LIMIT_USER_SHARE = float(os.getenv("EBAY_RATE_LIMIT_USER_SHARE", "0.25"))
+# Fail instead of queueing when a call would have to wait longer than this
+EBAY_RATE_LIMIT_MAX_WAIT = float(os.getenv("EBAY_RATE_LIMIT_MAX_WAIT", "30"))
+
+API_FAMILY_PREFIXES = [
+    ("/sell/inventory/", "inventory"),
+    ("/sell/account/", "account"),
+    ("/buy/browse/", "browse"),
+    ("/identity/", "identity"),
+    ("/commerce/taxonomy/", "taxonomy"),
+]
+
+
+def _load_rate_limits() -> Dict[str, Dict[str, float]]:
+    limits = {family: dict(config) for family, config in DEFAULT_EBAY_RATE_LIMITS.items()}
+    overrides = os.getenv("EBAY_RATE_LIMITS")
+    if overrides:
+        try:
+            for family, config in json.loads(overrides).items():
+                limits.setdefault(family, dict(DEFAULT_EBAY_RATE_LIMITS["other"])).update(config)
+        except (ValueError, AttributeError) as e:
+            print(f"[DEBUG] Ignoring invalid EBAY_RATE_LIMITS: {e}")
+    return limits
+
+
+class EbayRateLimitExceeded(httpx.HTTPError):
+    """Raised instead of calling eBay when the call budget cannot be met in time."""
+
+    def __init__(self, family: str, reason: str):
+        super().__init__(f"eBay {family} API call budget exhausted: {reason}")
+        self.family = family
+
+
+class TokenBucket:
+    """
+    Reservation-based token bucket: callers take a token immediately (the balance may go
+    negative) and are told how long to wait, so waiters are served in arrival order.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        self._refill()
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def refund(self):
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+    def pause(self, seconds: float):
+        """Empty the bucket so no calls go out for `seconds` (eBay returned 429)."""
+        self._refill()
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+    def available(self) -> float:
+        self._refill()
+        return self.tokens
+
+
+class EbayApiFamilyBudget:
+    def __init__(self, family: str, per_second: float, burst: float, daily: int):
+        self.family = family
+        self.bucket = TokenBucket(per_second, burst)
+        self.user_rate = max(per_second * EBAY_RATE_LIMIT_USER_SHARE, 0.1)
+        self.user_burst = max(burst * EBAY_RATE_LIMIT_USER_SHARE, 1)
+        self.user_buckets: Dict[str, TokenBucket] = {}
+        self.daily_limit = daily
+        self.daily_used = 0
+        self.day = datetime.now(timezone.utc).date()
+        # Remaining budget reported by eBay, when it sends rate-limit headers
+        self.reported_remaining: Optional[int] = None
+        self.waiting = 0
+        self.throttled = 0
+
+    def _roll_day(self):
+        today = datetime.now(timezone.utc).date()
+        if today != self.day:
+            self.day = today
+            self.daily_used = 0
+            self.reported_remaining = None
+
+    def daily_remaining(self) -> int:
+        self._roll_day()
+        remaining = self.daily_limit - self.daily_used
+        if self.reported_remaining is not None:
+            remaining = min(remaining, self.reported_remaining)
+        return max(0, remaining)
+
+    def user_bucket(self, user: str) -> TokenBucket:
+        bucket = self.user_buckets.get(user)
+        if bucket is None:
+            if len(self.user_buckets) >= 10000:
+                # Forget users whose buckets have fully refilled; they hold no state
+                self.user_buckets = {u: b for u, b in self.user_buckets.items() if b.available() < b.capacity}
+            bucket = TokenBucket(self.user_rate, self.user_burst)
+            self.user_buckets[user] = bucket
+        return bucket
+
+
+class EbayRateLimiter:
+    """
+    App-wide call scheduler for eBay. Each API family (Inventory, Account, Browse, Identity, Taxonomy)
+    has a token bucket and a daily budget; each user additionally has a fair-share bucket
+    so one seller's burst cannot starve everyone else. Calls wait their turn instead of
+    being fired directly, and limits are tightened from eBay's rate-limit headers.
+    """
+
+    def __init__(self):
+        self.limits = _load_rate_limits()
+        self.families: Dict[str, EbayApiFamilyBudget] = {}
+
+    @staticmethod
+    def family_for(url: str) -> str:
+        path = urlsplit(url).path
+        for prefix, family in API_FAMILY_PREFIXES:
+            if path.startswith(prefix):
+                return family
+        return "other"
+
+    def _budget(self, family: str) -> EbayApiFamilyBudget:
+        budget = self.families.get(family)
+        if budget is None:
+            config = self.limits.get(family, self.limits["other"])
+            budget = EbayApiFamilyBudget(family, config["per_second"], config["burst"], int(config["daily"]))
+            self.families[family] = budget
+        return budget
+
+    async def acquire(self, family: str, user: Optional[str] = None):
+        """Wait until a call to `family` fits the app-wide and per-user budgets."""
+        budget = self._budget(family)
+        if budget.daily_remaining() <= 0:
+            budget.throttled += 1
+            raise EbayRateLimitExceeded(family, "daily limit reached")
+
+        buckets = [budget.bucket]
+        if user:
+            buckets.append(budget.user_bucket(user))
+        wait = max(bucket.reserve() for bucket in buckets)
+        if wait > EBAY_RATE_LIMIT_MAX_WAIT:
+            for bucket in buckets:
+                bucket.refund()
+            budget.throttled += 1
+            raise EbayRateLimitExceeded(family, f"would wait {wait:.1f}s")
+
+        budget.daily_used += 1
+        if budget.reported_remaining is not None:
+            budget.reported_remaining -= 1
+        if wait > 0:
+            budget.waiting += 1
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                budget.waiting -= 1
+
+    def observe(self, family: str, response: httpx.Response):
+        """Learn from eBay's response: rate-limit headers and 429 throttling."""
+        budget = self._budget(family)
+        headers = response.headers
+        limit = headers.get("X-RateLimit-Limit")
+        remaining = headers.get("X-RateLimit-Remaining")
+        try:
+            if limit is not None:
+                budget.daily_limit = int(limit)
+            if remaining is not None:
+                budget.reported_remaining = int(remaining)
+        except ValueError:
+            pass
+        if response.status_code == 429:
+            budget.throttled += 1
+            retry_after = headers.get("Retry-After")
+            try:
+                pause = float(retry_after) if retry_after else 1.0
+            except ValueError:
+                pause = 1.0
+            budget.bucket.pause(min(pause, EBAY_RATE_LIMIT_MAX_WAIT))
+
+    def snapshot(self) -> Dict[str, dict]:
+        """Remaining-budget gauges per API family."""
+        return {
+            family: {
+                "tokens_available": round(budget.bucket.available(), 2),
+                "per_second": budget.bucket.rate,
+                "daily_limit": budget.daily_limit,
+                "daily_used": budget.daily_used,
+                "daily_remaining": budget.daily_remaining(),
+                "waiting": budget.waiting,
+                "throttled_total": budget.throttled,
+                "active_users": len(budget.user_buckets)
+            }
+            for family, budget in self.families.items()
+        }
+
+# Global instance
+rate_limiter = EbayRateLimiter()
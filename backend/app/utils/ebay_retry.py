@@ -0,0 +1,129 @@
+import os
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional, Tuple
+import httpx
+
+EBAY_RETRY_MAX_ATTEMPTS = int(os.getenv("EBAY_RETRY_MAX_ATTEMPTS", "3"))
+EBAY_RETRY_BASE_DELAY = float(os.getenv("EBAY_RETRY_BASE_DELAY", "0.5"))
+EBAY_RETRY_MAX_DELAY = float(os.getenv("EBAY_RETRY_MAX_DELAY", "8"))
+# Give up instead of sleeping when eBay asks us to wait longer than this
+EBAY_RETRY_MAX_RETRY_AFTER = float(os.getenv("EBAY_RETRY_MAX_RETRY_AFTER", "30"))
+EBAY_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("EBAY_CIRCUIT_FAILURE_THRESHOLD", "5"))
+EBAY_CIRCUIT_RESET_TIMEOUT = float(os.getenv("EBAY_CIRCUIT_RESET_TIMEOUT", "30"))
+
+
+class CircuitOpenError(httpx.HTTPError):
+    """Raised instead of calling eBay while an endpoint's circuit breaker is open."""
+
+    def __init__(self, endpoint: str, retry_in: float):
+        super().__init__(f"eBay endpoint {endpoint} is unavailable, retry in {retry_in:.0f}s")
+        self.endpoint = endpoint
+        self.retry_in = retry_in
+
+
+class RetryPolicy:
+    """
+    When and how long to wait before retrying an eBay call.
+    Retries network errors, 429 and 5xx responses with decorrelated-jitter backoff,
+    and honours eBay's Retry-After header when present.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = EBAY_RETRY_MAX_ATTEMPTS,
+        base_delay: float = EBAY_RETRY_BASE_DELAY,
+        max_delay: float = EBAY_RETRY_MAX_DELAY,
+        retry_statuses: Tuple[int, ...] = (429, 500, 502, 503, 504),
+        max_retry_after: float = EBAY_RETRY_MAX_RETRY_AFTER
+    ):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_statuses = retry_statuses
+        self.max_retry_after = max_retry_after
+
+    def should_retry(self, response: Optional[httpx.Response]) -> bool:
+        """`response` is None for network errors, which are always retryable."""
+        return response is None or response.status_code in self.retry_statuses
+
+    def next_delay(self, previous_delay: float) -> float:
+        """Decorrelated jitter: sleep = min(cap, uniform(base, previous * 3))."""
+        return min(self.max_delay, random.uniform(self.base_delay, max(self.base_delay, previous_delay * 3)))
+
+    @staticmethod
+    def retry_after(response: Optional[httpx.Response]) -> Optional[float]:
+        """Seconds requested by a Retry-After header (delta-seconds or HTTP date), if any."""
+        if response is None:
+            return None
+        value = response.headers.get("Retry-After")
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(value)
+            return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            return None
+
+# Never retried; used for calls that must not be repeated
+NO_RETRY = RetryPolicy(max_attempts=1)
+
+
+class CircuitBreaker:
+    """
+    Per-endpoint circuit breaker. After `failure_threshold` consecutive failures the
+    circuit opens and calls fail fast for `reset_timeout` seconds; then a single probe
+    call is let through (half-open) and its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, endpoint: str, failure_threshold: int = EBAY_CIRCUIT_FAILURE_THRESHOLD, reset_timeout: float = EBAY_CIRCUIT_RESET_TIMEOUT):
+        self.endpoint = endpoint
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.total_failures = 0
+        self.rejected = 0
+
+    def before_call(self):
+        if self.state == "closed":
+            return
+        elapsed = time.monotonic() - self.opened_at
+        if self.state == "open" and elapsed >= self.reset_timeout:
+            self.state = "half_open"
+        if self.state == "half_open" and not self.probe_in_flight:
+            self.probe_in_flight = True
+            return
+        self.rejected += 1
+        raise CircuitOpenError(self.endpoint, max(0.0, self.reset_timeout - elapsed))
+
+    def record_success(self):
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.probe_in_flight = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        self.total_failures += 1
+        self.probe_in_flight = False
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            if self.state != "open":
+                print(f"[DEBUG] Circuit for eBay endpoint {self.endpoint} opened after {self.consecutive_failures} failures")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def snapshot(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "total_failures": self.total_failures,
+            "rejected": self.rejected
+        }
@@ -0,0 +1,73 @@
+import os
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional
+from app.utils.ttl_cache import TTLCache
+
+EBAY_SELLER_CONTEXT_TTL = float(os.getenv("EBAY_SELLER_CONTEXT_TTL", "300"))
+EBAY_SELLER_CONTEXT_CACHE_SIZE = int(os.getenv("EBAY_SELLER_CONTEXT_CACHE_SIZE", "10000"))
+# Treat tokens this close to expiry as expired so they never run out mid-publish
+EBAY_TOKEN_EXPIRY_MARGIN = int(os.getenv("EBAY_TOKEN_EXPIRY_MARGIN", "60"))
+
+
+@dataclass
+class EbaySellerContext:
+    """Everything the publish path needs about a connected eBay seller."""
+    user_id: str
+    access_token: str
+    expires_at: datetime
+    fulfillment_policy_id: Optional[str] = None
+    payment_policy_id: Optional[str] = None
+    return_policy_id: Optional[str] = None
+    default_merchant_location: Optional[str] = None
+
+    def token_valid(self) -> bool:
+        return (self.expires_at - datetime.utcnow()).total_seconds() > EBAY_TOKEN_EXPIRY_MARGIN
+
+    def missing_policies(self) -> List[str]:
+        missing_policies = []
+        if not self.fulfillment_policy_id:
+            missing_policies.append("fulfillment")
+        if not self.payment_policy_id:
+            missing_policies.append("payment")
+        if not self.return_policy_id:
+            missing_policies.append("return")
+        return missing_policies
+
+    def listing_policies(self) -> Dict[str, str]:
+        """Policy IDs in the shape expected by offer `listingPolicies`."""
+        return {
+            "fulfillmentPolicyId": self.fulfillment_policy_id,
+            "paymentPolicyId": self.payment_policy_id,
+            "returnPolicyId": self.return_policy_id
+        }
+
+
+class EbaySellerContextCache:
+    """
+    Per-user `EbaySellerContext` with a TTL. Entries never outlive their access token and
+    are invalidated explicitly whenever the OAuth endpoints change the stored record.
+    """
+
+    def __init__(self):
+        self._cache = TTLCache(maxsize=EBAY_SELLER_CONTEXT_CACHE_SIZE, ttl=EBAY_SELLER_CONTEXT_TTL)
+
+    def get(self, user: str) -> Optional[EbaySellerContext]:
+        context = self._cache.get(user)
+        if context and not context.token_valid():
+            self._cache.invalidate(user)
+            return None
+        return context
+
+    def put(self, context: EbaySellerContext):
+        token_ttl = (context.expires_at - datetime.utcnow()).total_seconds() - EBAY_TOKEN_EXPIRY_MARGIN
+        self._cache.set(context.user_id, context, ttl=max(0, min(EBAY_SELLER_CONTEXT_TTL, token_ttl)))
+
+    def invalidate(self, user: str):
+        self._cache.invalidate(user)
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+# Global instance
+seller_context_cache = EbaySellerContextCache()
@@ -0,0 +1,345 @@
+import asyncio
+import gzip
+import heapq
+import json
+import math
+import os
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+import numpy as np
+from app.routers.ebay_oauth import get_ebay_application_token
+from app.utils.ebay_client import ebay_client, EBAY_API_BASE_URL
+from app.utils.single_flight import SingleFlight
+from app.utils.text import stemmed_tokens
+
+EBAY_TAXONOMY_INDEX_PATH = os.getenv("EBAY_TAXONOMY_INDEX_PATH", "ebay_taxonomy_index.npz")
+EBAY_TAXONOMY_MARKETPLACE = os.getenv("EBAY_TAXONOMY_MARKETPLACE", "EBAY_US")
+
+# Term weights: a match on the leaf's own name counts more than one on an ancestor's
+NAME_WEIGHT = 3.0
+PATH_WEIGHT = 1.0
+# Bump when the saved arrays change shape or meaning; older files are ignored and re-ingested
+INDEX_FORMAT = 1
+
+
+@dataclass
+class CategorySuggestion:
+    category_id: str
+    name: str
+    path: str
+    score: float
+    confidence: float
+
+
+class TaxonomyIndex:
+    """
+    Flattened eBay category tree, fully precomputed. Categories live in parallel arrays
+    (ids, names, parent positions, leaf flags); the parent->children map and the inverted
+    index over leaf names and ancestor paths are stored CSR-style next to them, so loading
+    the index is a single read with no per-process rebuilding.
+    """
+
+    def __init__(self, tree_id: str, version: str, ids: List[str], names: List[str], parents: np.ndarray,
+                 leaf: np.ndarray, children_indptr: np.ndarray, children: np.ndarray, terms: List[str],
+                 postings_indptr: np.ndarray, postings_positions: np.ndarray, postings_weights: np.ndarray,
+                 idf: np.ndarray):
+        self.tree_id = tree_id
+        self.version = version
+        self.ids = ids
+        self.names = names
+        self.parents = parents
+        self.leaf = leaf
+        self.children_indptr = children_indptr
+        self.children_positions = children
+        self.terms = terms
+        self.postings_indptr = postings_indptr
+        self.postings_positions = postings_positions
+        self.postings_weights = postings_weights
+        self.idf = idf
+        self.position = {category_id: i for i, category_id in enumerate(ids)}
+        self.term_position = {term: i for i, term in enumerate(terms)}
+
+    @classmethod
+    def build(cls, tree_id: str, version: str, ids: List[str], names: List[str],
+              parents: List[int], leaf: List[bool]) -> "TaxonomyIndex":
+        """Derive the children map and the inverted index from the flattened tree."""
+        children: Dict[int, List[int]] = defaultdict(list)
+        for i, parent in enumerate(parents):
+            if parent >= 0:
+                children[parent].append(i)
+        children_indptr = np.zeros(len(ids) + 1, dtype=np.int32)
+        for i in range(len(ids)):
+            children_indptr[i + 1] = children_indptr[i] + len(children.get(i, ()))
+        children_positions = np.array([child for i in range(len(ids)) for child in children.get(i, ())], dtype=np.int32)
+
+        postings: Dict[str, Dict[int, float]] = defaultdict(dict)
+        for i, is_leaf in enumerate(leaf):
+            if not is_leaf:
+                continue
+            ancestor = parents[i]
+            while ancestor > 0:  # position 0 is the root node, whose name carries no signal
+                for token in stemmed_tokens(names[ancestor]):
+                    postings[token].setdefault(i, PATH_WEIGHT)
+                ancestor = parents[ancestor]
+            for token in stemmed_tokens(names[i]):
+                postings[token][i] = NAME_WEIGHT
+
+        leaf_count = max(1, sum(leaf))
+        terms = sorted(postings)
+        postings_indptr = np.zeros(len(terms) + 1, dtype=np.int32)
+        for t, term in enumerate(terms):
+            postings_indptr[t + 1] = postings_indptr[t] + len(postings[term])
+        postings_positions = np.array([position for term in terms for position in postings[term]], dtype=np.int32)
+        postings_weights = np.array([weight for term in terms for weight in postings[term].values()], dtype=np.float32)
+        idf = np.array([math.log(1 + leaf_count / len(postings[term])) for term in terms], dtype=np.float32)
+
+        return cls(tree_id, version, ids, names, np.array(parents, dtype=np.int32), np.array(leaf, dtype=bool),
+                   children_indptr, children_positions, terms, postings_indptr, postings_positions,
+                   postings_weights, idf)
+
+    @classmethod
+    def from_tree(cls, tree: dict) -> "TaxonomyIndex":
+        """Build the index from a Taxonomy API `category_tree` response."""
+        ids, names, parents, leaf = [], [], [], []
+        stack = [(tree["rootCategoryNode"], -1)]
+        while stack:
+            node, parent = stack.pop()
+            position = len(ids)
+            category = node.get("category", {})
+            ids.append(str(category.get("categoryId", "")))
+            names.append(category.get("categoryName", ""))
+            parents.append(parent)
+            leaf.append(bool(node.get("leafCategoryTreeNode")))
+            for child in reversed(node.get("childCategoryTreeNodes", [])):
+                stack.append((child, position))
+        return cls.build(str(tree.get("categoryTreeId", "")), str(tree.get("categoryTreeVersion", "")),
+                         ids, names, parents, leaf)
+
+    @classmethod
+    def load(cls, path: str) -> "TaxonomyIndex":
+        with np.load(path) as data:
+            if int(data["format"]) != INDEX_FORMAT:
+                raise ValueError(f"index format {int(data['format'])}, expected {INDEX_FORMAT}")
+            return cls(
+                str(data["tree_id"]), str(data["version"]),
+                data["ids"].tolist(), data["names"].tolist(), data["parents"], data["leaf"],
+                data["children_indptr"], data["children"], data["terms"].tolist(),
+                data["postings_indptr"], data["postings_positions"], data["postings_weights"], data["idf"]
+            )
+
+    def save(self, path: str):
+        tmp_path = f"{path}.tmp.npz"
+        np.savez_compressed(
+            tmp_path,
+            format=np.array(INDEX_FORMAT),
+            tree_id=np.array(self.tree_id),
+            version=np.array(self.version),
+            ids=np.array(self.ids),
+            names=np.array(self.names),
+            parents=self.parents,
+            leaf=self.leaf,
+            children_indptr=self.children_indptr,
+            children=self.children_positions,
+            terms=np.array(self.terms),
+            postings_indptr=self.postings_indptr,
+            postings_positions=self.postings_positions,
+            postings_weights=self.postings_weights,
+            idf=self.idf
+        )
+        os.replace(tmp_path, path)
+
+    def children(self, position: int) -> np.ndarray:
+        return self.children_positions[self.children_indptr[position]:self.children_indptr[position + 1]]
+
+    def leaf_count(self) -> int:
+        return int(self.leaf.sum())
+
+    def path(self, position: int) -> str:
+        names = []
+        while position > 0:
+            names.append(self.names[position])
+            position = self.parents[position]
+        return " > ".join(reversed(names))
+
+    def is_leaf(self, category_id: str) -> Optional[bool]:
+        """Leaf flag for `category_id`, or None if the category is not in the tree."""
+        position = self.position.get(str(category_id))
+        return None if position is None else bool(self.leaf[position])
+
+    def suggest(self, text: str, k: int = 5) -> List[CategorySuggestion]:
+        """Rank leaf categories for free text, best first."""
+        tokens = set(stemmed_tokens(text))
+        scores: Dict[int, float] = defaultdict(float)
+        best_possible = 0.0
+        for token in tokens:
+            term = self.term_position.get(token)
+            if term is None:
+                continue
+            idf = float(self.idf[term])
+            best_possible += NAME_WEIGHT * idf
+            start, end = self.postings_indptr[term], self.postings_indptr[term + 1]
+            for position, weight in zip(self.postings_positions[start:end].tolist(), self.postings_weights[start:end].tolist()):
+                scores[position] += weight * idf
+        if not scores:
+            return []
+
+        top = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [
+            CategorySuggestion(
+                category_id=self.ids[position],
+                name=self.names[position],
+                path=self.path(position),
+                score=round(score, 4),
+                confidence=round(min(1.0, score / best_possible), 4)
+            )
+            for position, score in top
+        ]
+
+
+class EbayTaxonomy:
+    """
+    Owns the local category index: loads it from disk at startup (in a worker thread, see
+    `load`) and re-ingests the full tree from the Taxonomy API (or a snapshot file) on demand.
+    Until the index is loaded, lookups return no suggestions rather than blocking.
+    """
+
+    def __init__(self, index_path: str = EBAY_TAXONOMY_INDEX_PATH):
+        self.index_path = index_path
+        self._index: Optional[TaxonomyIndex] = None
+        self.loading = False
+        self._ingest_flight = SingleFlight()
+        self.last_ingested_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def load(self):
+        """Read the saved index from disk (blocking; see `preload`)."""
+        if not os.path.exists(self.index_path):
+            print(f"[DEBUG] No eBay taxonomy index at {self.index_path}")
+            return
+        try:
+            index = TaxonomyIndex.load(self.index_path)
+            if self._index is None:  # An ingestion that finished meanwhile is newer
+                self._index = index
+            print(f"[DEBUG] Loaded eBay taxonomy index version {index.version} ({len(index.ids)} categories)")
+        except Exception as e:
+            print(f"[DEBUG] Failed to load eBay taxonomy index: {e}")
+
+    async def preload(self):
+        """Load the saved index in a worker thread; called at startup."""
+        self.loading = True
+        try:
+            await asyncio.to_thread(self.load)
+        finally:
+            self.loading = False
+
+    @property
+    def index(self) -> Optional[TaxonomyIndex]:
+        return self._index
+
+    @property
+    def version(self) -> Optional[str]:
+        index = self.index
+        return index.version if index else None
+
+    def suggest(self, text: str, k: int = 5) -> List[CategorySuggestion]:
+        index = self.index
+        return index.suggest(text, k) if index else []
+
+    def is_leaf(self, category_id: str) -> Optional[bool]:
+        index = self.index
+        return index.is_leaf(category_id) if index else None
+
+    def _install(self, index: TaxonomyIndex):
+        index.save(self.index_path)
+        self._index = index
+        self.last_ingested_at = time.time()
+        self.last_error = None
+        print(f"[DEBUG] Installed eBay taxonomy index version {index.version} ({len(index.ids)} categories)")
+
+    def load_snapshot(self, path: str) -> TaxonomyIndex:
+        """Build the index from a saved `category_tree` JSON response (plain or gzipped)."""
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            index = TaxonomyIndex.from_tree(json.load(f))
+        self._install(index)
+        return index
+
+    async def _ingest(self) -> TaxonomyIndex:
+        token = await get_ebay_application_token()
+        headers = {"Authorization": f"Bearer {token}", "Accept-Encoding": "gzip"}
+        base_url = f"{EBAY_API_BASE_URL}/commerce/taxonomy/v1"
+        try:
+            response = await ebay_client.get(
+                f"{base_url}/get_default_category_tree_id",
+                params={"marketplace_id": EBAY_TAXONOMY_MARKETPLACE},
+                headers=headers
+            )
+            response.raise_for_status()
+            tree_id = response.json()["categoryTreeId"]
+
+            response = await ebay_client.get(
+                f"{base_url}/category_tree/{tree_id}",
+                headers=headers,
+                timeout=120
+            )
+            response.raise_for_status()
+            # The full tree is tens of megabytes; keep parsing and indexing off the event loop
+            tree = await asyncio.to_thread(json.loads, response.content)
+            index = await asyncio.to_thread(TaxonomyIndex.from_tree, tree)
+            await asyncio.to_thread(self._install, index)
+            return index
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"[DEBUG] eBay taxonomy ingestion failed: {e}")
+            raise
+
+    async def ingest_from_ebay(self) -> TaxonomyIndex:
+        """Download the marketplace's full category tree and swap in a fresh index."""
+        return await self._ingest_flight.do("ingest", self._ingest)
+
+    def ingesting(self) -> bool:
+        return self._ingest_flight.in_flight() > 0
+
+    def stats(self) -> dict:
+        index = self.index
+        return {
+            "loaded": index is not None,
+            "tree_id": index.tree_id if index else None,
+            "version": index.version if index else None,
+            "categories": len(index.ids) if index else 0,
+            "leaf_categories": index.leaf_count() if index else 0,
+            "terms": len(index.terms) if index else 0,
+            "loading": self.loading,
+            "ingesting": self.ingesting(),
+            "last_ingested_at": self.last_ingested_at,
+            "last_error": self.last_error
+        }
+
+# Global instance
+taxonomy = EbayTaxonomy()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build the local eBay category taxonomy index")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--snapshot", help="Path to a saved category_tree JSON response")
+    source.add_argument("--fetch", action="store_true", help="Download the tree from the Taxonomy API")
+    parser.add_argument("--output", default=EBAY_TAXONOMY_INDEX_PATH)
+    args = parser.parse_args()
+
+    manager = EbayTaxonomy(args.output)
+    manager.load()
+    if args.snapshot:
+        manager.load_snapshot(args.snapshot)
+    else:
+        async def _fetch():
+            try:
+                await manager.ingest_from_ebay()
+            finally:
+                await ebay_client.close()
+        asyncio.run(_fetch())
+    print(json.dumps(manager.stats(), indent=2))
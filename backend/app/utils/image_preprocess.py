@@ -0,0 +1,122 @@
+import base64
+import io
+import os
+import time
+from dataclasses import dataclass
+from typing import Optional
+from app.utils.ai_cache import perceptual_hash_image
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Without Pillow images are sent to the model unchanged
+    Image = None
+
+# Longest edge, in pixels, of images sent to vision models
+VISION_IMAGE_MAX_EDGE = int(os.getenv("VISION_IMAGE_MAX_EDGE", "1024"))
+VISION_IMAGE_JPEG_QUALITY = int(os.getenv("VISION_IMAGE_JPEG_QUALITY", "82"))
+# OpenAI image detail level: "low" (fixed small token cost), "high" or "auto"
+VISION_IMAGE_DETAIL = os.getenv("VISION_IMAGE_DETAIL", "high")
+# Assumed upstream bandwidth to OpenAI, used to estimate upload time saved
+VISION_UPLOAD_BYTES_PER_SECOND = float(os.getenv("VISION_UPLOAD_BYTES_PER_SECOND", str(5 * 1024 * 1024)))
+
+# EXIF Orientation; 1 means the pixels are already upright
+ORIENTATION_TAG = 0x0112
+
+
+@dataclass
+class PreparedImage:
+    data: bytes
+    media_type: str
+    original_size: int
+    width: Optional[int] = None
+    height: Optional[int] = None
+    phash: Optional[str] = None
+    preprocess_ms: float = 0.0
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.original_size - len(self.data)
+
+    def content_part(self) -> dict:
+        """OpenAI `image_url` message part carrying this image."""
+        encoded = base64.b64encode(self.data).decode("utf-8")
+        return {
+            "type": "image_url",
+            "image_url": {
+                "url": f"data:{self.media_type};base64,{encoded}",
+                "detail": VISION_IMAGE_DETAIL
+            }
+        }
+
+
+class ImagePreprocessor:
+    """
+    Prepares uploads for vision inference: decodes once (at reduced scale for JPEGs),
+    applies EXIF orientation, downscales to VISION_IMAGE_MAX_EDGE and re-encodes as JPEG.
+    Keeps totals of bytes and estimated upload time saved.
+    """
+
+    def __init__(self):
+        self.images = 0
+        self.original_bytes = 0
+        self.sent_bytes = 0
+        self.total_preprocess_ms = 0.0
+        self.failures = 0
+
+    def prepare(self, image_bytes: bytes) -> PreparedImage:
+        """Blocking; call through asyncio.to_thread from async code."""
+        started = time.perf_counter()
+        prepared = PreparedImage(data=image_bytes, media_type="image/jpeg", original_size=len(image_bytes))
+        if Image is not None:
+            try:
+                with Image.open(io.BytesIO(image_bytes)) as image:
+                    original_media_type = Image.MIME.get(image.format, prepared.media_type)
+                    original_width, original_height = image.size
+                    # The model ignores EXIF, so a rotated original must never be sent as is
+                    upright = image.getexif().get(ORIENTATION_TAG, 1) == 1
+                    # Let the JPEG decoder skip detail we'd throw away when downscaling
+                    image.draft("RGB", (VISION_IMAGE_MAX_EDGE, VISION_IMAGE_MAX_EDGE))
+                    image = ImageOps.exif_transpose(image).convert("RGB")
+                    image.thumbnail((VISION_IMAGE_MAX_EDGE, VISION_IMAGE_MAX_EDGE), Image.Resampling.LANCZOS)
+                    prepared.phash = perceptual_hash_image(image)
+                    buffer = io.BytesIO()
+                    image.save(buffer, format="JPEG", quality=VISION_IMAGE_JPEG_QUALITY, optimize=True)
+                    # Small upright uploads can grow when re-encoded; keep the original then
+                    if upright and buffer.tell() >= len(image_bytes):
+                        prepared.media_type = original_media_type
+                        prepared.width, prepared.height = original_width, original_height
+                    else:
+                        prepared.data = buffer.getvalue()
+                        prepared.width, prepared.height = image.size
+            except Exception as e:
+                self.failures += 1
+                print(f"[DEBUG] Image preprocessing failed, sending original: {e}")
+        prepared.preprocess_ms = (time.perf_counter() - started) * 1000
+
+        self.images += 1
+        self.original_bytes += prepared.original_size
+        self.sent_bytes += len(prepared.data)
+        self.total_preprocess_ms += prepared.preprocess_ms
+        print(f"[DEBUG] Prepared image {prepared.width}x{prepared.height}: {prepared.original_size} -> {len(prepared.data)} bytes in {prepared.preprocess_ms:.1f}ms")
+        return prepared
+
+    def metrics(self) -> dict:
+        bytes_saved = self.original_bytes - self.sent_bytes
+        # base64 inflates the request body by 4/3
+        upload_seconds_saved = bytes_saved * 4 / 3 / VISION_UPLOAD_BYTES_PER_SECOND
+        return {
+            "enabled": Image is not None,
+            "max_edge": VISION_IMAGE_MAX_EDGE,
+            "detail": VISION_IMAGE_DETAIL,
+            "images": self.images,
+            "failures": self.failures,
+            "original_bytes": self.original_bytes,
+            "sent_bytes": self.sent_bytes,
+            "bytes_saved": bytes_saved,
+            "avg_preprocess_ms": round(self.total_preprocess_ms / self.images, 2) if self.images else 0.0,
+            "est_upload_seconds_saved": round(upload_seconds_saved, 2),
+            "est_net_seconds_saved": round(upload_seconds_saved - self.total_preprocess_ms / 1000, 2)
+        }
+
+# Global instance
+image_preprocessor = ImagePreprocessor()
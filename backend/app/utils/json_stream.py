@@ -0,0 +1,98 @@
+import json
+from typing import Any, List, Optional, Tuple
+
+
+class JsonFieldStreamParser:
+    """
+    Incremental parser for a JSON object arriving in chunks (e.g. a streamed model reply).
+    `feed` returns the top-level fields that completed in that chunk, so callers can act on
+    each field as soon as its value closes. Text before the opening brace, such as a code
+    fence, is ignored.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._started = False
+        self._state = "key"  # key -> colon -> value -> after -> key ...
+        self._token_start: Optional[int] = None
+        self._key: Optional[str] = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self.done = False
+
+    def _scan_string(self, ch: str) -> bool:
+        """Advance string state by one character; True when the string just closed."""
+        if self._escape:
+            self._escape = False
+        elif ch == "\\":
+            self._escape = True
+        elif ch == '"':
+            self._in_string = False
+            return True
+        return False
+
+    def _emit(self, end: int, fields: List[Tuple[str, Any]]):
+        raw = self._buffer[self._token_start:end].strip()
+        try:
+            fields.append((self._key, json.loads(raw)))
+        except json.JSONDecodeError:
+            print(f"[DEBUG] Skipping unparseable streamed field '{self._key}': {raw[:50]}")
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        self._buffer += chunk
+        fields: List[Tuple[str, Any]] = []
+        while self._pos < len(self._buffer) and not self.done:
+            ch = self._buffer[self._pos]
+            if not self._started:
+                self._started = ch == "{"
+            elif self._state == "key":
+                if self._in_string:
+                    if self._scan_string(ch):
+                        self._key = json.loads(self._buffer[self._token_start:self._pos + 1])
+                        self._state = "colon"
+                elif ch == '"':
+                    self._in_string = True
+                    self._token_start = self._pos
+                elif ch == "}":
+                    self.done = True
+            elif self._state == "colon":
+                if ch == ":":
+                    self._state = "value"
+                    self._token_start = None
+            elif self._state == "value":
+                if self._token_start is None:
+                    if ch.isspace():
+                        self._pos += 1
+                        continue
+                    self._token_start = self._pos
+                    self._depth = 0
+                if self._in_string:
+                    if self._scan_string(ch) and self._depth == 0:
+                        self._emit(self._pos + 1, fields)
+                        self._state = "after"
+                elif ch == '"':
+                    self._in_string = True
+                elif ch in "[{":
+                    self._depth += 1
+                elif ch in "]}":
+                    if self._depth == 0:
+                        # Closing brace of the object itself, ending a number/true/false/null
+                        self._emit(self._pos, fields)
+                        self.done = True
+                    else:
+                        self._depth -= 1
+                        if self._depth == 0:
+                            self._emit(self._pos + 1, fields)
+                            self._state = "after"
+                elif ch == "," and self._depth == 0:
+                    self._emit(self._pos, fields)
+                    self._state = "key"
+            elif self._state == "after":
+                if ch == ",":
+                    self._state = "key"
+                elif ch == "}":
+                    self.done = True
+            self._pos += 1
+        return fields
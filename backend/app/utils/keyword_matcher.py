@@ -0,0 +1,64 @@
+from typing import Dict, List, Optional, Tuple
+from app.utils.text import stemmed_tokens
+
+# Key under which a trie node stores the (label, weight) pairs of phrases ending there
+_OUTPUTS = ""
+
+
+class KeywordMatcher:
+    """
+    Weighted multi-keyword matcher compiled into a trie over stemmed tokens. Matching walks
+    the text once, so cost depends on the text length and the longest phrase, not on how
+    many keywords there are, and only whole words match ("art" never matches "party").
+    """
+
+    def __init__(self):
+        self._root: Dict[str, dict] = {}
+        self._order: Dict[str, int] = {}
+        self.keyword_count = 0
+
+    def add(self, phrase: str, label: str, weight: float = 1.0):
+        tokens = stemmed_tokens(phrase)
+        if not tokens:
+            return
+        self._order.setdefault(label, len(self._order))
+        node = self._root
+        for token in tokens:
+            node = node.setdefault(token, {})
+        node.setdefault(_OUTPUTS, []).append((label, weight))
+        self.keyword_count += 1
+
+    def scores(self, text: str) -> Dict[str, float]:
+        """Total weight per label, counting each distinct keyword once."""
+        tokens = stemmed_tokens(text)
+        matched = set()
+        scores: Dict[str, float] = {}
+        for start in range(len(tokens)):
+            node = self._root
+            for position in range(start, len(tokens)):
+                node = node.get(tokens[position])
+                if node is None:
+                    break
+                for label, weight in node.get(_OUTPUTS, ()):
+                    key = (label, tuple(tokens[start:position + 1]))
+                    if key not in matched:
+                        matched.add(key)
+                        scores[label] = scores.get(label, 0.0) + weight
+        return scores
+
+    def best(self, text: str) -> Optional[Tuple[str, float]]:
+        """Highest scoring label; ties go to the label added first."""
+        scores = self.scores(text)
+        if not scores:
+            return None
+        label = max(scores, key=lambda l: (scores[l], -self._order[l]))
+        return label, scores[label]
+
+    @classmethod
+    def from_rules(cls, rules: List[dict]) -> "KeywordMatcher":
+        """Compile rules of the form {"name": ..., "keywords": {phrase: weight}}."""
+        matcher = cls()
+        for rule in rules:
+            for phrase, weight in rule.get("keywords", {}).items():
+                matcher.add(phrase, rule["name"], float(weight))
+        return matcher
@@ -0,0 +1,315 @@
+import json
+import os
+import threading
+import time
+import zlib
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from sqlmodel import select
+from app.db import get_session
+from app.models.ai_cache_db import ImageDigest
+from app.models.listing_db import Listing as DBListing
+from app.utils.ai_cache import image_digests
+from app.utils.text import stemmed_tokens
+
+LISTING_INDEX_DIR = os.getenv("LISTING_INDEX_DIR", "listing_index")
+# Hashed text dimensions; each listing takes (text + 64 image) float16 values on disk
+LISTING_EMBEDDING_TEXT_DIM = int(os.getenv("LISTING_EMBEDDING_TEXT_DIM", "256"))
+# Share of the embedding given to the first image's perceptual hash, when there is one
+LISTING_EMBEDDING_IMAGE_WEIGHT = float(os.getenv("LISTING_EMBEDDING_IMAGE_WEIGHT", "0.3"))
+# Below this many listings brute force is fast enough; above it, search an IVF partition
+LISTING_INDEX_IVF_MIN_ROWS = int(os.getenv("LISTING_INDEX_IVF_MIN_ROWS", "50000"))
+LISTING_INDEX_IVF_NPROBE = int(os.getenv("LISTING_INDEX_IVF_NPROBE", "8"))
+# Cosine similarity at or above which two listings are reported as likely duplicates
+LISTING_DUPLICATE_THRESHOLD = float(os.getenv("LISTING_DUPLICATE_THRESHOLD", "0.92"))
+
+PHASH_BITS = 64
+LISTING_EMBEDDING_DIM = LISTING_EMBEDDING_TEXT_DIM + PHASH_BITS
+ID_BYTES = 36  # uuid4 string
+# Rows scored per step in brute-force search, to bound the float32 working set
+SEARCH_CHUNK_ROWS = 65536
+
+# Title words say more about what the item is than description words
+TITLE_WEIGHT = 2.0
+
+
+def embed_listing(title: str, description: str = "", tags: str = "", phash: Optional[str] = None) -> np.ndarray:
+    """
+    Unit-length embedding of a listing: signed feature hashing of stemmed title, tag and
+    description unigrams and bigrams, plus the first image's 64-bit perceptual hash as +-1 values.
+    """
+    counts: Dict[Tuple[int, int], float] = {}
+    for text, weight in ((title, TITLE_WEIGHT), (tags.replace(",", " "), 1.0), (description, 1.0)):
+        tokens = stemmed_tokens(text)
+        for feature in tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]:
+            # crc32 rather than hash(): vectors must be stable across processes
+            hashed = zlib.crc32(feature.encode("utf-8"))
+            key = (hashed % LISTING_EMBEDDING_TEXT_DIM, 1 if hashed & 0x80000000 else -1)
+            counts[key] = counts.get(key, 0.0) + weight
+
+    vector = np.zeros(LISTING_EMBEDDING_DIM, dtype=np.float32)
+    for (index, sign), count in counts.items():
+        vector[index] += sign * (1.0 + np.log(count))
+    norm = np.linalg.norm(vector[:LISTING_EMBEDDING_TEXT_DIM])
+    if norm > 0:
+        vector[:LISTING_EMBEDDING_TEXT_DIM] /= norm
+
+    if phash:
+        bits = np.array([(int(phash, 16) >> i) & 1 for i in range(PHASH_BITS)], dtype=np.float32)
+        vector[:LISTING_EMBEDDING_TEXT_DIM] *= np.sqrt(1.0 - LISTING_EMBEDDING_IMAGE_WEIGHT)
+        vector[LISTING_EMBEDDING_TEXT_DIM:] = (bits * 2 - 1) / np.sqrt(PHASH_BITS) * np.sqrt(LISTING_EMBEDDING_IMAGE_WEIGHT)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+class IvfPartition:
+    """Inverted-file partition: rows grouped by nearest k-means centroid, searched a few lists at a time."""
+
+    def __init__(self, centroids: np.ndarray, lists: List[List[int]]):
+        self.centroids = centroids
+        self.lists = lists
+
+    @classmethod
+    def train(cls, vectors: np.ndarray, positions: np.ndarray, iterations: int = 10, seed: int = 0) -> "IvfPartition":
+        rng = np.random.default_rng(seed)
+        n_lists = max(1, int(np.sqrt(len(positions))))
+        sample = vectors[rng.choice(positions, size=min(len(positions), n_lists * 64), replace=False)].astype(np.float32)
+        centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)]
+        # Spherical k-means: vectors are unit length, so assign by dot product
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            for list_id in range(n_lists):
+                members = sample[assignment == list_id]
+                if len(members):
+                    centroid = members.sum(axis=0)
+                    centroids[list_id] = centroid / max(np.linalg.norm(centroid), 1e-12)
+
+        lists: List[List[int]] = [[] for _ in range(n_lists)]
+        for start in range(0, len(positions), SEARCH_CHUNK_ROWS):
+            chunk = positions[start:start + SEARCH_CHUNK_ROWS]
+            for position, list_id in zip(chunk, np.argmax(vectors[chunk].astype(np.float32) @ centroids.T, axis=1)):
+                lists[list_id].append(int(position))
+        return cls(centroids, lists)
+
+    def add(self, position: int, vector: np.ndarray):
+        self.lists[int(np.argmax(self.centroids @ vector))].append(position)
+
+    def candidates(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        probe = np.argsort(self.centroids @ query)[::-1][:nprobe]
+        return np.array(sorted(set().union(*(self.lists[list_id] for list_id in probe))), dtype=np.int64)
+
+
+class ListingVectorIndex:
+    """
+    Listing embeddings in a float16 matrix memory-mapped from LISTING_INDEX_DIR, with the
+    listing ids in a parallel fixed-width memmap. Rows are appended (doubling the files when
+    full) and deleted rows are blanked. Search is a vectorized brute-force top-k, or an IVF
+    probe once the index reaches LISTING_INDEX_IVF_MIN_ROWS.
+    """
+
+    def __init__(self, directory: str = LISTING_INDEX_DIR):
+        self.directory = directory
+        self.vectors: Optional[np.memmap] = None
+        self.ids: Optional[np.memmap] = None
+        self.count = 0
+        self.positions: Dict[str, int] = {}
+        self.ivf: Optional[IvfPartition] = None
+        self.built_at: Optional[float] = None
+        self.rebuilding = False
+        self.last_error: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _open(self, capacity: int, mode: str, directory: Optional[str] = None):
+        directory = directory or self.directory
+        vectors = np.memmap(os.path.join(directory, "vectors.f16"), dtype=np.float16, mode=mode, shape=(capacity, LISTING_EMBEDDING_DIM))
+        ids = np.memmap(os.path.join(directory, "ids.bin"), dtype=f"S{ID_BYTES}", mode=mode, shape=(capacity,))
+        return vectors, ids
+
+    def _save_meta(self):
+        with open(self._path("meta.json"), "w") as f:
+            json.dump({"dim": LISTING_EMBEDDING_DIM, "count": self.count, "capacity": len(self.ids)}, f)
+
+    def load(self) -> bool:
+        """Open the on-disk index; False when it is missing or was built with other settings."""
+        try:
+            with open(self._path("meta.json")) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if meta.get("dim") != LISTING_EMBEDDING_DIM:
+            print(f"[DEBUG] Listing index has dim {meta.get('dim')}, expected {LISTING_EMBEDDING_DIM}; needs a rebuild")
+            return False
+        vectors, ids = self._open(meta["capacity"], "r+")
+        with self._lock:
+            self.vectors, self.ids, self.count = vectors, ids, meta["count"]
+            self.positions = {
+                listing_id.decode("ascii"): position
+                for position, listing_id in enumerate(ids[:self.count]) if listing_id
+            }
+            self._build_ivf()
+            self.built_at = time.monotonic()
+        print(f"[DEBUG] Loaded listing index with {len(self.positions)} listings")
+        return True
+
+    def _build_ivf(self):
+        positions = np.array(sorted(self.positions.values()), dtype=np.int64)
+        self.ivf = IvfPartition.train(self.vectors, positions) if len(positions) >= LISTING_INDEX_IVF_MIN_ROWS else None
+
+    def build(self, rows: Sequence[Tuple[str, np.ndarray]]):
+        """Write a fresh index of (listing_id, embedding) rows and swap it in."""
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_directory = self.directory.rstrip("/") + ".tmp"
+        os.makedirs(tmp_directory, exist_ok=True)
+        capacity = max(1024, 1 << max(0, len(rows) - 1).bit_length())
+        vectors, ids = self._open(capacity, "w+", tmp_directory)
+        for position, (listing_id, vector) in enumerate(rows):
+            vectors[position] = vector
+            ids[position] = listing_id.encode("ascii")
+        vectors.flush()
+        ids.flush()
+        del vectors, ids
+
+        with self._lock:
+            self.vectors = self.ids = None
+            for name in ("vectors.f16", "ids.bin"):
+                os.replace(os.path.join(tmp_directory, name), self._path(name))
+            self.vectors, self.ids = self._open(capacity, "r+")
+            self.count = len(rows)
+            self.positions = {listing_id: position for position, (listing_id, _) in enumerate(rows)}
+            self._save_meta()
+            self._build_ivf()
+            self.built_at = time.monotonic()
+        os.rmdir(tmp_directory)
+        print(f"[DEBUG] Built listing index with {self.count} listings")
+
+    def _grow(self):
+        capacity = len(self.ids) * 2
+        self.vectors.flush()
+        self.ids.flush()
+        # Searches still holding the old maps keep reading valid rows; the files only grow
+        for name, row_bytes in (("vectors.f16", LISTING_EMBEDDING_DIM * 2), ("ids.bin", ID_BYTES)):
+            with open(self._path(name), "r+b") as f:
+                f.truncate(capacity * row_bytes)
+        self.vectors, self.ids = self._open(capacity, "r+")
+        self._save_meta()
+
+    def add(self, listing_id: str, vector: np.ndarray):
+        """Insert or replace the embedding for `listing_id`."""
+        with self._lock:
+            if self.ids is None:
+                return
+            position = self.positions.get(listing_id)
+            if position is None:
+                if self.count == len(self.ids):
+                    self._grow()
+                position = self.count
+                self.count += 1
+                self.ids[position] = listing_id.encode("ascii")
+                self.positions[listing_id] = position
+                if self.ivf is not None:
+                    self.ivf.add(position, vector)
+            self.vectors[position] = vector
+            self._save_meta()
+
+    def remove(self, listing_id: str):
+        with self._lock:
+            position = self.positions.pop(listing_id, None)
+            if position is None:
+                return
+            self.ids[position] = b""
+            self.vectors[position] = 0
+
+    def vector(self, listing_id: str) -> Optional[np.ndarray]:
+        position = self.positions.get(listing_id)
+        return None if position is None else np.asarray(self.vectors[position], dtype=np.float32)
+
+    def search(self, query: np.ndarray, k: int = 10, exclude: Sequence[str] = (),
+               only: Optional[Sequence[str]] = None) -> List[Tuple[str, float]]:
+        """
+        The `k` most similar listings to `query` as (listing_id, cosine similarity), best first.
+        With `only`, just those listings are scored (exactly, never through the IVF probe).
+        """
+        # A concurrent add, grow or rebuild swaps these; keep searching the ones we started with
+        vectors, ids, count, ivf, positions = self.vectors, self.ids, self.count, self.ivf, self.positions
+        if vectors is None or not count:
+            return []
+        query = query.astype(np.float32)
+        wanted = k + len(exclude)
+        if only is not None:
+            candidates = np.array(sorted(
+                position for position in (positions.get(listing_id) for listing_id in only)
+                if position is not None and position < count
+            ), dtype=np.int64)
+            if not len(candidates):
+                return []
+            scores = np.concatenate([
+                vectors[candidates[start:start + SEARCH_CHUNK_ROWS]].astype(np.float32) @ query
+                for start in range(0, len(candidates), SEARCH_CHUNK_ROWS)
+            ])
+        elif ivf is not None:
+            candidates = ivf.candidates(query, LISTING_INDEX_IVF_NPROBE)
+            if not len(candidates):
+                return []
+            scores = vectors[candidates].astype(np.float32) @ query
+        else:
+            candidates = None
+            scores = np.concatenate([
+                vectors[start:min(start + SEARCH_CHUNK_ROWS, count)].astype(np.float32) @ query
+                for start in range(0, count, SEARCH_CHUNK_ROWS)
+            ])
+        top = np.argpartition(-scores, wanted - 1)[:wanted] if len(scores) > wanted else np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+
+        results = []
+        for row in top:
+            position = int(candidates[row]) if candidates is not None else int(row)
+            listing_id = ids[position].decode("ascii")
+            if listing_id and listing_id not in exclude:
+                results.append((listing_id, round(float(scores[row]), 4)))
+        return results[:k]
+
+    def rebuild(self):
+        """Re-embed every listing in the database (blocking; run it in a thread)."""
+        if self.rebuilding:
+            return
+        self.rebuilding = True
+        try:
+            with get_session() as session:
+                rows = session.exec(
+                    select(DBListing.id, DBListing.title, DBListing.description, DBListing.tags, DBListing.image_filenames)
+                ).all()
+                phashes = dict(session.exec(select(ImageDigest.filename, ImageDigest.phash)).all())
+            self.build([
+                (listing_id, embed_listing(title, description, tags or "", phashes.get((image_filenames or "").split(",")[0])))
+                for listing_id, title, description, tags, image_filenames in rows
+            ])
+            self.last_error = None
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"[DEBUG] Listing index rebuild failed: {e}")
+            raise
+        finally:
+            self.rebuilding = False
+
+    def stats(self) -> dict:
+        return {
+            "listings": len(self.positions),
+            "rows": self.count,
+            "capacity": len(self.ids) if self.ids is not None else 0,
+            "dim": LISTING_EMBEDDING_DIM,
+            "ivf_lists": len(self.ivf.lists) if self.ivf else None,
+            "index_age_seconds": round(time.monotonic() - self.built_at, 1) if self.built_at else None,
+            "rebuilding": self.rebuilding,
+            "last_error": self.last_error
+        }
+
+def listing_embedding(title: str, description: str, tags: Sequence[str], image_filenames: Sequence[str]) -> np.ndarray:
+    """Embedding of a listing as submitted, using the first image's recorded perceptual hash."""
+    digest = image_digests.get(image_filenames[0]) if image_filenames else None
+    return embed_listing(title, description, ",".join(tags), digest[1] if digest else None)
+
+# Global instance
+listing_index = ListingVectorIndex()
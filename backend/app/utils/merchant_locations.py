@@ -0,0 +1,122 @@
+import os
+import uuid
+from typing import Awaitable, Callable, Optional, Tuple
+from sqlmodel import select
+from app.db import get_session
+from app.models.ebay_oauth_db import EbayMerchantLocation
+from app.utils.single_flight import SingleFlight
+from app.utils.ttl_cache import TTLCache
+
+MERCHANT_LOCATION_CACHE_SIZE = int(os.getenv("MERCHANT_LOCATION_CACHE_SIZE", "10000"))
+MERCHANT_LOCATION_CACHE_TTL = float(os.getenv("MERCHANT_LOCATION_CACHE_TTL", "86400"))
+
+LocationKey = Tuple[str, str, str, str]
+
+
+class MerchantLocationCache:
+    """
+    Resolved eBay merchant location keys per (user, city, postal code, state).
+    Lookups go memory -> `ebaymerchantlocation` table -> eBay, and concurrent misses
+    for the same key share a single eBay lookup/create.
+    """
+
+    def __init__(self):
+        self._cache = TTLCache(maxsize=MERCHANT_LOCATION_CACHE_SIZE, ttl=MERCHANT_LOCATION_CACHE_TTL)
+        self._single_flight = SingleFlight()
+
+    @staticmethod
+    def make_key(user: str, city: Optional[str] = None, postal_code: Optional[str] = None, state: Optional[str] = None) -> LocationKey:
+        return (
+            user,
+            (city or "").strip().lower(),
+            (postal_code or "").strip().upper(),
+            (state or "").strip().upper()
+        )
+
+    async def resolve(
+        self,
+        user: str,
+        city: Optional[str],
+        postal_code: Optional[str],
+        state: Optional[str],
+        get_or_create: Callable[[], Awaitable[Optional[str]]]
+    ) -> Optional[str]:
+        """
+        Return the cached merchant location key, falling back to `get_or_create`
+        (the eBay lookup/creation) only on a full miss.
+        """
+        key = self.make_key(user, city, postal_code, state)
+        location_key = self._cache.get(key)
+        if location_key:
+            return location_key
+        return await self._single_flight.do(key, lambda: self._load_or_create(key, get_or_create))
+
+    async def _load_or_create(self, key: LocationKey, get_or_create: Callable[[], Awaitable[Optional[str]]]) -> Optional[str]:
+        location_key = self._load(key)
+        if not location_key:
+            location_key = await get_or_create()
+            if location_key:
+                self._store(key, location_key)
+        if location_key:
+            self._cache.set(key, location_key)
+        return location_key
+
+    def _load(self, key: LocationKey) -> Optional[str]:
+        user, city, postal_code, state = key
+        with get_session() as session:
+            record = session.exec(
+                select(EbayMerchantLocation).where(
+                    EbayMerchantLocation.user_id == user,
+                    EbayMerchantLocation.city == city,
+                    EbayMerchantLocation.postal_code == postal_code,
+                    EbayMerchantLocation.state == state
+                )
+            ).first()
+            return record.merchant_location_key if record else None
+
+    def _store(self, key: LocationKey, location_key: str):
+        user, city, postal_code, state = key
+        with get_session() as session:
+            session.add(EbayMerchantLocation(
+                id=str(uuid.uuid4()),
+                user_id=user,
+                city=city,
+                postal_code=postal_code,
+                state=state,
+                merchant_location_key=location_key
+            ))
+            session.commit()
+        print(f"[DEBUG] Cached merchant location {location_key} for {key}")
+
+    def invalidate(self, user: str, city: Optional[str] = None, postal_code: Optional[str] = None, state: Optional[str] = None):
+        """Forget one resolved location, e.g. after eBay rejects its key."""
+        key = self.make_key(user, city, postal_code, state)
+        self._cache.invalidate(key)
+        user, city, postal_code, state = key
+        with get_session() as session:
+            records = session.exec(
+                select(EbayMerchantLocation).where(
+                    EbayMerchantLocation.user_id == user,
+                    EbayMerchantLocation.city == city,
+                    EbayMerchantLocation.postal_code == postal_code,
+                    EbayMerchantLocation.state == state
+                )
+            ).all()
+            for record in records:
+                session.delete(record)
+            session.commit()
+
+    def invalidate_user(self, user: str):
+        """Forget every location for a user, e.g. when their eBay account is (re)connected or disconnected."""
+        self._cache.invalidate_where(lambda key: key[0] == user)
+        with get_session() as session:
+            records = session.exec(select(EbayMerchantLocation).where(EbayMerchantLocation.user_id == user)).all()
+            for record in records:
+                session.delete(record)
+            session.commit()
+
+    def stats(self) -> dict:
+        return dict(self._cache.stats(), in_flight=self._single_flight.in_flight())
+
+# Global instance
+merchant_location_cache = MerchantLocationCache()
@@ -0,0 +1,180 @@
+import asyncio
+import math
+import os
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from sqlmodel import select
+from app.db import get_session
+from app.models.listing_db import Listing as DBListing
+from app.utils.single_flight import SingleFlight
+from app.utils.text import stemmed_tokens
+
+# Rebuild the comparables index from the listing table at most this often (seconds)
+PRICING_INDEX_TTL = float(os.getenv("PRICING_INDEX_TTL", "600"))
+# Fewer comparables than this (or lower confidence) falls back to the LLM
+PRICING_MIN_COMPARABLES = int(os.getenv("PRICING_MIN_COMPARABLES", "5"))
+PRICING_MIN_CONFIDENCE = float(os.getenv("PRICING_MIN_CONFIDENCE", "0.3"))
+# Minimum IDF-weighted title overlap for a listing to count as a comparable
+PRICING_MIN_SIMILARITY = float(os.getenv("PRICING_MIN_SIMILARITY", "0.35"))
+PRICING_MAX_COMPARABLES = int(os.getenv("PRICING_MAX_COMPARABLES", "50"))
+# Similarity bonus for comparables in the same category as the query
+CATEGORY_MATCH_BONUS = 0.15
+
+
+@dataclass
+class PriceEstimate:
+    price: float
+    low: float
+    high: float
+    confidence: float
+    comparables: int
+    source: str = "comparables"
+    sample: List[Dict] = field(default_factory=list)
+
+
+def weighted_quantile(values: List[float], weights: List[float], q: float) -> float:
+    """Quantile `q` of `values` where each value counts with its weight."""
+    pairs = sorted(zip(values, weights))
+    total = sum(weights)
+    cumulative = 0.0
+    for value, weight in pairs:
+        cumulative += weight
+        if cumulative >= q * total:
+            return value
+    return pairs[-1][0]
+
+
+class ComparablesIndex:
+    """Listing prices with an inverted index from stemmed title tokens to listing positions."""
+
+    def __init__(self, rows: List[Tuple[str, str, float]]):
+        self.titles: List[str] = []
+        self.categories: List[str] = []
+        self.prices: List[float] = []
+        self.tokens: List[frozenset] = []
+        self.postings: Dict[str, List[int]] = defaultdict(list)
+        for title, category, price in rows:
+            tokens = frozenset(stemmed_tokens(title))
+            if not tokens or not price or price <= 0:
+                continue
+            position = len(self.prices)
+            self.titles.append(title)
+            self.categories.append((category or "").strip().lower())
+            self.prices.append(float(price))
+            self.tokens.append(tokens)
+            for token in tokens:
+                self.postings[token].append(position)
+        count = max(1, len(self.prices))
+        self.idf = {token: math.log(1 + count / len(positions)) for token, positions in self.postings.items()}
+        self.built_at = time.monotonic()
+
+    def comparables(self, title: str, category: Optional[str] = None) -> List[Tuple[int, float]]:
+        """(position, similarity) of the most similar listings, best first."""
+        query = frozenset(stemmed_tokens(title))
+        if not query:
+            return []
+        candidates = set()
+        for token in query:
+            candidates.update(self.postings.get(token, ()))
+        category = (category or "").strip().lower()
+
+        # Tokens never seen in any listing still count against the match (at the highest IDF)
+        default_idf = math.log(1 + max(1, len(self.prices)))
+
+        def weight(token: str) -> float:
+            return self.idf.get(token, default_idf)
+
+        scored = []
+        for position in candidates:
+            tokens = self.tokens[position]
+            shared = sum(weight(token) for token in query & tokens)
+            union = sum(weight(token) for token in query | tokens)
+            similarity = shared / union if union else 0.0
+            if category and self.categories[position] == category:
+                similarity = min(1.0, similarity + CATEGORY_MATCH_BONUS)
+            if similarity >= PRICING_MIN_SIMILARITY:
+                scored.append((position, similarity))
+        scored.sort(key=lambda item: item[1], reverse=True)
+        return scored[:PRICING_MAX_COMPARABLES]
+
+    def estimate(self, title: str, category: Optional[str] = None) -> Optional[PriceEstimate]:
+        scored = self.comparables(title, category)
+        if not scored:
+            return None
+        prices = [self.prices[position] for position, _ in scored]
+        weights = [similarity for _, similarity in scored]
+        median = weighted_quantile(prices, weights, 0.5)
+        low = weighted_quantile(prices, weights, 0.25)
+        high = weighted_quantile(prices, weights, 0.75)
+
+        # More, closer and more consistent comparables mean a more trustworthy estimate
+        count_factor = 1.0 - math.exp(-len(scored) / PRICING_MIN_COMPARABLES)
+        spread_factor = max(0.0, 1.0 - (high - low) / median) if median > 0 else 0.0
+        similarity_factor = sum(weights) / len(weights)
+        confidence = count_factor * (0.5 + 0.5 * spread_factor) * similarity_factor
+
+        return PriceEstimate(
+            price=round(median, 2),
+            low=round(low, 2),
+            high=round(high, 2),
+            confidence=round(confidence, 3),
+            comparables=len(scored),
+            sample=[
+                {"title": self.titles[position], "price": self.prices[position], "similarity": round(similarity, 3)}
+                for position, similarity in scored[:5]
+            ]
+        )
+
+
+def _load_rows() -> List[Tuple[str, str, float]]:
+    with get_session() as session:
+        return session.exec(select(DBListing.title, DBListing.category, DBListing.price)).all()
+
+
+class PriceEngine:
+    """
+    Estimates prices from comparable historical listings. The index is rebuilt from the
+    listing table in a worker thread when older than PRICING_INDEX_TTL; requests keep using
+    the previous index while a rebuild runs.
+    """
+
+    def __init__(self):
+        self._index: Optional[ComparablesIndex] = None
+        self._build_flight = SingleFlight()
+        self.rebuilds = 0
+
+    async def _build(self) -> ComparablesIndex:
+        rows = await asyncio.to_thread(_load_rows)
+        self._index = await asyncio.to_thread(ComparablesIndex, rows)
+        self.rebuilds += 1
+        print(f"[DEBUG] Built pricing index over {len(self._index.prices)} listings")
+        return self._index
+
+    async def index(self) -> ComparablesIndex:
+        if self._index is None:
+            return await self._build_flight.do("build", self._build)
+        if time.monotonic() - self._index.built_at > PRICING_INDEX_TTL and not self._build_flight.in_flight():
+            task = asyncio.create_task(self._build_flight.do("build", self._build))
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return self._index
+
+    async def estimate(self, title: str, category: Optional[str] = None) -> Optional[PriceEstimate]:
+        """Comparable-based estimate, or None when there isn't enough evidence to trust one."""
+        index = await self.index()
+        estimate = index.estimate(title, category)
+        if not estimate or estimate.comparables < PRICING_MIN_COMPARABLES or estimate.confidence < PRICING_MIN_CONFIDENCE:
+            return None
+        return estimate
+
+    def stats(self) -> dict:
+        return {
+            "indexed_listings": len(self._index.prices) if self._index else 0,
+            "terms": len(self._index.postings) if self._index else 0,
+            "index_age_seconds": round(time.monotonic() - self._index.built_at, 1) if self._index else None,
+            "rebuilds": self.rebuilds
+        }
+
+# Global instance
+price_engine = PriceEngine()
@@ -1,18 +1,55 @@
+import asyncio
 import boto3
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from botocore.config import Config
 from botocore.exceptions import ClientError
 from fastapi import HTTPException
 
 # S3 configuration
 BUCKET_NAME = "flashlist-images"
-REGION = "us-east-2" 
+REGION = "us-east-2"
+# Pooled HTTPS connections to S3; blocking S3 calls run on as many threads
+S3_MAX_POOL_CONNECTIONS = int(os.getenv("S3_MAX_POOL_CONNECTIONS", "32"))
+S3_MAX_ATTEMPTS = int(os.getenv("S3_MAX_ATTEMPTS", "5"))
+S3_CONNECT_TIMEOUT = float(os.getenv("S3_CONNECT_TIMEOUT", "5"))
+S3_READ_TIMEOUT = float(os.getenv("S3_READ_TIMEOUT", "30"))
+
+_s3_client = None
+_s3_client_lock = threading.Lock()
+_s3_executor = ThreadPoolExecutor(max_workers=S3_MAX_POOL_CONNECTIONS, thread_name_prefix="s3")
 
 def get_s3_client():
-    """Get S3 client with credentials from environment variables"""
-    return boto3.client(
-        's3',
-        region_name=REGION
-    )
+    """
+    Shared S3 client with credentials from environment variables. Created once per process
+    (clients are thread-safe once built) so calls reuse pooled, kept-alive TLS connections.
+    """
+    global _s3_client
+    if _s3_client is None:
+        with _s3_client_lock:
+            if _s3_client is None:
+                # Building clients from the default session isn't thread-safe; use our own
+                _s3_client = boto3.session.Session().client(
+                    's3',
+                    region_name=REGION,
+                    config=Config(
+                        max_pool_connections=S3_MAX_POOL_CONNECTIONS,
+                        retries={"max_attempts": S3_MAX_ATTEMPTS, "mode": "adaptive"},
+                        tcp_keepalive=True,
+                        connect_timeout=S3_CONNECT_TIMEOUT,
+                        read_timeout=S3_READ_TIMEOUT
+                    )
+                )
+    return _s3_client
+
+async def run_in_s3_pool(fn, *args, **kwargs):
+    """Run a blocking S3 helper on the bounded S3 thread pool instead of the event loop."""
+    return await asyncio.get_running_loop().run_in_executor(_s3_executor, partial(fn, *args, **kwargs))
+
+def shutdown_s3_pool():
+    _s3_executor.shutdown(wait=False, cancel_futures=True)
 
 def upload_file_to_s3(file_data: bytes, file_name: str) -> str:
     """
@@ -24,9 +61,9 @@ def upload_file_to_s3(file_data: bytes, file_name: str) -> str:
             Bucket=BUCKET_NAME,
             Key=file_name,
             Body=file_data,
-            ContentType='image/jpeg' 
+            ContentType='image/jpeg'
         )
-        
+
         url = f"https://{BUCKET_NAME}.s3.{REGION}.amazonaws.com/{file_name}"
         return url
     except ClientError as e:
@@ -43,4 +80,4 @@ def delete_file_from_s3(file_name: str):
             Key=file_name
         )
     except ClientError as e:
-        raise HTTPException(status_code=500, detail=f"Failed to delete file from S3: {str(e)}") 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Failed to delete file from S3: {str(e)}")
\ No newline at end of file
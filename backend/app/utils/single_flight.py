@@ -0,0 +1,49 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class LeaderCancelled(Exception):
+    """Set on a flight's future when the caller running it is cancelled."""
+
+
+class SingleFlight:
+    """
+    Collapse concurrent calls for the same key into one in-flight coroutine.
+    Callers that arrive while a call is running await its result instead of starting their own.
+    """
+
+    def __init__(self):
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        while True:
+            future = self._in_flight.get(key)
+            if future is None:
+                break
+            try:
+                return await asyncio.shield(future)
+            except LeaderCancelled:
+                # The caller running `fn` went away; the first waiter back here runs it instead
+                continue
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            result = await fn()
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            # Don't cancel the waiters along with us: they retry, and one takes over the call
+            future.set_exception(LeaderCancelled())
+            future.exception()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else was waiting on it
+            future.exception()
+            raise
+        finally:
+            del self._in_flight[key]
+
+    def in_flight(self) -> int:
+        return len(self._in_flight)
@@ -0,0 +1,44 @@
+import re
+from typing import List
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Words that carry no signal for categorisation or matching listing titles
+STOPWORDS = frozenset("""
+a an and are as at be brand by for from in includes including is it its new of on or
+the this to used very w with without great good excellent condition lot set item items
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase `text` and split it into alphanumeric tokens."""
+    return _TOKEN_RE.findall((text or "").lower())
+
+
+def content_tokens(text: str) -> List[str]:
+    """Tokens of `text` with stopwords removed, in their original order."""
+    return [token for token in tokenize(text) if token not in STOPWORDS]
+
+
+def stem(token: str) -> str:
+    """Very small plural stemmer: "plants" -> "plant", "boxes" -> "box", "glass" stays."""
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 4 and token.endswith(("ches", "shes", "xes", "sses")):
+        return token[:-2]
+    if len(token) > 3 and token.endswith("s") and not token.endswith(("ss", "us", "is")):
+        return token[:-1]
+    return token
+
+
+def stemmed_tokens(text: str) -> List[str]:
+    """Stemmed content tokens, for matching free text against category names and rules."""
+    return [stem(token) for token in content_tokens(text)]
+
+
+def normalize_title(text: str) -> str:
+    """
+    Canonical form of a listing title used as a cache key: lowercased, stopwords removed,
+    de-duplicated and sorted, so "Monstera Plant in Pot" and "pot plant, monstera" match.
+    """
+    return " ".join(sorted(set(content_tokens(text))))